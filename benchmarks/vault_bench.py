@@ -0,0 +1,384 @@
+"""Benchmarks for the password manager's hot paths on synthetic vaults.
+
+Generates vaults of 1k, 10k, 100k and 1M entries (cached between runs),
+times key derivation, list loading, search and quick switch per keystroke,
+inserts, decrypts, re-encryption and sync, writes the results as JSON and
+compares them with a stored baseline.
+
+    python benchmarks/vault_bench.py                      # all sizes, compare with baseline.json
+    python benchmarks/vault_bench.py --sizes 1k,10k       # quick run
+    python benchmarks/vault_bench.py --save-baseline      # record this machine's numbers
+
+Exits with status 1 when a metric regresses by more than --threshold or
+falls below its floor in FLOORS.
+"""
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, os.pardir, "password-manager.py")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), "password-manager-bench")
+
+SIZES = {"1k": 1000, "10k": 10000, "100k": 100000, "1m": 1000000}
+
+# Fixed inputs so every run measures the same work
+SEED = 20240601
+MASTER_PASSWORD = "Benchmark-Passw0rd"
+SEARCH_TERM = "github dev"
+QUICK_SWITCH_TERM = "gthub admn"
+SINGLE_INSERTS = 200
+BULK_INSERTS = 10000
+VIEW_SAMPLES = 500
+SYNC_CHANGES = 100
+PAGE_ROWS = 40
+
+# Absolute minimums, checked with or without a baseline. Batched imports reach about
+# 4000 entries/s on a single core; writing entries one at a time managed about 2400.
+FLOORS = {
+    "insert.bulk_throughput": 3000,
+}
+
+WORDS = ("github", "gitlab", "google", "amazon", "bank", "mail", "cloud", "shop", "news", "forum",
+         "travel", "music", "video", "photo", "health", "school", "work", "dev", "admin", "social")
+
+
+def load_app():
+    """Import password-manager.py as a module; its file name is not importable directly"""
+    spec = importlib.util.spec_from_file_location("password_manager", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # Worker processes unpickle functions by module name
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    # The app imports cryptography lazily; the benchmarks use it directly
+    module.load_crypto()
+    return module
+
+
+def synthetic_records(count, seed=SEED):
+    """Yield count unique (service, email, password) records, the same every run"""
+    rng = random.Random(seed)
+    for i in range(count):
+        service = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}"
+        email = f"user{rng.randrange(count)}@{rng.choice(WORDS)}.example"
+        password = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789!#$%") for _ in range(16))
+        yield service, email, password
+
+
+def vault_key(seed=SEED):
+    """Deterministic vault key for the synthetic vaults"""
+    return base64.urlsafe_b64encode(random.Random(seed).randbytes(32))
+
+
+def summarize(samples, unit="ms", better="lower"):
+    """Reduce raw timings (seconds) to median/p95/max in milliseconds"""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {"unit": unit, "better": better, "value": statistics.median(ordered) * 1000,
+            "p95": p95 * 1000, "max": ordered[-1] * 1000, "samples": len(ordered)}
+
+
+def throughput(count, seconds):
+    return {"unit": "entries/s", "better": "higher", "value": count / seconds if seconds else float("inf"),
+            "samples": count}
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def build_vault(app, work_dir, label, count):
+    """Create (or reuse) the synthetic vault database for one size"""
+    path = os.path.join(work_dir, f"vault-{label}.db")
+    if os.path.exists(path):
+        return path
+    print(f"  generating {count} entries...", flush=True)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = app.open_database(tmp_path)
+    try:
+        app.BulkImporter(conn, vault_key()).run(synthetic_records(count))
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def bench_derive_key(app, repeat):
+    """Unlock latency with the calibrated parameters and the legacy PBKDF2 setting"""
+    results = {}
+    salt = os.urandom(16)
+    params = app.calibrate_kdf()
+    results[f"derive_key.{params['name']}"] = summarize(
+        [timed(app.derive_key_bytes, MASTER_PASSWORD, salt, params)[0] for _ in range(repeat)])
+    results["derive_key.legacy_pbkdf2"] = summarize(
+        [timed(app.derive_key_bytes, MASTER_PASSWORD, salt, app.LEGACY_KDF_PARAMS)[0] for _ in range(repeat)])
+    return results
+
+
+def bench_load(app, conn, count, repeat):
+    """First page of the list view, plus a jump to the middle (dragging the scrollbar)"""
+    cipher = app.VaultCipher(vault_key())
+
+    def first_page():
+        source = app.TableRowSource(conn, cipher)
+        return source.count(), source.fetch(0, PAGE_ROWS)
+
+    def jump():
+        return app.TableRowSource(conn, cipher).fetch(count // 2, PAGE_ROWS)
+
+    return {
+        "load_passwords": summarize([timed(first_page)[0] for _ in range(repeat)]),
+        "scroll_jump": summarize([timed(jump)[0] for _ in range(repeat)]),
+    }
+
+
+def bench_filter(app, conn, repeat):
+    """Search latency for each keystroke of typing SEARCH_TERM, with no result cache"""
+    index = app.SearchIndex(conn, app.VaultCipher(vault_key()))
+    samples = []
+    for _ in range(repeat):
+        for end in range(1, len(SEARCH_TERM) + 1):
+            samples.append(timed(index.search, SEARCH_TERM[:end])[0])
+    return {"filter_passwords.keystroke": summarize(samples)}
+
+
+def bench_quick_switch(app, conn, count, repeat):
+    """Quick switcher index build, and per-keystroke latency of a query with typos"""
+    cipher = app.VaultCipher(vault_key())
+    seconds, index = timed(app.QuickSwitchIndex.load, conn, cipher)
+    rng = random.Random(SEED)
+    for _ in range(min(count, 500)):
+        index.record_use(rng.randint(1, count), time.time() - rng.randrange(90 * 86400))
+    samples = []
+    for _ in range(repeat):
+        for end in range(1, len(QUICK_SWITCH_TERM) + 1):
+            # Cached tiers would hide the cost of a new keystroke
+            index.tier_cache.clear()
+            samples.append(timed(index.search, QUICK_SWITCH_TERM[:end])[0])
+    return {"quick_switch.build": summarize([seconds]),
+            "quick_switch.keystroke": summarize(samples)}
+
+
+def bench_view(app, conn, count):
+    """Fetch and decrypt one entry, as view_password does"""
+    cipher = app.VaultCipher(vault_key())
+    rng = random.Random(SEED)
+
+    def view(pid):
+        row = conn.execute(f"SELECT {app.ENTRY_COLUMNS}, encrypted_password FROM passwords WHERE id = ?",
+                           (pid,)).fetchone()
+        return cipher.entry(row[:5]), cipher.decrypt(row[5])
+
+    return {"view_password.decrypt": summarize(
+        [timed(view, rng.randint(1, count))[0] for _ in range(VIEW_SAMPLES)])}
+
+
+def bench_writes(app, db_path, count):
+    """Insert and re-encrypt against a scratch copy so the cached vault stays unchanged"""
+    results = {}
+    scratch = db_path + ".scratch"
+    shutil.copyfile(db_path, scratch)
+    try:
+        key = vault_key()
+        cipher = app.VaultCipher(key)
+
+        # Single inserts go through the writer thread like the GUI's Save button
+        storage = app.VaultStorage(scratch)
+        try:
+            def insert_one(i):
+                token = cipher.encrypt(f"single-{i}")
+                sealed = cipher.seal_entry(f"single insert {i}", "bench@example")
+                storage.submit(lambda conn: app.insert_entry(conn, sealed, token, None)).result()
+
+            samples = [timed(insert_one, i)[0] for i in range(SINGLE_INSERTS)]
+        finally:
+            storage.close()
+        results["insert.single"] = summarize(samples)
+        results["insert.single_throughput"] = throughput(len(samples), sum(samples))
+
+        conn = app.open_database(scratch)
+        try:
+            bulk = [(f"bulk {service}", email, password)
+                    for service, email, password in synthetic_records(BULK_INSERTS, SEED + 1)]
+            seconds, _ = timed(app.BulkImporter(conn, key).run, bulk)
+            results["insert.bulk_throughput"] = throughput(len(bulk), seconds)
+
+            # Re-encrypt everything to a fresh key, as --reset/--rotate-key do
+            total = conn.execute("SELECT COUNT(*) FROM passwords").fetchone()[0]
+            seconds, _ = timed(app.RekeyEngine(conn, key, app.Fernet.generate_key()).run)
+            results["reset_master_password.reencrypt_throughput"] = throughput(total, seconds)
+        finally:
+            conn.close()
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(scratch + suffix):
+                os.remove(scratch + suffix)
+    return results
+
+
+def bench_sync(app, db_path, count, repeat):
+    """Sync two copies of the vault after SYNC_CHANGES edits, deletes and inserts on each side"""
+    copies = [db_path + ".sync-a", db_path + ".sync-b"]
+    for path in copies:
+        shutil.copyfile(db_path, path)
+    rng = random.Random(SEED)
+    try:
+        key = vault_key()
+        with app.VaultStore(key, copies[0]) as store:
+            # The first sync of a wholesale copy exchanges the whole log once
+            seconds, _ = timed(store.sync, copies[1])
+            samples = []
+            for round_number in range(repeat):
+                for side, path in enumerate(copies):
+                    with app.VaultStore(key, path) as editor:
+                        editor.put_many([(f"sync {round_number} {side} {i}", "bench@example", f"pw{i}")
+                                         for i in range(SYNC_CHANGES)])
+                        editor.delete_many(rng.sample(range(1, count + 1), SYNC_CHANGES))
+                samples.append(timed(store.sync, copies[1])[0])
+    finally:
+        for path in copies:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+    return {"sync.first_after_copy": summarize([seconds]), "sync.delta": summarize(samples)}
+
+
+def run(args):
+    app = load_app()
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    results = {}
+    print("derive_key", flush=True)
+    results.update(bench_derive_key(app, args.repeat))
+
+    for label in args.sizes:
+        count = SIZES[label]
+        print(f"vault {label}", flush=True)
+        db_path = build_vault(app, args.work_dir, label, count)
+
+        size_results = {}
+        conn = app.open_database(db_path)
+        try:
+            size_results.update(bench_load(app, conn, count, args.repeat))
+            size_results.update(bench_filter(app, conn, args.repeat))
+            size_results.update(bench_quick_switch(app, conn, count, args.repeat))
+            size_results.update(bench_view(app, conn, count))
+        finally:
+            conn.close()
+        if not args.skip_writes:
+            size_results.update(bench_writes(app, db_path, count))
+            size_results.update(bench_sync(app, db_path, count, args.repeat))
+        results.update({f"{name}@{label}": value for name, value in size_results.items()})
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sqlite": app.sqlite3.sqlite_version,
+            "kdfs": app.available_kdfs(),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Print a comparison with the baseline; returns the names of regressed metrics"""
+    regressions = []
+    for name, current in sorted(report["results"].items()):
+        previous = baseline.get("results", {}).get(name)
+        if previous is None or not previous["value"]:
+            print(f"  {name:55} {current['value']:12.2f} {current['unit']:10} (new)")
+            continue
+        change = current["value"] / previous["value"] - 1
+        worse = change > threshold if current["better"] == "lower" else change < -threshold
+        if worse:
+            regressions.append(name)
+        print(f"  {name:55} {current['value']:12.2f} {current['unit']:10} {change:+7.1%}"
+              f"{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def check_floors(report):
+    """Print metrics below their FLOORS minimum; returns their names"""
+    failures = []
+    for name, current in sorted(report["results"].items()):
+        floor = FLOORS.get(name.split("@")[0])
+        if floor is not None and current["value"] < floor:
+            failures.append(name)
+            print(f"  {name:55} {current['value']:12.2f} {current['unit']:10} below the floor of {floor}")
+    return failures
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1k,10k,100k,1m",
+                        help="comma separated vault sizes out of 1k, 10k, 100k, 1m (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of each latency measurement")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="where generated vaults are cached")
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative slowdown before a metric counts as a regression")
+    parser.add_argument("--skip-writes", action="store_true", help="skip insert, re-encryption and sync runs")
+    args = parser.parse_args(argv)
+    args.sizes = [size.strip().lower() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in args.sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    report = run(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    failures = check_floors(report)
+    if failures:
+        print(f"{len(failures)} metric(s) below their floor")
+        return 1
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(json.dumps(report, indent=2, sort_keys=True))
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
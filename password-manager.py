@@ -1,26 +1,4114 @@
 #!/usr/bin/env python3
 
-import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
 import sqlite3
 import os
 import base64
 import time
 import threading
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import queue
 import secrets
 import sys
+import hmac
+import hashlib
+import json
+import math
+import re
+import csv
+import getpass
+import argparse
+import struct
+import zlib
+import bisect
+import heapq
+import mmap
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+# Tk and cryptography are imported on first use: CLI commands never load Tk, and
+# the GUI paints its login screen while cryptography loads in the background
+tk = ttk = messagebox = simpledialog = filedialog = None
+Fernet = InvalidTag = AESGCM = hashes = PBKDF2HMAC = Scrypt = Argon2id = None
+_crypto_lock = threading.Lock()
+_crypto_loaded = False
+
+
+def load_tk():
+    """Import tkinter for the GUI"""
+    global tk, ttk, messagebox, simpledialog, filedialog
+    import tkinter as tk
+    from tkinter import ttk, messagebox, simpledialog, filedialog
+
+
+def load_crypto():
+    """Import the cryptography primitives; thread-safe and cheap once loaded"""
+    global Fernet, InvalidToken, InvalidTag, AESGCM, hashes, PBKDF2HMAC, Scrypt, Argon2id, _crypto_loaded
+    if _crypto_loaded:
+        return
+    with _crypto_lock:
+        if _crypto_loaded:
+            return
+        from cryptography.fernet import Fernet, InvalidToken
+        from cryptography.exceptions import InvalidTag
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+        from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+        try:
+            from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+        except ImportError:  # Argon2id needs cryptography >= 44
+            Argon2id = None
+        _crypto_loaded = True
+
+
+def process_pool(workers, initializer, initargs):
+    """Start a worker process pool; multiprocessing is only imported when a pool is needed"""
+    import importlib.machinery
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # Pools are started from background threads, and a forked child can inherit a lock
+    # another thread was holding, so workers start as fresh interpreters that re-run
+    # this script. Only a copy loaded by path under another name (the tests and
+    # benchmarks) cannot be found that way, and has to fork
+    if __name__ == "__main__" or importlib.machinery.PathFinder.find_spec(__name__) is not None:
+        context = multiprocessing.get_context("spawn")
+    else:
+        context = multiprocessing.get_context()
+    return ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs,
+                               mp_context=context)
+
+# Key derivation functions that can be recorded in the config header
+KDF_PBKDF2 = "pbkdf2-sha256"
+KDF_SCRYPT = "scrypt"
+KDF_ARGON2ID = "argon2id"
+
+# Parameters used by configs written before the versioned header existed
+LEGACY_KDF_PARAMS = {"name": KDF_PBKDF2, "iterations": 100000}
+
+# Default locations of the vault database and its config
+DB_PATH = os.path.join(os.path.expanduser("~"), "passwords.db")
+CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".password_manager_config.dat")
+# Config for the new key while a re-encryption is in progress
+PENDING_CONFIG_SUFFIX = ".pending"
+
+# Config file layout: magic, version byte, then a JSON body
+CONFIG_MAGIC = b"PMCF"
+CONFIG_VERSION = 2
+# Binds the wrapped data key to its purpose
+DATA_KEY_AAD = b"password-manager data key"
+
+# Unlock latency the calibration aims for on the current machine
+TARGET_UNLOCK_MS = 300
+
+
+def available_kdfs():
+    """Return the KDF names usable on this installation, strongest first"""
+    load_crypto()
+    names = [KDF_SCRYPT, KDF_PBKDF2]
+    if Argon2id is not None:
+        names.insert(0, KDF_ARGON2ID)
+    return names
+
+
+def derive_key_bytes(password, salt, params):
+    """Derive a raw 32-byte key from password using the given KDF parameters"""
+    load_crypto()
+    name = params["name"]
+    if name == KDF_PBKDF2:
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=params["iterations"],
+        )
+    elif name == KDF_SCRYPT:
+        kdf = Scrypt(salt=salt, length=32, n=params["n"], r=params["r"], p=params["p"])
+    elif name == KDF_ARGON2ID:
+        if Argon2id is None:
+            raise ValueError("Argon2id is not supported by the installed cryptography package")
+        kdf = Argon2id(
+            salt=salt,
+            length=32,
+            iterations=params["iterations"],
+            lanes=params["lanes"],
+            memory_cost=params["memory_cost"],
+        )
+    else:
+        raise ValueError(f"Unknown key derivation function: {name}")
+    return kdf.derive(password.encode())
+
+
+# Highest cost accepted from a file that is not authenticated yet (a backup header);
+# well above what calibrate_kdf picks, low enough that a crafted file cannot hang
+# the application or exhaust memory
+KDF_PARAM_LIMITS = {
+    KDF_PBKDF2: {"iterations": 10000000},
+    KDF_SCRYPT: {"n": 2 ** 20, "r": 16, "p": 16},
+    KDF_ARGON2ID: {"iterations": 256, "lanes": 64, "memory_cost": 1024 * 1024},
+}
+# scrypt needs about 128 * n * r bytes
+SCRYPT_MAX_MEMORY = 512 * 1024 * 1024
+
+
+def check_kdf_params(params):
+    """Raise ValueError unless params name an available KDF with costs within KDF_PARAM_LIMITS"""
+    if not isinstance(params, dict) or params.get("name") not in available_kdfs():
+        raise ValueError("Unsupported key derivation settings")
+    for field, limit in KDF_PARAM_LIMITS[params["name"]].items():
+        value = params.get(field)
+        if type(value) is not int or not 1 <= value <= limit:
+            raise ValueError(f"Key derivation setting {field} is out of range")
+    if params["name"] == KDF_SCRYPT and (
+            params["n"] & (params["n"] - 1) or 128 * params["n"] * params["r"] > SCRYPT_MAX_MEMORY):
+        raise ValueError("Key derivation setting n is out of range")
+
+
+def calibrate_kdf(name=None, target_ms=TARGET_UNLOCK_MS):
+    """Benchmark this machine and pick KDF parameters close to target_ms per unlock"""
+    if name is None:
+        name = available_kdfs()[0]
+    
+    # Time a cheap probe, then scale its cost linearly towards the target
+    if name == KDF_PBKDF2:
+        probe = {"name": KDF_PBKDF2, "iterations": 20000}
+    elif name == KDF_SCRYPT:
+        probe = {"name": KDF_SCRYPT, "n": 2 ** 12, "r": 8, "p": 1}
+    elif name == KDF_ARGON2ID:
+        probe = {"name": KDF_ARGON2ID, "iterations": 1, "lanes": 4, "memory_cost": 64 * 1024}
+    else:
+        raise ValueError(f"Unknown key derivation function: {name}")
+    
+    # Best of a few runs filters out scheduler noise
+    elapsed = min(_time_kdf(probe) for _ in range(3))
+    scale = (target_ms / 1000.0) / max(elapsed, 1e-6)
+    
+    params = dict(probe)
+    if name == KDF_PBKDF2:
+        # Never go below the cost older versions used
+        iterations = int(probe["iterations"] * scale) // 1000 * 1000
+        params["iterations"] = max(LEGACY_KDF_PARAMS["iterations"], iterations)
+    elif name == KDF_SCRYPT:
+        # n must be a power of two; bound memory to 16 MiB .. 256 MiB
+        exponent = int(math.log2(probe["n"] * scale)) if scale > 0 else 14
+        params["n"] = 2 ** min(max(exponent, 14), 18)
+    else:
+        params["iterations"] = min(max(int(round(probe["iterations"] * scale)), 2), 64)
+    return params
+
+
+def _time_kdf(params):
+    """Return how long one derivation with params takes, in seconds"""
+    start = time.perf_counter()
+    derive_key_bytes("calibration", secrets.token_bytes(16), params)
+    return time.perf_counter() - start
+
+
+def key_verifier(key):
+    """Return a value that proves knowledge of key without storing the key itself"""
+    return hmac.new(key, b"password-manager key verifier", hashlib.sha256).digest()
+
+
+class IncorrectPasswordError(ValueError):
+    """The master password does not open the vault config"""
+
+
+def wrap_data_key(kek, data_key):
+    """Encrypt the vault data key under a password-derived key-encryption key"""
+    load_crypto()
+    nonce = secrets.token_bytes(12)
+    return nonce + AESGCM(kek).encrypt(nonce, data_key, DATA_KEY_AAD)
+
+
+def unwrap_data_key(kek, wrapped):
+    """Decrypt the vault data key, raising ValueError if kek is wrong"""
+    load_crypto()
+    try:
+        return AESGCM(kek).decrypt(wrapped[:12], wrapped[12:], DATA_KEY_AAD)
+    except InvalidTag:
+        raise IncorrectPasswordError("Incorrect master password")
+
+
+# Separates the fingerprint key from other uses of the vault key
+FINGERPRINT_CONTEXT = b"password-manager fingerprint v1"
+
+
+def fingerprint_key(vault_key):
+    """Derive the HMAC key for password fingerprints from the vault key"""
+    return hmac.new(base64.urlsafe_b64decode(vault_key), FINGERPRINT_CONTEXT, hashlib.sha256).digest()
+
+
+def password_fingerprint(fp_key, password):
+    """Keyed fingerprint of a password; equal passwords in one vault get equal fingerprints"""
+    if isinstance(password, str):
+        password = password.encode("utf-8")
+    return hmac.new(fp_key, password, hashlib.sha256).digest()[:16]
+
+
+# Separates the key epoch id from other uses of the vault key
+KEY_EPOCH_CONTEXT = b"password-manager key epoch v1"
+
+
+def key_epoch(vault_key):
+    """Short id of the vault key a database's entries use; changes when the key is rotated"""
+    return hmac.new(base64.urlsafe_b64decode(vault_key), KEY_EPOCH_CONTEXT, hashlib.sha256).digest()[:16]
+
+
+# Separates the record encryption key from other uses of the vault key
+RECORD_CONTEXT = b"password-manager record v1"
+# First byte of every compact record; legacy Fernet tokens are stored as text instead
+RECORD_VERSION = 1
+RECORD_NONCE_BYTES = 12
+
+
+class VaultCipher:
+    """Encrypt entries as compact AES-GCM records; decrypt records and legacy Fernet tokens
+    
+    A record is stored as a BLOB: version byte, random 12-byte nonce, then the
+    ciphertext with its 16-byte tag. The version byte and the field the record
+    belongs to are authenticated as associated data. Entries written before
+    records existed hold base64 Fernet tokens as TEXT; they stay readable until
+    RecordMigration rewrites them.
+    """
+    
+    def __init__(self, vault_key):
+        load_crypto()
+        record_key = hmac.new(base64.urlsafe_b64decode(vault_key), RECORD_CONTEXT, hashlib.sha256).digest()
+        self.aead = AESGCM(record_key)
+        self.fernet = Fernet(vault_key)
+        self.header = bytes([RECORD_VERSION])
+        self.index_key = blind_index_key(vault_key)
+    
+    def encrypt(self, plaintext, field=b""):
+        """Encrypt str or bytes into a record"""
+        if isinstance(plaintext, str):
+            plaintext = plaintext.encode("utf-8")
+        nonce = secrets.token_bytes(RECORD_NONCE_BYTES)
+        return self.header + nonce + self.aead.encrypt(nonce, plaintext, self.header + field)
+    
+    def decrypt(self, value, field=b""):
+        """Decrypt a stored record or Fernet token to bytes, raising ValueError if it does not verify"""
+        if isinstance(value, str):
+            try:
+                return self.fernet.decrypt(value.encode("ascii"))
+            except (InvalidToken, UnicodeEncodeError):
+                raise ValueError("Entry could not be decrypted")
+        if value[:1] != self.header:
+            raise ValueError(f"Unsupported record version {value[0] if value else None}")
+        try:
+            return self.aead.decrypt(value[1:1 + RECORD_NONCE_BYTES], value[1 + RECORD_NONCE_BYTES:],
+                                     self.header + field)
+        except InvalidTag:
+            raise ValueError("Entry could not be decrypted")
+    
+    def seal_entry(self, service, email):
+        """Return (service record, email record, entry key, search tokens) for storing an entry"""
+        return (self.encrypt(service, SERVICE_FIELD), self.encrypt(email, EMAIL_FIELD),
+                entry_key(self.index_key, service, email), blind_tokens(self.index_key, service, email))
+    
+    def entry(self, row):
+        """Turn an ENTRY_COLUMNS row into (id, service, email)"""
+        row_id, service, email, service_record, email_record = row
+        # Rows not yet seen by MetadataMigration still hold plaintext
+        if service_record is not None:
+            service = self.decrypt(service_record, SERVICE_FIELD).decode("utf-8")
+            email = self.decrypt(email_record, EMAIL_FIELD).decode("utf-8")
+        return row_id, service, email
+
+
+# Separates the blind index key from other uses of the vault key
+BLIND_INDEX_CONTEXT = b"password-manager blind index v1"
+# Word prefixes up to this long get a search token; longer search words are
+# looked up by their first characters and confirmed after decryption
+BLIND_PREFIX_MAX = 12
+BLIND_TOKEN_BYTES = 8
+# Associated data that ties metadata records to their column
+SERVICE_FIELD = b"service"
+EMAIL_FIELD = b"email"
+# Columns that cipher.entry() turns into (id, service, email)
+ENTRY_COLUMNS = "id, service_name, email, service_record, email_record"
+# Search words are runs of letters and digits, like the old unicode61 FTS tokenizer's
+SEARCH_WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+def blind_index_key(vault_key):
+    """Derive the MAC key for search tokens and entry keys from the vault key"""
+    return hmac.new(base64.urlsafe_b64decode(vault_key), BLIND_INDEX_CONTEXT, hashlib.sha256).digest()
+
+
+def search_words(text):
+    """Split text into lowercase words: letters and digits, everything else separates"""
+    return SEARCH_WORD_PATTERN.findall(text.lower())
+
+
+def blind_token(index_key, word):
+    """Search token for a word prefix"""
+    # Keyed BLAKE2s is a MAC like HMAC-SHA256 but a third of the cost, which adds up over every prefix
+    return hashlib.blake2s(word[:BLIND_PREFIX_MAX].encode("utf-8"), key=index_key,
+                           digest_size=BLIND_TOKEN_BYTES).digest()
+
+
+def blind_tokens(index_key, service, email):
+    """Search tokens for every word prefix in an entry's service and email"""
+    prefixes = {word[:length] for word in search_words(service) + search_words(email)
+                for length in range(1, min(len(word), BLIND_PREFIX_MAX) + 1)}
+    # Same values as blind_token(); copying a keyed state skips the key block for each prefix
+    keyed = hashlib.blake2s(key=index_key, digest_size=BLIND_TOKEN_BYTES)
+    tokens = []
+    for prefix in prefixes:
+        state = keyed.copy()
+        state.update(prefix.encode("utf-8"))
+        tokens.append(state.digest())
+    return tokens
+
+
+def entry_key(index_key, service, email):
+    """Keyed value for finding an entry by exact service and email, e.g. duplicate checks"""
+    # Words never contain NUL, so these never collide with search tokens
+    message = b"\0".join([b"entry", service.encode("utf-8"), email.encode("utf-8")])
+    return hmac.digest(index_key, message, "sha256")[:16]
+
+
+def load_config(path):
+    """Read the vault config, accepting both the versioned and the legacy layout"""
+    with open(path, "rb") as f:
+        data = f.read()
+    
+    if not data.startswith(CONFIG_MAGIC):
+        # Legacy layout: salt[16] + urlsafe base64 key, PBKDF2 with 100k iterations
+        return {
+            "version": 0,
+            "kdf": dict(LEGACY_KDF_PARAMS),
+            "salt": data[:16],
+            "key": data[16:],
+        }
+    
+    version = data[len(CONFIG_MAGIC)]
+    if version > CONFIG_VERSION:
+        raise ValueError(f"Config version {version} is newer than this application supports")
+    body = json.loads(data[len(CONFIG_MAGIC) + 1:].decode("utf-8"))
+    config = {
+        "version": version,
+        "kdf": body["kdf"],
+        "salt": base64.b64decode(body["salt"]),
+    }
+    if version == 1:
+        # v1 stored a verifier of the password-derived key, which encrypted entries directly
+        config["verifier"] = base64.b64decode(body["verifier"])
+    else:
+        config["wrapped_key"] = base64.b64decode(body["wrapped_key"])
+    return config
+
+
+def save_config(path, kdf_params, salt, kek, data_key):
+    """Atomically write a config wrapping data_key with kek (derived with kdf_params and salt)"""
+    body = {
+        "kdf": kdf_params,
+        "salt": base64.b64encode(salt).decode("ascii"),
+        "wrapped_key": base64.b64encode(wrap_data_key(kek, data_key)).decode("ascii"),
+    }
+    data = CONFIG_MAGIC + bytes([CONFIG_VERSION]) + json.dumps(body).encode("utf-8")
+    
+    tmp_path = path + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def verify_key(config, key):
+    """Check a password-derived key against a pre-v2 config"""
+    if config["version"] == 0:
+        return secrets.compare_digest(key, config["key"])
+    return secrets.compare_digest(key_verifier(key), config["verifier"])
+
+
+def unlock_config(config, password):
+    """Return the vault data key for password, raising ValueError if it is wrong"""
+    kek = derive_key_bytes(password, config["salt"], config["kdf"])
+    if config["version"] >= 2:
+        return unwrap_data_key(kek, config["wrapped_key"])
+    
+    # Older configs encrypted entries with the password-derived key itself
+    key = base64.urlsafe_b64encode(kek)
+    if not verify_key(config, key):
+        raise IncorrectPasswordError("Incorrect master password")
+    return key
+
+
+def write_vault_config(path, password, data_key, kdf_params=None):
+    """Wrap data_key under password with a fresh salt and (re)calibrated KDF"""
+    if kdf_params is None:
+        kdf_params = calibrate_kdf()
+    salt = secrets.token_bytes(16)
+    save_config(path, kdf_params, salt, derive_key_bytes(password, salt, kdf_params), data_key)
+
+
+def create_vault_config(password, config_path=CONFIG_PATH):
+    """Create a new random data key protected by password; returns the data key"""
+    load_crypto()
+    data_key = Fernet.generate_key()
+    write_vault_config(config_path, password, data_key)
+    return data_key
+
+
+def unlock_vault_key(password, config_path=CONFIG_PATH):
+    """Return the vault data key for password, raising ValueError if it is wrong"""
+    config = load_config(config_path)
+    data_key = unlock_config(config, password)
+    
+    # Move older configs to the wrapped-key layout; entries keep their key. The
+    # KDF settings carry over so unlocking never waits for a calibration; changing
+    # the master password recalibrates them
+    if config["version"] < 2:
+        write_vault_config(config_path, password, data_key, config["kdf"])
+    return data_key
+
+
+# Character classes for generated passwords; look-alike characters (0/O, 1/l/I) are left out
+PASSWORD_CLASSES = {
+    "upper": "ABCDEFGHJKLMNPQRSTUVWXYZ",
+    "lower": "abcdefghijkmnopqrstuvwxyz",
+    "digits": "23456789",
+    "symbols": "!@#$%^&*()_+-=[]{}|;:,.<>?",
+}
+# CSPRNG bytes fetched per refill when generating in bulk
+GENERATOR_BUFFER_BYTES = 64 * 1024
+# Wordlists tried for passphrases when none is given
+DEFAULT_WORDLIST_PATHS = ("/usr/share/dict/words", "/usr/dict/words")
+
+
+def load_wordlist(path=None):
+    """Read a passphrase wordlist, one word per line (EFF style "11111<TAB>word" lines work too)"""
+    paths = [path] if path else [p for p in DEFAULT_WORDLIST_PATHS if os.path.exists(p)]
+    if not paths:
+        raise ValueError("No wordlist found; pass one with --wordlist")
+    words = set()
+    with open(paths[0], "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            fields = line.split()
+            # Skip names, possessives and other entries that are awkward to type
+            if fields and fields[-1].isalpha() and fields[-1].islower() and 3 <= len(fields[-1]) <= 10:
+                words.add(fields[-1])
+    if len(words) < 1024:
+        raise ValueError(f"Wordlist {paths[0]} has only {len(words)} usable words; need at least 1024")
+    return sorted(words)
+
+
+class PasswordPolicy:
+    """What a generated password or passphrase must look like"""
+    
+    def __init__(self, length=16, classes=tuple(PASSWORD_CLASSES), exclude="", words=0,
+                 separator="-", wordlist=None):
+        self.length = length
+        self.classes = tuple(classes)
+        self.exclude = exclude
+        # words > 0 makes a passphrase of that many words instead of characters
+        self.words = words
+        self.separator = separator
+        self.wordlist = wordlist
+    
+    def class_alphabets(self):
+        """Return the allowed characters of each selected class"""
+        unknown = [name for name in self.classes if name not in PASSWORD_CLASSES]
+        if unknown:
+            raise ValueError(f"Unknown character class: {', '.join(unknown)}")
+        alphabets = ["".join(c for c in PASSWORD_CLASSES[name] if c not in self.exclude) for name in self.classes]
+        if not alphabets or not all(alphabets):
+            raise ValueError("Every selected character class needs at least one allowed character")
+        return alphabets
+    
+    def validate(self):
+        if self.words:
+            if self.words < 1:
+                raise ValueError("A passphrase needs at least one word")
+            return
+        alphabets = self.class_alphabets()
+        if self.length < len(alphabets):
+            raise ValueError(f"Length must be at least {len(alphabets)} to include every character class")
+
+
+class PasswordGenerator:
+    """Generate passwords and passphrases for a policy from buffered CSPRNG output
+    
+    Random bytes are fetched from os.urandom in large blocks. Characters are
+    chosen by rejection sampling: bytes at or above the largest multiple of the
+    alphabet size are discarded, so every character is equally likely.
+    Passwords missing a required class are discarded whole, which keeps the
+    result uniform over all passwords that satisfy the policy.
+    """
+    
+    def __init__(self, policy=None, buffer_bytes=GENERATOR_BUFFER_BYTES):
+        self.policy = policy or PasswordPolicy()
+        self.policy.validate()
+        self.buffer_bytes = buffer_bytes
+        self.pool = ""
+        self.pool_pos = 0
+        self.random_bytes = b""
+        self.random_pos = 0
+        
+        if self.policy.words:
+            self.words = load_wordlist(self.policy.wordlist)
+            return
+        
+        self.classes = [frozenset(alphabet) for alphabet in self.policy.class_alphabets()]
+        self.alphabet = "".join(sorted(set().union(*self.classes)))
+        # bytes.translate maps accepted bytes to characters and drops the rest in C
+        size = len(self.alphabet)
+        limit = 256 - 256 % size
+        self.table = bytes(ord(self.alphabet[b % size]) if b < limit else 0 for b in range(256))
+        self.rejected = bytes(range(limit, 256))
+    
+    def take_chars(self, count):
+        """Return count uniformly random alphabet characters"""
+        # Read through the pool by position; slicing off the front would copy it each time
+        while len(self.pool) - self.pool_pos < count:
+            block = os.urandom(self.buffer_bytes).translate(self.table, self.rejected)
+            self.pool = self.pool[self.pool_pos:] + block.decode("ascii")
+            self.pool_pos = 0
+        start = self.pool_pos
+        self.pool_pos += count
+        return self.pool[start:self.pool_pos]
+    
+    def below(self, n):
+        """Return a uniformly random integer in [0, n)"""
+        width = max(1, ((n - 1).bit_length() + 7) // 8)
+        span = 256 ** width
+        limit = span - span % n
+        while True:
+            if len(self.random_bytes) - self.random_pos < width:
+                self.random_bytes = os.urandom(self.buffer_bytes)
+                self.random_pos = 0
+            start = self.random_pos
+            self.random_pos += width
+            value = int.from_bytes(self.random_bytes[start:self.random_pos], "big")
+            if value < limit:
+                return value % n
+    
+    def generate(self):
+        """Return one password or passphrase"""
+        if self.policy.words:
+            return self.policy.separator.join(
+                self.words[self.below(len(self.words))] for _ in range(self.policy.words))
+        while True:
+            password = self.take_chars(self.policy.length)
+            if all(not group.isdisjoint(password) for group in self.classes):
+                return password
+    
+    def stream(self, count=None):
+        """Yield count passwords, or an endless stream when count is None"""
+        produced = 0
+        while count is None or produced < count:
+            yield self.generate()
+            produced += 1
+    
+    def entropy_bits(self):
+        """Upper bound on the entropy of one result (ignores the class requirement)"""
+        if self.policy.words:
+            return self.policy.words * math.log2(len(self.words))
+        return self.policy.length * math.log2(len(self.alphabet))
+
+
+# Local metrics log; only operation names and durations are ever written to it
+METRICS_LOG_PATH = os.path.join(os.path.expanduser("~"), ".password_manager_metrics.log")
+METRICS_LOG_BYTES = 1024 * 1024
+METRICS_LOG_BACKUPS = 3
+
+# Latency histogram bucket upper bounds in milliseconds
+METRICS_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; constant memory however many samples it sees"""
+    
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+    
+    def add(self, ms):
+        self.counts[bisect.bisect_left(METRICS_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+    
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding the given fraction of samples"""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                bound = METRICS_BUCKETS_MS[index] if index < len(METRICS_BUCKETS_MS) else self.max_ms
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+    
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class Metrics:
+    """Thread-safe latency histograms keyed by operation name
+    
+    Names are fixed strings chosen in code, never user input, so a snapshot
+    holds no service names, search terms or secrets.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+    
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(seconds * 1000)
+    
+    @contextmanager
+    def timer(self, name):
+        """Time the enclosed block, including blocks that raise"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+    
+    def snapshot(self):
+        """Return {name: summary} for every operation seen so far"""
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+    
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+# Process-wide metrics; recording costs a lock and a bisect per sample
+METRICS = Metrics()
+
+
+class MetricsLog:
+    """Append metrics snapshots as JSON lines to a size-rotated local log"""
+    
+    def __init__(self, metrics=METRICS, path=METRICS_LOG_PATH):
+        self.metrics = metrics
+        self.path = path
+        self.logger = None
+        self.handler = None
+    
+    def open(self):
+        """Set up the log file on first write; logging is not imported at startup"""
+        import logging
+        import logging.handlers
+        self.logger = logging.getLogger("password_manager.metrics")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        try:
+            self.handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=METRICS_LOG_BYTES, backupCount=METRICS_LOG_BACKUPS, encoding="utf-8")
+            self.logger.addHandler(self.handler)
+        except OSError:
+            # Metrics are best effort; an unwritable home directory must not stop the app
+            self.handler = None
+    
+    def write(self, event):
+        """Log the current snapshot, tagged with what triggered it"""
+        snapshot = self.metrics.snapshot()
+        if not snapshot:
+            return
+        if self.logger is None:
+            self.open()
+        if self.handler is None:
+            return
+        self.logger.info(json.dumps({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "event": event,
+            "pid": os.getpid(),
+            "metrics": snapshot,
+        }, sort_keys=True))
+    
+    def close(self):
+        if self.handler is not None:
+            self.logger.removeHandler(self.handler)
+            self.handler.close()
+            self.handler = None
+
+
+# Pragmas applied to every connection: WAL lets readers run alongside the writer,
+# NORMAL sync is durable at checkpoints in WAL mode, and a larger page cache plus
+# memory-mapped I/O keep big vaults off the disk for reads
+DB_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def connect_database(db_path=DB_PATH, **kwargs):
+    """Open a tuned connection to the vault database"""
+    conn = sqlite3.connect(db_path, timeout=10, **kwargs)
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def open_database(db_path=DB_PATH):
+    """Open the vault database, creating and migrating the schema as needed"""
+    conn = connect_database(db_path)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS passwords (
+        id INTEGER PRIMARY KEY,
+        service_name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        encrypted_password BLOB NOT NULL
+    )
+    ''')
+    conn.commit()
+    
+    # Bring older databases up to the current schema
+    migrate_schema(conn)
+    return conn
+
+
+def migrate_add_search_index(conn):
+    """Schema v1: formerly a full-text index over the plaintext service and email"""
+    # v6 replaced it with the blind index and drops it, so nothing is built here any more;
+    # the migration stays so later schema numbers keep their meaning
+
+
+def migrate_add_service_email_index(conn):
+    """Schema v2: formerly a plaintext (service_name, email) index for duplicate checks"""
+    # Dropped by v6 in favour of entry keys, so new and upgraded vaults skip it
+
+
+def migrate_add_rekey_progress(conn):
+    """Schema v3: checkpoint for resuming an interrupted re-encryption"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS rekey_progress (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_id INTEGER NOT NULL,
+        complete INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+
+
+def migrate_add_password_fingerprint(conn):
+    """Schema v4: indexed keyed fingerprint of each password for reuse checks"""
+    # Existing rows stay NULL until FingerprintBackfill runs with the vault key
+    conn.execute("ALTER TABLE passwords ADD COLUMN password_fingerprint BLOB")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_passwords_fingerprint ON passwords (password_fingerprint)")
+
+
+def migrate_add_legacy_token_index(conn):
+    """Schema v5: partial index of entries still holding Fernet tokens"""
+    # Stays empty once RecordMigration has run; older databases keep the TEXT
+    # column type, which stores record BLOBs unchanged
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_passwords_legacy_token ON passwords (id) "
+        "WHERE typeof(encrypted_password) = 'text'"
+    )
+
+
+def migrate_encrypt_metadata(conn):
+    """Schema v6: encrypted service/email columns with a blind search index"""
+    # Rows keep their plaintext until MetadataMigration runs with the vault key. Vaults
+    # upgraded by older versions have an FTS index and a (service_name, email) index
+    # holding plaintext, so they go now.
+    for trigger in ("passwords_fts_insert", "passwords_fts_delete", "passwords_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS passwords_fts")
+    conn.execute("DROP INDEX IF EXISTS idx_passwords_service_email")
+    
+    conn.execute("ALTER TABLE passwords ADD COLUMN service_record BLOB")
+    conn.execute("ALTER TABLE passwords ADD COLUMN email_record BLOB")
+    conn.execute("ALTER TABLE passwords ADD COLUMN entry_key BLOB")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_passwords_entry_key ON passwords (entry_key)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_passwords_plain_metadata ON passwords (id) WHERE service_record IS NULL"
+    )
+    
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS search_tokens (
+        token BLOB NOT NULL,
+        entry_id INTEGER NOT NULL,
+        PRIMARY KEY (token, entry_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_search_tokens_entry ON search_tokens (entry_id)")
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS search_tokens_delete AFTER DELETE ON passwords BEGIN
+        DELETE FROM search_tokens WHERE entry_id = old.id;
+    END
+    ''')
+
+
+def migrate_add_entry_usage(conn):
+    """Schema v7: how often and when each entry was last opened, for frecency ranking"""
+    # Counts and times only; which entry they belong to stays behind the encrypted metadata
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS entry_usage (
+        entry_id INTEGER PRIMARY KEY,
+        access_count INTEGER NOT NULL,
+        last_accessed REAL NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS entry_usage_delete AFTER DELETE ON passwords BEGIN
+        DELETE FROM entry_usage WHERE entry_id = old.id;
+    END
+    ''')
+
+
+def migrate_add_sync_log(conn):
+    """Schema v8: change log, replica id and peer positions for syncing with other vault files"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sync_replica (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        replica_id BLOB NOT NULL
+    )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO sync_replica (id, replica_id) VALUES (1, randomblob(16))")
+    
+    # One row per entry ever stored, holding its latest revision; every change moves
+    # the row to a new sequence number. Deleted entries keep their row without an
+    # entry_id so the deletion reaches other copies.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sync_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        sync_id BLOB NOT NULL UNIQUE,
+        entry_id INTEGER,
+        revision INTEGER NOT NULL,
+        modified REAL NOT NULL,
+        origin BLOB NOT NULL
+    )
+    ''')
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_log_entry ON sync_log (entry_id) WHERE entry_id IS NOT NULL"
+    )
+    
+    # How far into each other copy's log this vault has merged. Both sides of a
+    # finished sync store the same random token, which tells a file copied
+    # since then apart from the copy it was made from.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sync_peers (
+        replica_id BLOB PRIMARY KEY,
+        last_seq INTEGER NOT NULL,
+        token BLOB,
+        synced REAL NOT NULL
+    )
+    ''')
+    
+    log_existing_entries(conn)
+
+
+def migrate_add_key_epoch(conn):
+    """Schema v9: id of the vault key the entries use, so sync can refuse copies from before a rotation"""
+    # Stays NULL until a rotation or a sync records it with the key at hand
+    conn.execute("ALTER TABLE sync_replica ADD COLUMN key_epoch BLOB")
+
+
+# Ordered schema migrations; PRAGMA user_version records how many have run
+SCHEMA_MIGRATIONS = [
+    migrate_add_search_index,
+    migrate_add_service_email_index,
+    migrate_add_rekey_progress,
+    migrate_add_password_fingerprint,
+    migrate_add_legacy_token_index,
+    migrate_encrypt_metadata,
+    migrate_add_entry_usage,
+    migrate_add_sync_log,
+    migrate_add_key_epoch,
+]
+
+
+def migrate_schema(conn):
+    """Apply any schema migrations the database has not seen yet"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+        with conn:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+
+# Random id an entry keeps in every copy of the vault
+SYNC_ID_BYTES = 16
+
+
+def log_existing_entries(conn, condition="1"):
+    """Add sync log rows at revision 1 for entries stored without one
+    
+    The sync id, which also serves as the origin, is a digest of the row as
+    stored. Copies of one vault file therefore agree on the ids and versions
+    of the entries they share, while rows that differ get different versions.
+    """
+    rows = conn.execute(
+        "SELECT id, service_name, email, service_record, email_record, encrypted_password "
+        f"FROM passwords WHERE {condition} ORDER BY id"
+    )
+    conn.executemany(
+        "INSERT INTO sync_log (sync_id, entry_id, revision, modified, origin) VALUES (?, ?, 1, 0, ?)",
+        ((digest, row[0], digest) for row in rows
+         for digest in [hashlib.blake2s(repr(row).encode("utf-8"), digest_size=SYNC_ID_BYTES).digest()])
+    )
+
+
+def store_search_tokens(conn, entry_id, tokens):
+    """Replace the blind index tokens of one entry"""
+    conn.execute("DELETE FROM search_tokens WHERE entry_id = ?", (entry_id,))
+    conn.executemany("INSERT OR IGNORE INTO search_tokens (token, entry_id) VALUES (?, ?)",
+                     [(token, entry_id) for token in tokens])
+
+
+def insert_entry(conn, sealed, token, fingerprint):
+    """Insert an entry from cipher.seal_entry() output and its search tokens; returns the new id"""
+    service_record, email_record, key, tokens = sealed
+    # The plaintext columns are NOT NULL in older schemas, so they get empty strings
+    entry_id = conn.execute(
+        "INSERT INTO passwords (service_name, email, service_record, email_record, entry_key, "
+        "encrypted_password, password_fingerprint) VALUES ('', '', ?, ?, ?, ?, ?)",
+        (service_record, email_record, key, token, fingerprint)
+    ).lastrowid
+    store_search_tokens(conn, entry_id, tokens)
+    # A new entry has no sync log row to look up; imports add many at once
+    conn.execute(
+        "INSERT OR REPLACE INTO sync_log (sync_id, entry_id, revision, modified, origin) "
+        "SELECT ?, ?, 1, ?, replica_id FROM sync_replica",
+        (secrets.token_bytes(SYNC_ID_BYTES), entry_id, time.time())
+    )
+    return entry_id
+
+
+# Search token rows per INSERT in insert_entries(); two parameters each, under SQLite's old 999 limit
+TOKEN_INSERT_ROWS = 400
+
+
+def insert_entries(conn, entries):
+    """Insert (sealed, token, fingerprint) entries with a few statements; returns the new ids
+    
+    The ids are assigned here as one contiguous range after the current
+    maximum, which is what SQLite would pick for each row in turn, so the
+    search tokens and sync log rows of the whole batch go in together.
+    """
+    first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM passwords").fetchone()[0]
+    ids = range(first_id, first_id + len(entries))
+    conn.executemany(
+        "INSERT INTO passwords (id, service_name, email, service_record, email_record, entry_key, "
+        "encrypted_password, password_fingerprint) VALUES (?, '', '', ?, ?, ?, ?, ?)",
+        [(entry_id, sealed[0], sealed[1], sealed[2], token, fingerprint)
+         for entry_id, (sealed, token, fingerprint) in zip(ids, entries)]
+    )
+    # Tokens are random, so inserting them in key order keeps B-tree writes local. About 30
+    # rows per entry make this the bulk of an import; multi-row statements halve its cost.
+    token_rows = sorted((token, entry_id) for entry_id, (sealed, _, _) in zip(ids, entries) for token in sealed[3])
+    for start in range(0, len(token_rows), TOKEN_INSERT_ROWS):
+        chunk = token_rows[start:start + TOKEN_INSERT_ROWS]
+        conn.execute("INSERT OR IGNORE INTO search_tokens (token, entry_id) VALUES "
+                     + ", ".join(["(?, ?)"] * len(chunk)), [value for row in chunk for value in row])
+    replica_id = conn.execute("SELECT replica_id FROM sync_replica").fetchone()[0]
+    modified = time.time()
+    conn.executemany(
+        "INSERT OR REPLACE INTO sync_log (sync_id, entry_id, revision, modified, origin) VALUES (?, ?, 1, ?, ?)",
+        [(secrets.token_bytes(SYNC_ID_BYTES), entry_id, modified, replica_id) for entry_id in ids]
+    )
+    return ids
+
+
+def update_entry(conn, entry_id, sealed, token, fingerprint):
+    """Replace an entry's metadata, password and search tokens"""
+    service_record, email_record, key, tokens = sealed
+    conn.execute(
+        "UPDATE passwords SET service_name = '', email = '', service_record = ?, email_record = ?, "
+        "entry_key = ?, encrypted_password = ?, password_fingerprint = ? WHERE id = ?",
+        (service_record, email_record, key, token, fingerprint, entry_id)
+    )
+    store_search_tokens(conn, entry_id, tokens)
+
+
+def log_change(conn, entry_id, deleted=False):
+    """Give an entry changed in this vault its next revision, at the end of the sync log"""
+    row = conn.execute("SELECT sync_id, revision FROM sync_log WHERE entry_id = ?", (entry_id,)).fetchone()
+    sync_id, revision = row if row is not None else (secrets.token_bytes(SYNC_ID_BYTES), 0)
+    # Replacing the row gives it a new sequence number
+    conn.execute(
+        "INSERT OR REPLACE INTO sync_log (sync_id, entry_id, revision, modified, origin) "
+        "SELECT ?, ?, ?, ?, replica_id FROM sync_replica",
+        (sync_id, None if deleted else entry_id, revision + 1, time.time())
+    )
+
+
+def delete_entry(conn, entry_id):
+    """Delete an entry, leaving a tombstone in the sync log; returns how many rows were removed"""
+    count = conn.execute("DELETE FROM passwords WHERE id = ?", (entry_id,)).rowcount
+    if count:
+        log_change(conn, entry_id, deleted=True)
+    return count
+
+
+def record_usage(conn, entry_id, when):
+    """Count one access to an entry at time when (seconds since the epoch)"""
+    conn.execute(
+        "INSERT INTO entry_usage (entry_id, access_count, last_accessed) VALUES (?, 1, ?) "
+        "ON CONFLICT (entry_id) DO UPDATE SET access_count = access_count + 1, "
+        "last_accessed = excluded.last_accessed",
+        (entry_id, when)
+    )
+
+
+class SearchIndex:
+    """Search encrypted service/email metadata through keyed blind index tokens
+    
+    Every word prefix of an entry's service and email is stored as a keyed
+    BLAKE2s token in search_tokens, so a search is an indexed lookup of opaque values
+    and only the matching rows are decrypted, to confirm and rank them. The
+    tokens show which entries share a word prefix, but not the words.
+    """
+    
+    def __init__(self, conn, cipher):
+        self.conn = conn
+        self.cipher = cipher
+    
+    @staticmethod
+    def tokenize(term):
+        """Split a search term into lowercase word tokens"""
+        return search_words(term)
+    
+    def matches(self, row, tokens):
+        """Return True if an (id, service_name, email) row matches the search tokens"""
+        return bool(self.rank([row], tokens))
+    
+    def rank(self, entries, tokens, cancelled=None):
+        """Return the (id, service_name, email) entries matching tokens, best matches first
+        
+        Used for decrypted query rows and to narrow an earlier result set in memory,
+        so both order their results the same way.
+        """
+        # Token collisions and words longer than BLIND_PREFIX_MAX are settled here;
+        # rows whose service name matches more tokens rank first
+        ranked = []
+        for number, entry in enumerate(entries):
+            if cancelled is not None and number % 1000 == 0 and cancelled():
+                raise sqlite3.OperationalError("interrupted")
+            service_words = self.tokenize(entry[1])
+            words = service_words + self.tokenize(entry[2])
+            if all(any(word.startswith(token) for word in words) for token in tokens):
+                service_hits = sum(any(word.startswith(token) for word in service_words) for token in tokens)
+                ranked.append((-service_hits, entry[0], entry))
+        ranked.sort()
+        return [entry for _, _, entry in ranked]
+    
+    def search(self, term, cancelled=None):
+        """Return (id, service_name, email) rows matching term, best matches first
+        
+        cancelled() is polled while rows are decrypted; once it returns True the
+        search stops with the OperationalError an interrupted query raises.
+        """
+        # Every word in term must prefix-match a word in the service name or email;
+        # None means the term is empty and no filter applies
+        tokens = self.tokenize(term)
+        if not tokens:
+            return None
+        with METRICS.timer("search.query"):
+            return self.query(tokens, cancelled)
+    
+    def query(self, tokens, cancelled=None):
+        """Look up a non-empty token list and decrypt the candidate rows"""
+        blind = sorted({blind_token(self.cipher.index_key, token) for token in tokens})
+        # Entries holding every token, plus any rows MetadataMigration has not reached yet
+        rows = self.conn.execute(
+            f"SELECT {ENTRY_COLUMNS} FROM passwords WHERE id IN ("
+            f"  SELECT entry_id FROM search_tokens WHERE token IN ({','.join('?' * len(blind))}) "
+            "  GROUP BY entry_id HAVING COUNT(*) = ?) "
+            f"UNION ALL SELECT {ENTRY_COLUMNS} FROM passwords WHERE service_record IS NULL",
+            blind + [len(blind)]
+        ).fetchall()
+        return self.rank((self.cipher.entry(row) for row in rows), tokens, cancelled)
+
+
+class SearchController:
+    """Debounce search input, cancel superseded queries and cache recent results"""
+    
+    DEBOUNCE_MS = 150
+    POLL_MS = 20
+    CACHE_SIZE = 32
+    
+    def __init__(self, root, db_path, cipher, on_results):
+        self.root = root
+        self.on_results = on_results
+        self.pending = None
+        self.polling = False
+        self.generation = 0
+        # Generation of the query the worker is answering, if any
+        self.waiting_for = None
+        self.started = None
+        
+        # Recent results keyed by normalized tokens, most recently used last
+        self.cache = OrderedDict()
+        # Tokens and rows of the last completed search, for narrowing
+        self.previous = None
+        
+        # Queries run on their own connection so a stale one can be interrupted
+        self.conn = connect_database(db_path, check_same_thread=False)
+        self.index = SearchIndex(self.conn, cipher)
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        threading.Thread(target=self.worker, daemon=True).start()
+    
+    def schedule(self, term):
+        """Search for term once typing pauses, superseding any earlier request"""
+        self.generation += 1
+        if self.pending is not None:
+            self.root.after_cancel(self.pending)
+        generation = self.generation
+        self.pending = self.root.after(self.DEBOUNCE_MS, lambda: self.start(term, generation))
+    
+    def start(self, term, generation):
+        """Answer from the cache or previous results if possible, otherwise query SQLite"""
+        self.pending = None
+        self.waiting_for = None
+        self.started = time.perf_counter()
+        tokens = tuple(self.index.tokenize(term))
+        if not tokens:
+            self.on_results(None)
+            return
+        
+        rows = self.cache.get(tokens)
+        if rows is not None:
+            self.cache.move_to_end(tokens)
+            self.finish(tokens, rows)
+            return
+        
+        # A query that extends the last one can only match a subset of its rows,
+        # but a longer term can change how they rank
+        if self.previous is not None and self.extends(tokens, self.previous[0]):
+            rows = self.index.rank(self.previous[1], tokens)
+            self.finish(tokens, rows)
+            return
+        
+        # Abort whatever the worker is still running for an older term
+        self.conn.interrupt()
+        self.waiting_for = generation
+        self.requests.put((generation, term))
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.POLL_MS, self.poll)
+    
+    @staticmethod
+    def extends(tokens, previous_tokens):
+        """Return True if tokens refine previous_tokens (e.g. "git" -> "gith")"""
+        if len(tokens) < len(previous_tokens):
+            return False
+        last = len(previous_tokens) - 1
+        if tokens[:last] != previous_tokens[:last]:
+            return False
+        return tokens[last].startswith(previous_tokens[last])
+    
+    def worker(self):
+        """Run queued searches, skipping any that were superseded while waiting"""
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            # Only the newest pending request matters
+            while not self.requests.empty():
+                request = self.requests.get()
+                if request is None:
+                    self.conn.close()
+                    return
+            generation, term = request
+            rows = None
+            while generation == self.generation:
+                try:
+                    rows = self.index.search(term, lambda: generation != self.generation)
+                    break
+                except sqlite3.OperationalError:
+                    # Interrupted; retry only if this is still the newest query
+                    continue
+            if rows is not None:
+                self.results.put((generation, term, rows))
+        self.conn.close()
+    
+    def poll(self):
+        """Deliver finished worker results on the Tk thread"""
+        try:
+            while self.waiting_for is not None:
+                generation, term, rows = self.results.get_nowait()
+                if generation == self.waiting_for:
+                    self.waiting_for = None
+                    self.finish(tuple(self.index.tokenize(term)), rows)
+        except queue.Empty:
+            pass
+        
+        if self.waiting_for is None:
+            self.polling = False
+            return
+        self.root.after(self.POLL_MS, self.poll)
+    
+    def finish(self, tokens, rows):
+        """Remember rows for tokens and hand them to the view"""
+        self.cache[tokens] = rows
+        self.cache.move_to_end(tokens)
+        while len(self.cache) > self.CACHE_SIZE:
+            self.cache.popitem(last=False)
+        self.previous = (tokens, rows)
+        METRICS.record("search.results", time.perf_counter() - self.started)
+        self.on_results(rows)
+    
+    def invalidate(self):
+        """Drop cached results after the passwords table changes"""
+        self.cache.clear()
+        self.previous = None
+    
+    def close(self):
+        """Stop the worker thread"""
+        if self.pending is not None:
+            self.root.after_cancel(self.pending)
+            self.pending = None
+        self.generation += 1
+        self.waiting_for = None
+        self.conn.interrupt()
+        self.requests.put(None)
+
+
+# Results the quick switcher shows
+QUICK_SWITCH_LIMIT = 20
+# A word with a typo must keep this share of the term's trigrams to match
+QUICK_SWITCH_MIN_SIMILARITY = 0.6
+# Shorter terms and numbers are only prefix-matched; a typo leaves too little to go on
+QUICK_SWITCH_FUZZY_MIN_LENGTH = 3
+# Terms whose rarest trigrams still cover more words than this are too vague to fuzzy-match
+QUICK_SWITCH_FUZZY_MAX_WORDS = 2000
+# Match quality of a word that equals, starts with or resembles a search term
+QUICK_SWITCH_EXACT = 1.0
+QUICK_SWITCH_PREFIX = 0.9
+QUICK_SWITCH_FUZZY = 0.8
+# Matches in the email count for less than matches in the service name
+QUICK_SWITCH_EMAIL_WEIGHT = 0.8
+# Search terms whose match tiers are kept between keystrokes
+QUICK_SWITCH_CACHE_TERMS = 8
+# Words whose postings are counted to estimate the size of a match tier
+QUICK_SWITCH_ESTIMATE_SAMPLE = 64
+# Tiers of up to this many entries, and this many times the smallest tier in a
+# combination, are intersected as sets; others are checked against each entry's
+# words, and if even the smallest is too big it is scanned until enough match
+QUICK_SWITCH_SET_MAX_ENTRIES = 20000
+QUICK_SWITCH_SET_MAX_RATIO = 4
+
+# Frecency: each access is worth more the more recent the last one was (Firefox's buckets)
+FRECENCY_BUCKETS = ((4 * 86400, 100), (14 * 86400, 70), (31 * 86400, 50), (90 * 86400, 30))
+FRECENCY_OLDEST_WEIGHT = 10
+
+
+def frecency(access_count, last_accessed, now):
+    """Score how often and how recently an entry was used"""
+    age = now - last_accessed
+    for max_age, weight in FRECENCY_BUCKETS:
+        if age <= max_age:
+            return access_count * weight
+    return access_count * FRECENCY_OLDEST_WEIGHT
+
+
+def word_trigrams(word):
+    """Trigrams of a word, padded at the start so the first letters weigh more"""
+    padded = "  " + word
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MatchTier:
+    """Entries with one of a set of words in one field; they all score the same for a term"""
+    
+    def __init__(self, quality, field_words, word_count, word_ids, has_word):
+        self.quality = quality
+        self.field_words = field_words
+        # Words in the tier, for estimating its size
+        self.word_count = word_count
+        # Callable returning the word ids, so long prefix ranges are walked lazily
+        self.word_ids = word_ids
+        self.has_word = has_word
+        self.member_set = None
+    
+    def entries(self):
+        """Yield the ids of the entries in this tier; an entry may repeat"""
+        postings = self.field_words.postings
+        for word_id in self.word_ids():
+            yield from postings[word_id]
+    
+    def members(self):
+        """Set of the entry ids in this tier, built on first use"""
+        if self.member_set is None:
+            postings = self.field_words.postings
+            self.member_set = set().union(*[postings[word_id] for word_id in self.word_ids()])
+        return self.member_set
+    
+    def estimate(self):
+        """Approximate number of entries in this tier, extrapolated from its first words"""
+        postings = self.field_words.postings
+        count = sampled = 0
+        for word_id in self.word_ids():
+            count += len(postings[word_id])
+            sampled += 1
+            if sampled == QUICK_SWITCH_ESTIMATE_SAMPLE:
+                break
+        return count * self.word_count / sampled if sampled else 0
+    
+    def contains(self, entry_id, entry):
+        """Return True if an index entry has one of this tier's words"""
+        if self.member_set is not None:
+            return entry_id in self.member_set
+        return any(map(self.has_word, entry[self.field_words.field]))
+
+
+class FieldWords:
+    """Vocabulary of one field (service names or emails) with its trigram and entry postings"""
+    
+    def __init__(self, field, weight):
+        # Position of the field's word ids in a QuickSwitchIndex entry
+        self.field = field
+        self.weight = weight
+        self.word_ids = {}
+        self.words = []
+        # None while the index is first loaded, then kept sorted for prefix lookups
+        self.sorted_words = None
+        self.trigrams = {}
+        # Entry ids per word id
+        self.postings = []
+    
+    def word_id(self, word):
+        """Return the id of a word, adding it to the vocabulary if it is new"""
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            word_id = len(self.words)
+            self.word_ids[word] = word_id
+            self.words.append(word)
+            self.postings.append([])
+            for trigram in word_trigrams(word):
+                self.trigrams.setdefault(trigram, []).append(word_id)
+            if self.sorted_words is not None:
+                bisect.insort(self.sorted_words, word)
+        return word_id
+    
+    def add(self, entry_id, text):
+        """Index the words of one entry's field; returns their ids"""
+        word_ids = tuple(dict.fromkeys(self.word_id(word) for word in search_words(text)))
+        for word_id in word_ids:
+            self.postings[word_id].append(entry_id)
+        return word_ids
+    
+    def discard(self, entry_id, word_ids):
+        """Remove an entry from its words' postings; the words stay in the vocabulary"""
+        for word_id in word_ids:
+            self.postings[word_id].remove(entry_id)
+    
+    def fuzzy(self, term):
+        """Word id -> trigram similarity for words resembling term but not starting with it"""
+        if len(term) < QUICK_SWITCH_FUZZY_MIN_LENGTH or term.isdigit():
+            return {}
+        trigrams = word_trigrams(term)
+        required = math.ceil(len(trigrams) * QUICK_SWITCH_MIN_SIMILARITY)
+        # A word holding `required` of the trigrams holds one of the len - required + 1 rarest
+        postings = sorted((self.trigrams.get(trigram, ()) for trigram in trigrams), key=len)
+        seeds = postings[:len(trigrams) - required + 1]
+        if sum(map(len, seeds)) > QUICK_SWITCH_FUZZY_MAX_WORDS:
+            return {}
+        similar = {}
+        for word_id in set().union(*seeds):
+            word = self.words[word_id]
+            if not word.startswith(term):
+                similarity = len(trigrams & word_trigrams(word)) / len(trigrams)
+                if similarity >= QUICK_SWITCH_MIN_SIMILARITY:
+                    similar[word_id] = similarity
+        return similar
+    
+    def tiers(self, term):
+        """MatchTiers for the words equal to, starting with and resembling term"""
+        words = self.words
+        tiers = []
+        exact = self.word_ids.get(term)
+        if exact is not None:
+            tiers.append(MatchTier(QUICK_SWITCH_EXACT * self.weight, self, 1, lambda: (exact,), exact.__eq__))
+        
+        lo = bisect.bisect_left(self.sorted_words, term)
+        # Every word starting with term sorts before term followed by the highest code point
+        hi = bisect.bisect_left(self.sorted_words, term + "\U0010ffff", lo)
+        prefixed_count = hi - lo - (exact is not None)
+        if prefixed_count:
+            def prefixed():
+                for index in range(lo, hi):
+                    word = self.sorted_words[index]
+                    if word != term:
+                        yield self.word_ids[word]
+            
+            tiers.append(MatchTier(QUICK_SWITCH_PREFIX * self.weight, self, prefixed_count, prefixed,
+                                   lambda word_id: word_id != exact and words[word_id].startswith(term)))
+        
+        # Similar words are grouped by rounded similarity to keep the tiers few
+        groups = {}
+        for word_id, similarity in self.fuzzy(term).items():
+            groups.setdefault(round(QUICK_SWITCH_FUZZY * similarity, 1), set()).add(word_id)
+        for quality, word_ids in groups.items():
+            tiers.append(MatchTier(quality * self.weight, self, len(word_ids),
+                                   lambda word_ids=word_ids: word_ids, word_ids.__contains__))
+        return tiers
+
+
+def best_combinations(tier_lists):
+    """Yield (total quality, tiers) picking one tier per term, best total first"""
+    start = (0,) * len(tier_lists)
+    
+    def total(indices):
+        return sum(tiers[index].quality for tiers, index in zip(tier_lists, indices))
+    
+    heap = [(-total(start), start)]
+    seen = {start}
+    while heap:
+        negated, indices = heapq.heappop(heap)
+        yield -negated, [tiers[index] for tiers, index in zip(tier_lists, indices)]
+        for position, index in enumerate(indices):
+            if index + 1 < len(tier_lists[position]):
+                successor = indices[:position] + (index + 1,) + indices[position + 1:]
+                if successor not in seen:
+                    seen.add(successor)
+                    heapq.heappush(heap, (-total(successor), successor))
+
+
+class QuickSwitchIndex:
+    """In-memory fuzzy index over decrypted service names and emails, ranked by frecency
+    
+    Each field has its own vocabulary. A search term matches words it equals
+    or starts with, and through a trigram index words holding most of its
+    trigrams, which tolerates a typo. Every word it matches puts the word's
+    entries into a tier of equal quality; entries are collected from the
+    best combination of tiers down and the search stops once enough are
+    found, so a keystroke costs about the same on a 100k-entry vault as on a
+    small one. Entries the user has opened are few and are scored one by one
+    with their frecency.
+    
+    It holds plaintext metadata and lives only while the vault is unlocked.
+    Updates come from the Tk thread.
+    """
+    
+    SERVICE, EMAIL = 2, 3
+    
+    def __init__(self, entries=(), usage=()):
+        self.fields = (FieldWords(self.SERVICE, 1.0), FieldWords(self.EMAIL, QUICK_SWITCH_EMAIL_WEIGHT))
+        # Entry id -> (service, email, service word ids, email word ids)
+        self.entries = {}
+        # Entry id -> (access count, last access time)
+        self.usage = {}
+        # Match tiers per term, dropped whenever an entry changes
+        self.tier_cache = OrderedDict()
+        for entry in entries:
+            self.add(entry)
+        for field in self.fields:
+            field.sorted_words = sorted(field.word_ids)
+        for entry_id, access_count, last_accessed in usage:
+            if entry_id in self.entries:
+                self.usage[entry_id] = (access_count, last_accessed)
+    
+    @classmethod
+    def load(cls, conn, cipher):
+        """Build the index from every entry in the database, decrypting the metadata"""
+        with METRICS.timer("quick_switch.build"):
+            usage = conn.execute("SELECT entry_id, access_count, last_accessed FROM entry_usage").fetchall()
+            rows = conn.execute(f"SELECT {ENTRY_COLUMNS} FROM passwords ORDER BY id")
+            return cls((cipher.entry(row) for row in rows), usage)
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def add(self, entry):
+        """Index an (id, service, email) row"""
+        entry_id, service, email = entry
+        service_field, email_field = self.fields
+        self.entries[entry_id] = (service, email, service_field.add(entry_id, service),
+                                  email_field.add(entry_id, email))
+        self.tier_cache.clear()
+    
+    def remove(self, entry_id):
+        """Forget an entry and its usage"""
+        entry = self.entries.pop(entry_id, None)
+        self.usage.pop(entry_id, None)
+        if entry is not None:
+            for field in self.fields:
+                field.discard(entry_id, entry[field.field])
+            self.tier_cache.clear()
+    
+    def replace(self, entry):
+        """Re-index an edited entry, keeping its usage"""
+        usage = self.usage.get(entry[0])
+        self.remove(entry[0])
+        self.add(entry)
+        if usage is not None:
+            self.usage[entry[0]] = usage
+    
+    def record_use(self, entry_id, when):
+        """Count one access to an entry"""
+        if entry_id in self.entries:
+            access_count = self.usage.get(entry_id, (0, 0))[0]
+            self.usage[entry_id] = (access_count + 1, when)
+    
+    def term_tiers(self, term):
+        """MatchTiers of a term over both fields, best first"""
+        tiers = self.tier_cache.get(term)
+        if tiers is None:
+            tiers = sorted((tier for field in self.fields for tier in field.tiers(term)),
+                           key=lambda tier: -tier.quality)
+            self.tier_cache[term] = tiers
+            while len(self.tier_cache) > QUICK_SWITCH_CACHE_TERMS:
+                self.tier_cache.popitem(last=False)
+        else:
+            self.tier_cache.move_to_end(term)
+        return tiers
+    
+    def entry_quality(self, entry_id, tier_lists):
+        """Summed quality of an entry's best tier for each term, 0 unless every term matches"""
+        entry = self.entries[entry_id]
+        total = 0.0
+        for tiers in tier_lists:
+            quality = next((tier.quality for tier in tiers if tier.contains(entry_id, entry)), 0.0)
+            if not quality:
+                return 0.0
+            total += quality
+        return total
+    
+    def best_unused(self, tier_lists, limit):
+        """Top (quality, entry id) pairs among entries that were never opened"""
+        found = {}
+        for total, tiers in best_combinations(tier_lists):
+            if len(found) >= limit:
+                break
+            if len(tiers) == 1:
+                candidates, others = tiers[0].entries(), []
+            else:
+                # Sets are kept with the term's tiers, so the next keystroke reuses them
+                estimates = [tier.estimate() for tier in tiers]
+                max_size = min(QUICK_SWITCH_SET_MAX_RATIO * min(estimates), QUICK_SWITCH_SET_MAX_ENTRIES)
+                sets = [tier.members() for tier, estimate in zip(tiers, estimates) if estimate <= max_size]
+                others = [tier for tier, estimate in zip(tiers, estimates) if estimate > max_size]
+                if sets:
+                    candidates = set.intersection(*sorted(sets, key=len))
+                else:
+                    smallest = min(others, key=MatchTier.estimate)
+                    others.remove(smallest)
+                    candidates = smallest.entries()
+            # An entry found already got there through a better combination
+            for entry_id in candidates:
+                if entry_id in found or entry_id in self.usage:
+                    continue
+                entry = self.entries[entry_id]
+                if all(tier.contains(entry_id, entry) for tier in others):
+                    found[entry_id] = total
+                    if len(found) >= limit:
+                        break
+        return [(quality, entry_id) for entry_id, quality in found.items()]
+    
+    def search(self, query, limit=QUICK_SWITCH_LIMIT, now=None):
+        """Return up to limit (id, service, email) rows for query, best first
+        
+        An empty query returns the most frecent entries.
+        """
+        now = time.time() if now is None else now
+        terms = list(dict.fromkeys(search_words(query)))
+        if not terms:
+            return self.recent(limit, now)
+        with METRICS.timer("quick_switch.search"):
+            tier_lists = [self.term_tiers(term) for term in terms]
+            if not all(tier_lists):
+                return []
+            ranked = []
+            for entry_id, (access_count, last_accessed) in self.usage.items():
+                quality = self.entry_quality(entry_id, tier_lists)
+                if quality:
+                    boost = 1 + math.log1p(frecency(access_count, last_accessed, now))
+                    ranked.append((quality * boost, entry_id))
+            ranked.extend(self.best_unused(tier_lists, limit))
+            ranked.sort(key=lambda item: (-item[0], item[1]))
+            return [(entry_id,) + self.entries[entry_id][:2] for _, entry_id in ranked[:limit]]
+    
+    def recent(self, limit=QUICK_SWITCH_LIMIT, now=None):
+        """Return the limit most frecent (id, service, email) rows"""
+        now = time.time() if now is None else now
+        ranked = heapq.nlargest(limit, self.usage.items(), key=lambda item: frecency(*item[1], now))
+        return [(entry_id,) + self.entries[entry_id][:2] for entry_id, _ in ranked]
+
+
+# Most write jobs grouped into one transaction by the writer thread
+GROUP_COMMIT_MAX_JOBS = 64
+
+
+class VaultStorage:
+    """Vault database access: one writer thread with group commit, a connection per reader thread"""
+    
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        
+        # Create and migrate the schema once up front
+        open_database(db_path).close()
+        
+        self.local = threading.local()
+        self.jobs = queue.Queue()
+        # Exclusive jobs queued or running, counted for busy()
+        self.exclusive_jobs = 0
+        self.exclusive_lock = threading.Lock()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+    
+    def reader(self):
+        """Return this thread's read connection, opening it on first use"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = connect_database(self.db_path)
+            self.local.conn = conn
+        return conn
+    
+    def submit(self, job, exclusive=False):
+        """Queue job(conn) for the writer thread; returns a Future with its result"""
+        # Regular jobs share a transaction with whatever else is queued, isolated
+        # by savepoints; exclusive jobs (bulk imports) run alone and commit themselves
+        future = Future()
+        if exclusive:
+            with self.exclusive_lock:
+                self.exclusive_jobs += 1
+        self.jobs.put((job, future, exclusive))
+        return future
+    
+    def busy(self):
+        """Return True while an exclusive job (a bulk import, sync or upgrade) is queued or running"""
+        return self.exclusive_jobs > 0
+    
+    def write_loop(self):
+        """Apply queued write jobs, committing each group of jobs once"""
+        conn = connect_database(self.db_path)
+        carry = None
+        stopping = False
+        while not stopping:
+            item = carry if carry is not None else self.jobs.get()
+            carry = None
+            if item is None:
+                break
+            
+            job, future, exclusive = item
+            if exclusive:
+                with METRICS.timer("db.write_exclusive"):
+                    self.run_exclusive(conn, job, future)
+                continue
+            
+            # Gather whatever else is already waiting into the same transaction
+            group = [(job, future)]
+            while len(group) < GROUP_COMMIT_MAX_JOBS:
+                try:
+                    item = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                if item[2]:
+                    carry = item
+                    break
+                group.append(item[:2])
+            with METRICS.timer("db.write_group"):
+                self.run_group(conn, group)
+        conn.close()
+    
+    def run_exclusive(self, conn, job, future):
+        """Run a job that commits on its own"""
+        try:
+            result = job(conn)
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.rollback()
+            future.set_exception(e)
+            return
+        finally:
+            with self.exclusive_lock:
+                self.exclusive_jobs -= 1
+        future.set_result(result)
+    
+    def run_group(self, conn, group):
+        """Run jobs in one transaction, rolling back only the jobs that fail"""
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job, future in group:
+                conn.execute("SAVEPOINT job")
+                try:
+                    outcomes.append((future, job(conn), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(future, None, e) for _, future in group]
+        
+        # Results are only reported once they are durable
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+    
+    def close(self):
+        """Finish queued writes and stop the writer thread"""
+        self.jobs.put(None)
+        self.writer.join()
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+class TableRowSource:
+    """Page through the passwords table in id order without loading it all"""
+    
+    def __init__(self, conn, cipher):
+        self.conn = conn
+        # Only the rows on screen have their metadata decrypted
+        self.cipher = cipher
+        self.total = None
+    
+    def count(self):
+        """Return the number of rows, cached until invalidate()"""
+        if self.total is None:
+            with METRICS.timer("db.count"):
+                self.total = self.conn.execute("SELECT COUNT(*) FROM passwords").fetchone()[0]
+        return self.total
+    
+    def invalidate(self):
+        """Forget the cached row count"""
+        self.total = None
+    
+    def add(self, row):
+        """Account for a newly inserted row; new ids always sort last"""
+        if self.total is not None:
+            self.total += 1
+        return True
+    
+    def replace(self, row):
+        """Account for an updated row; returns False if it should leave the view"""
+        return True
+    
+    def remove(self, row_id):
+        """Account for a deleted row; the position is unknown without a query"""
+        if self.total is not None:
+            self.total -= 1
+        return None
+    
+    def fetch_after(self, offset, last_id, limit):
+        """Return up to limit rows following last_id"""
+        return self.decrypt(self.conn.execute(
+            f"SELECT {ENTRY_COLUMNS} FROM passwords WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id if last_id is not None else -1, limit)
+        ).fetchall())
+    
+    def decrypt(self, rows):
+        return [self.cipher.entry(row) for row in rows]
+    
+    def is_before(self, row_id, first_row):
+        """Return True if row_id sorts before first_row"""
+        return row_id < first_row[0]
+    
+    def fetch(self, offset, limit, previous=None):
+        """Return up to limit (id, service_name, email) rows starting at offset"""
+        with METRICS.timer("db.page"):
+            return self.fetch_window(offset, limit, previous)
+    
+    def fetch_window(self, offset, limit, previous):
+        # Scrolling by less than a window reuses the rows already on screen and
+        # fetches only the missing ones with a keyset query on id
+        if previous is not None:
+            old_offset, old_rows = previous
+            delta = offset - old_offset
+            if old_rows and len(old_rows) == limit and 0 < delta < limit:
+                tail = self.decrypt(self.conn.execute(
+                    f"SELECT {ENTRY_COLUMNS} FROM passwords WHERE id > ? ORDER BY id LIMIT ?",
+                    (old_rows[-1][0], delta)
+                ).fetchall())
+                return old_rows[delta:] + tail
+            if old_rows and 0 < -delta < limit:
+                head = self.decrypt(self.conn.execute(
+                    f"SELECT {ENTRY_COLUMNS} FROM passwords WHERE id < ? ORDER BY id DESC LIMIT ?",
+                    (old_rows[0][0], -delta)
+                ).fetchall())
+                if len(head) == -delta:
+                    return head[::-1] + old_rows[:limit + delta]
+        
+        # Large jumps (dragging the scrollbar) fall back to OFFSET
+        return self.decrypt(self.conn.execute(
+            f"SELECT {ENTRY_COLUMNS} FROM passwords ORDER BY id LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall())
+
+
+class ListRowSource:
+    """Row source over an in-memory list, e.g. search results"""
+    
+    def __init__(self, rows, matcher=None):
+        self.rows = list(rows)
+        # Decides whether inserted or edited rows belong in this list
+        self.matcher = matcher
+    
+    def count(self):
+        """Return the number of rows"""
+        return len(self.rows)
+    
+    def invalidate(self):
+        """Nothing is cached for in-memory rows"""
+    
+    def position(self, row_id):
+        """Return the index of row_id in the list, or None"""
+        for index, row in enumerate(self.rows):
+            if row[0] == row_id:
+                return index
+        return None
+    
+    def add(self, row):
+        """Append a new row if it matches; returns True if it was added"""
+        if self.matcher is not None and not self.matcher(row):
+            return False
+        self.rows.append(row)
+        return True
+    
+    def replace(self, row):
+        """Update a row in place; returns False if it no longer matches"""
+        if self.matcher is not None and not self.matcher(row):
+            return False
+        index = self.position(row[0])
+        if index is not None:
+            self.rows[index] = row
+        return True
+    
+    def remove(self, row_id):
+        """Remove a row and return where it was, or None"""
+        index = self.position(row_id)
+        if index is not None:
+            del self.rows[index]
+        return index
+    
+    def fetch_after(self, offset, last_id, limit):
+        """Return up to limit rows starting at offset"""
+        return self.rows[offset:offset + limit]
+    
+    def is_before(self, row_id, first_row):
+        """Positions are tracked directly, so this is never needed"""
+        return False
+    
+    def fetch(self, offset, limit, previous=None):
+        """Return up to limit rows starting at offset"""
+        return self.rows[offset:offset + limit]
+
+
+class VirtualTreeview:
+    """Render only the visible window of a row source into a Treeview"""
+    
+    def __init__(self, tree, scrollbar, row_height, heading_height):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row_height = row_height
+        self.heading_height = heading_height
+        self.source = None
+        self.offset = 0
+        self.visible_rows = 1
+        self.rows = []
+        self.selected_id = None
+        # Tree item for each entry id in the visible window
+        self.item_ids = {}
+        
+        # The scrollbar drives our offset instead of the Treeview's own scrolling
+        self.scrollbar.configure(command=self.on_scroll)
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_by(3))
+        self.tree.bind("<Up>", lambda event: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda event: self.move_selection(1))
+        self.tree.bind("<Prior>", lambda event: self.move_selection(-self.visible_rows))
+        self.tree.bind("<Next>", lambda event: self.move_selection(self.visible_rows))
+        self.tree.bind("<Home>", lambda event: self.move_selection(-self.total()))
+        self.tree.bind("<End>", lambda event: self.move_selection(self.total()))
+    
+    def set_source(self, source):
+        """Show a new row source from the top"""
+        self.source = source
+        self.offset = 0
+        self.rows = []
+        self.refresh()
+    
+    def total(self):
+        """Return the number of rows in the current source"""
+        return self.source.count() if self.source is not None else 0
+    
+    def refresh(self, previous=None):
+        """Fetch and draw the rows at the current offset"""
+        if self.source is None:
+            return
+        with METRICS.timer("tree.refresh"):
+            total = self.source.count()
+            self.offset = max(0, min(self.offset, total - self.visible_rows))
+            self.rows = self.source.fetch(self.offset, self.visible_rows, previous)
+            self.render()
+            self.update_scrollbar(total)
+    
+    def render(self):
+        """Reuse a fixed pool of Treeview items for the current window"""
+        items = self.tree.get_children()
+        for index, row in enumerate(self.rows):
+            if index < len(items):
+                self.tree.item(items[index], values=row)
+            else:
+                self.tree.insert("", tk.END, values=row)
+        if len(items) > len(self.rows):
+            self.tree.delete(*items[len(self.rows):])
+        
+        items = self.tree.get_children()
+        self.item_ids = {row[0]: item for item, row in zip(items, self.rows)}
+        self.restore_selection()
+    
+    def restore_selection(self):
+        """Keep the selection on the same entry while it stays in view"""
+        item = self.item_ids.get(self.selected_id)
+        selected = (item,) if item is not None else ()
+        if selected != self.tree.selection():
+            self.tree.selection_set(selected)
+    
+    def apply_insert(self, row):
+        """Show a newly inserted row without reloading the window"""
+        if self.source is None or not self.source.add(row):
+            return
+        total = self.source.count()
+        
+        # New rows sort last, so they only appear if the window reaches the end
+        if len(self.rows) < self.visible_rows and self.offset + len(self.rows) == total - 1:
+            self.rows.append(row)
+            self.item_ids[row[0]] = self.tree.insert("", tk.END, values=row)
+        self.update_scrollbar(total)
+    
+    def apply_update(self, row):
+        """Redraw a single edited row if it is on screen"""
+        if self.source is None:
+            return
+        if not self.source.replace(row):
+            self.apply_delete(row[0])
+            return
+        
+        item = self.item_ids.get(row[0])
+        if item is not None:
+            self.rows[self.tree.index(item)] = row
+            self.tree.item(item, values=row)
+    
+    def apply_delete(self, row_id):
+        """Remove a single row, pulling one more row into the window if needed"""
+        if self.source is None:
+            return
+        position = self.source.remove(row_id)
+        total = self.source.count()
+        
+        item = self.item_ids.pop(row_id, None)
+        if item is None:
+            # Rows removed above the window shift everything up by one
+            if position is not None and position < self.offset:
+                self.offset -= 1
+            elif position is None and self.rows and self.source.is_before(row_id, self.rows[0]):
+                self.offset -= 1
+            self.update_scrollbar(total)
+            return
+        
+        del self.rows[self.tree.index(item)]
+        self.tree.delete(item)
+        
+        if self.offset > 0 and self.offset + self.visible_rows > total:
+            # At the end of the list: slide the window up one row instead
+            previous = (self.offset, self.rows)
+            self.offset -= 1
+            self.rows = self.source.fetch(self.offset, self.visible_rows, previous)
+            self.render()
+            self.update_scrollbar(total)
+            return
+        
+        # Fill the freed slot from the row just below the window
+        last_id = self.rows[-1][0] if self.rows else None
+        for new_row in self.source.fetch_after(self.offset + len(self.rows), last_id, 1):
+            self.rows.append(new_row)
+            self.item_ids[new_row[0]] = self.tree.insert("", tk.END, values=new_row)
+        self.update_scrollbar(total)
+    
+    def update_scrollbar(self, total):
+        """Size the scrollbar thumb to the visible fraction of the source"""
+        if total == 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        first = self.offset / total
+        last = min(1.0, (self.offset + len(self.rows)) / total)
+        self.scrollbar.set(first, last)
+    
+    def scroll_to(self, offset):
+        """Move the window so it starts at offset"""
+        previous = (self.offset, self.rows)
+        self.offset = offset
+        self.refresh(previous)
+    
+    def scroll_by(self, delta):
+        """Scroll the window by delta rows"""
+        self.scroll_to(self.offset + delta)
+        return "break"
+    
+    def on_scroll(self, action, amount, unit=None):
+        """Handle scrollbar drags and arrow clicks"""
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total()))
+        elif unit == "pages":
+            self.scroll_by(int(amount) * self.visible_rows)
+        else:
+            self.scroll_by(int(amount))
+    
+    def on_mousewheel(self, event):
+        """Scroll on mouse wheel (Windows and macOS deltas)"""
+        step = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll_by(-3 * step)
+    
+    def on_resize(self, event):
+        """Recompute how many rows fit when the widget changes size"""
+        visible_rows = max(1, (event.height - self.heading_height) // self.row_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.refresh()
+    
+    def on_select(self, event=None):
+        """Remember the selected entry by id so it survives scrolling"""
+        selection = self.tree.selection()
+        if selection:
+            self.selected_id = self.rows[self.tree.index(selection[0])][0]
+    
+    def move_selection(self, delta):
+        """Move the selection by delta rows, scrolling the window when it leaves view"""
+        total = self.total()
+        if total == 0:
+            return "break"
+        
+        # Absolute position of the current selection in the whole source;
+        # without a selection the first visible row is selected
+        selection = self.tree.selection()
+        if selection:
+            position = max(0, min(self.offset + self.tree.index(selection[0]) + delta, total - 1))
+        else:
+            position = self.offset
+        
+        if position < self.offset:
+            self.scroll_to(position)
+        elif position >= self.offset + self.visible_rows:
+            self.scroll_to(position - self.visible_rows + 1)
+        
+        item = self.tree.get_children()[position - self.offset]
+        self.tree.selection_set(item)
+        self.tree.focus(item)
+        self.on_select()
+        return "break"
+
+
+# Records per encrypt/insert batch during bulk import
+IMPORT_BATCH_SIZE = 2000
+
+# Column names used by common exports (Chrome, Firefox, Bitwarden, KeePass), best first
+IMPORT_SERVICE_FIELDS = ("name", "title", "account", "service", "service_name")
+IMPORT_URL_FIELDS = ("url", "login_uri", "web site", "website", "origin_url", "uri")
+IMPORT_EMAIL_FIELDS = ("username", "login_username", "login name", "user name", "email", "login", "user")
+IMPORT_PASSWORD_FIELDS = ("password", "login_password")
+
+
+def _first_field(record, fields):
+    """Return the first non-empty value in record among fields"""
+    for field in fields:
+        value = record.get(field)
+        if value:
+            return value
+    return ""
+
+
+def normalize_import_record(record):
+    """Map one exported entry to (service, email, password), or None if it has no password"""
+    lowered = {str(key).strip().lower(): value for key, value in record.items() if isinstance(value, str)}
+    password = _first_field(lowered, IMPORT_PASSWORD_FIELDS)
+    
+    # Fall back to the site's host name when the export has no title column
+    service = _first_field(lowered, IMPORT_SERVICE_FIELDS).strip()
+    if not service:
+        url = _first_field(lowered, IMPORT_URL_FIELDS).strip()
+        service = (urlsplit(url).hostname or url) if url else ""
+    
+    if not service or not password:
+        return None
+    return service, _first_field(lowered, IMPORT_EMAIL_FIELDS).strip(), password
+
+
+def iter_csv_records(path):
+    """Stream records from a CSV export with a header row"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            yield normalize_import_record(row)
+
+
+def _flatten_bitwarden_item(item):
+    """Turn a Bitwarden JSON item into a flat record"""
+    login = item.get("login") or {}
+    uris = login.get("uris") or [{}]
+    return {
+        "name": item.get("name") or "",
+        "username": login.get("username") or "",
+        "password": login.get("password") or "",
+        "uri": uris[0].get("uri") or "",
+    }
+
+
+def iter_json_records(path):
+    """Stream records from a Bitwarden export or a JSON list of entries"""
+    with open(path, "rb") as f:
+        head = f.read(4096).lstrip()
+        f.seek(0)
+        
+        if head.startswith(b"{"):
+            # Bitwarden: {"encrypted": false, "items": [...]}
+            if re.search(rb'"encrypted"\s*:\s*true', head):
+                raise ValueError("Encrypted Bitwarden exports are not supported; export unencrypted JSON")
+            items = _iter_json_array(f, "items")
+            flatten = _flatten_bitwarden_item
+        else:
+            # KeePass plugins and scripts: a plain list of entry objects
+            items = _iter_json_array(f, None)
+            flatten = dict
+        
+        for item in items:
+            if isinstance(item, dict) and item.get("type", 1) == 1:
+                yield normalize_import_record(flatten(item))
+
+
+def _iter_json_array(f, key):
+    """Yield elements of the top-level array (or the array under key) from f"""
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+    
+    if ijson is not None:
+        # Incremental parser keeps memory flat for very large exports
+        yield from ijson.items(f, f"{key}.item" if key else "item")
+        return
+    
+    data = json.load(f)
+    yield from (data.get(key) or []) if key else data
+
+
+def iter_import_records(path, fmt=None):
+    """Stream normalized records from an export file, picking the parser by extension"""
+    if fmt is None:
+        fmt = "json" if path.lower().endswith(".json") else "csv"
+    if fmt == "json":
+        return iter_json_records(path)
+    if fmt == "csv":
+        return iter_csv_records(path)
+    raise ValueError(f"Unknown import format: {fmt}")
+
+
+# Per-process cipher and fingerprint key for parallel encryption, set up by the pool initializer
+_worker_cipher = None
+_worker_fingerprint_key = None
+
+
+def _init_cipher_worker(key):
+    """Create the vault cipher and fingerprint key once per worker process"""
+    global _worker_cipher, _worker_fingerprint_key
+    _worker_cipher = VaultCipher(key)
+    _worker_fingerprint_key = fingerprint_key(key)
+
+
+def _encrypt_batch(records):
+    """Seal, encrypt and fingerprint (service, email, password) records for insert_entry()"""
+    return [(_worker_cipher.seal_entry(service, email), _worker_cipher.encrypt(password),
+             password_fingerprint(_worker_fingerprint_key, password)) for service, email, password in records]
+
+
+class BulkImporter:
+    """Encrypt and insert imported records in batches inside a single transaction"""
+    
+    def __init__(self, conn, key, batch_size=IMPORT_BATCH_SIZE, workers=None):
+        self.conn = conn
+        self.key = key
+        self.index_key = blind_index_key(key)
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else min(os.cpu_count() or 1, 8)
+    
+    def batches(self, records, stats):
+        """Group new, valid records into batches, skipping duplicates"""
+        seen = set()
+        batch = []
+        for record in records:
+            stats["read"] += 1
+            if record is None:
+                stats["invalid"] += 1
+                continue
+            
+            # Duplicates within the file are skipped here, those already in the vault per batch
+            pair = (record[0], record[1])
+            if pair in seen:
+                stats["skipped"] += 1
+                continue
+            seen.add(pair)
+            
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                fresh = self.new_records(batch, stats)
+                if fresh:
+                    yield fresh
+                batch = []
+        fresh = self.new_records(batch, stats)
+        if fresh:
+            yield fresh
+    
+    def new_records(self, batch, stats):
+        """Drop records whose service and email are already in the vault, with one lookup per batch"""
+        keys = [entry_key(self.index_key, service, email) for service, email, _ in batch]
+        existing = set()
+        for start in range(0, len(keys), STORE_BATCH_SIZE):
+            chunk = keys[start:start + STORE_BATCH_SIZE]
+            existing.update(row[0] for row in self.conn.execute(
+                f"SELECT entry_key FROM passwords WHERE entry_key IN ({','.join('?' * len(chunk))})", chunk))
+        if not existing:
+            return batch
+        fresh = [record for record, key in zip(batch, keys) if key not in existing]
+        stats["skipped"] += len(batch) - len(fresh)
+        return fresh
+    
+    def insert(self, batch, encrypted, stats, progress):
+        """Write one encrypted batch"""
+        insert_entries(self.conn, encrypted)
+        stats["imported"] += len(batch)
+        if progress:
+            progress(dict(stats))
+    
+    def run(self, records, progress=None):
+        """Import records; returns counts of read, imported, skipped and invalid entries"""
+        stats = {"read": 0, "imported": 0, "skipped": 0, "invalid": 0}
+        # Duplicate checks go through entry keys, which older rows only get from the migration
+        MetadataMigration(self.conn, self.key, workers=self.workers).run()
+        pool = None
+        pending = deque()
+        try:
+            if self.workers > 1:
+                pool = process_pool(self.workers, _init_cipher_worker, (self.key,))
+            else:
+                _init_cipher_worker(self.key)
+            
+            for batch in self.batches(records, stats):
+                if pool is None:
+                    self.insert(batch, _encrypt_batch(batch), stats, progress)
+                    continue
+                
+                # Keep a bounded number of batches in flight so memory stays flat
+                pending.append((batch, pool.submit(_encrypt_batch, batch)))
+                while len(pending) > self.workers * 2:
+                    done_batch, future = pending.popleft()
+                    self.insert(done_batch, future.result(), stats, progress)
+            
+            while pending:
+                done_batch, future = pending.popleft()
+                self.insert(done_batch, future.result(), stats, progress)
+            
+            # Everything lands in one transaction
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return stats
+
+
+# Backup file layout: magic, version byte, header length, JSON header, then frames
+BACKUP_MAGIC = b"PMBK"
+BACKUP_VERSION = 1
+# Rows per compressed, encrypted frame; bounds memory for any vault size
+BACKUP_CHUNK_ROWS = 1000
+
+
+def _backup_nonce(prefix, counter, final):
+    """Build the per-frame AES-GCM nonce: random prefix, frame counter, last-frame flag"""
+    return prefix + struct.pack(">I", counter) + (b"\x01" if final else b"\x00")
+
+
+def write_backup(conn, vault_key, path, passphrase, kdf_params, progress=None):
+    """Stream every entry into an encrypted, compressed backup file; returns the entry count"""
+    # The backup has its own salt so it can be restored into any vault with passphrase
+    salt = secrets.token_bytes(16)
+    nonce_prefix = secrets.token_bytes(7)
+    load_crypto()
+    aead = AESGCM(derive_key_bytes(passphrase, salt, kdf_params))
+    cipher = VaultCipher(vault_key)
+    
+    body = json.dumps({
+        "kdf": kdf_params,
+        "salt": base64.b64encode(salt).decode("ascii"),
+        "nonce_prefix": base64.b64encode(nonce_prefix).decode("ascii"),
+    }).encode("utf-8")
+    header = BACKUP_MAGIC + bytes([BACKUP_VERSION]) + struct.pack(">I", len(body)) + body
+    
+    # Each frame authenticates the header, its position and whether it is the last one,
+    # so reordered, dropped or truncated frames are detected on restore
+    def write_frame(f, counter, payload, final):
+        ciphertext = aead.encrypt(_backup_nonce(nonce_prefix, counter, final), zlib.compress(payload), header)
+        f.write(struct.pack(">BI", int(final), len(ciphertext)))
+        f.write(ciphertext)
+    
+    tmp_path = path + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    count = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            cursor = conn.execute(f"SELECT {ENTRY_COLUMNS}, encrypted_password FROM passwords ORDER BY id")
+            counter = 0
+            while True:
+                rows = cursor.fetchmany(BACKUP_CHUNK_ROWS)
+                if not rows:
+                    break
+                lines = []
+                for row in rows:
+                    _, service, email = cipher.entry(row[:5])
+                    lines.append(json.dumps({
+                        "service": service,
+                        "email": email,
+                        "password": cipher.decrypt(row[5]).decode("utf-8"),
+                    }))
+                write_frame(f, counter, "\n".join(lines).encode("utf-8"), False)
+                counter += 1
+                count += len(rows)
+                if progress:
+                    progress(count)
+            
+            # An empty final frame marks a complete backup
+            write_frame(f, counter, b"", True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
+
+class WrongBackupPasswordError(ValueError):
+    """The first frame of a backup does not decrypt with the given password"""
+
+
+class BackupReader:
+    """Stream (service, email, password) records back out of a backup file"""
+    
+    def __init__(self, path, passphrase):
+        self.path = path
+        with open(path, "rb") as f:
+            prefix = f.read(len(BACKUP_MAGIC) + 5)
+            if len(prefix) < len(BACKUP_MAGIC) + 5 or not prefix.startswith(BACKUP_MAGIC):
+                raise ValueError("Not a password manager backup file")
+            version = prefix[len(BACKUP_MAGIC)]
+            if version > BACKUP_VERSION:
+                raise ValueError(f"Backup version {version} is newer than this application supports")
+            (length,) = struct.unpack(">I", prefix[len(BACKUP_MAGIC) + 1:])
+            body = f.read(length)
+            self.header = prefix + body
+            self.data_offset = f.tell()
+            
+            # Nothing here is authenticated until frame 0 decrypts, so check it before using it
+            if len(body) < length:
+                raise ValueError("Backup file is truncated")
+            meta = json.loads(body.decode("utf-8"))
+            if not isinstance(meta, dict) or not all(
+                    isinstance(meta.get(field), str) for field in ("salt", "nonce_prefix")):
+                raise ValueError("Backup header is malformed")
+            try:
+                self.nonce_prefix = base64.b64decode(meta["nonce_prefix"], validate=True)
+                salt = base64.b64decode(meta["salt"], validate=True)
+            except ValueError:
+                raise ValueError("Backup header is malformed")
+            if len(self.nonce_prefix) != 7 or len(salt) < 16:
+                raise ValueError("Backup header is malformed")
+            check_kdf_params(meta.get("kdf"))
+            load_crypto()
+            self.aead = AESGCM(derive_key_bytes(passphrase, salt, meta["kdf"]))
+            
+            # Fail early on a wrong passphrase rather than part way through a restore
+            try:
+                self.read_frame(f, 0)
+            except InvalidTag:
+                raise WrongBackupPasswordError("Wrong backup password or corrupted backup file")
+    
+    def read_frame(self, f, counter):
+        """Read and decrypt one frame; returns (payload, final)
+        
+        Raises InvalidTag if the frame does not decrypt and ValueError if the file is malformed.
+        """
+        head = f.read(5)
+        if len(head) < 5:
+            raise ValueError("Backup file is truncated")
+        final, length = struct.unpack(">BI", head)
+        ciphertext = f.read(length)
+        if len(ciphertext) < length:
+            raise ValueError("Backup file is truncated")
+        payload = self.aead.decrypt(_backup_nonce(self.nonce_prefix, counter, bool(final)),
+                                    ciphertext, self.header)
+        return zlib.decompress(payload), bool(final)
+    
+    def records(self):
+        """Yield (service, email, password) tuples, one frame in memory at a time"""
+        with open(self.path, "rb") as f:
+            f.seek(self.data_offset)
+            counter = 0
+            while True:
+                try:
+                    payload, final = self.read_frame(f, counter)
+                except InvalidTag:
+                    # Frame 0 decrypted when the reader was opened, so the key is right
+                    raise ValueError("Backup file is corrupted, or its frames were reordered or dropped")
+                if payload:
+                    for line in payload.split(b"\n"):
+                        record = json.loads(line)
+                        yield record["service"], record["email"], record["password"]
+                if final:
+                    if f.read(1):
+                        raise ValueError("Unexpected data after the end of the backup")
+                    return
+                counter += 1
+
+
+# Rows per re-encryption batch; each batch commits together with its checkpoint
+REKEY_BATCH_SIZE = 2000
+
+# Per-process ciphers for parallel re-encryption, set up by the pool initializer
+_worker_old_cipher = None
+
+
+def _init_rekey_worker(old_key, new_key):
+    """Create the old and new vault ciphers once per worker process"""
+    global _worker_old_cipher
+    _init_cipher_worker(new_key)
+    _worker_old_cipher = VaultCipher(old_key)
+
+
+def _rekey_batch(rows):
+    """Re-encrypt ENTRY_COLUMNS + token rows; returns (update_entry() arguments, failed ids)"""
+    # Metadata, search tokens and fingerprints are keyed by the vault key, so they are redone as well
+    updates = []
+    failed = []
+    for row in rows:
+        try:
+            _, service, email = _worker_old_cipher.entry(row[:5])
+            plaintext = _worker_old_cipher.decrypt(row[5])
+        except ValueError:
+            failed.append(row[0])
+            continue
+        updates.append((row[0], _worker_cipher.seal_entry(service, email), _worker_cipher.encrypt(plaintext),
+                        password_fingerprint(_worker_fingerprint_key, plaintext)))
+    return updates, failed
+
+
+class RekeyEngine:
+    """Re-encrypt every entry from old_key to new_key in resumable, parallel batches"""
+    
+    def __init__(self, conn, old_key, new_key, batch_size=REKEY_BATCH_SIZE, workers=None):
+        self.conn = conn
+        self.old_key = old_key
+        self.new_key = new_key
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else min(os.cpu_count() or 1, 8)
+    
+    @staticmethod
+    def checkpoint(conn):
+        """Return (last_id, complete) of an unfinished rotation, or None"""
+        return conn.execute("SELECT last_id, complete FROM rekey_progress WHERE id = 1").fetchone()
+    
+    @staticmethod
+    def clear_checkpoint(conn):
+        """Forget the checkpoint once the new config is in place"""
+        conn.execute("DELETE FROM rekey_progress")
+        conn.commit()
+    
+    @classmethod
+    def discard_stale_checkpoint(cls, conn):
+        """Drop a finished checkpoint left by a crash after the config switch"""
+        state = cls.checkpoint(conn)
+        if state is None:
+            return
+        if not state[1]:
+            raise ValueError("Found a re-encryption checkpoint without its pending config")
+        cls.clear_checkpoint(conn)
+    
+    def batches(self, last_id):
+        """Yield ENTRY_COLUMNS + token batches after last_id in id order"""
+        while True:
+            rows = self.conn.execute(
+                f"SELECT {ENTRY_COLUMNS}, encrypted_password FROM passwords WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, self.batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+    
+    def write(self, rows, result, stats, progress):
+        """Store one re-encrypted batch and advance the checkpoint in the same transaction"""
+        updates, failed = result
+        for update in updates:
+            update_entry(self.conn, *update)
+        self.conn.execute("UPDATE rekey_progress SET last_id = ? WHERE id = 1", (rows[-1][0],))
+        self.conn.commit()
+        stats["done"] += len(updates)
+        stats["failed"].extend(failed)
+        if progress:
+            progress(stats["done"], stats["total"])
+    
+    def run(self, progress=None):
+        """Re-encrypt remaining rows; returns ids that could not be decrypted"""
+        state = self.checkpoint(self.conn)
+        if state is None:
+            self.conn.execute("INSERT INTO rekey_progress (id, last_id, complete) VALUES (1, 0, 0)")
+            self.conn.commit()
+            state = (0, 0)
+        last_id, complete = state
+        if complete:
+            return []
+        
+        stats = {
+            "done": 0,
+            "failed": [],
+            "total": self.conn.execute("SELECT COUNT(*) FROM passwords WHERE id > ?", (last_id,)).fetchone()[0],
+        }
+        
+        pool = None
+        pending = deque()
+        try:
+            if self.workers > 1:
+                pool = process_pool(self.workers, _init_rekey_worker, (self.old_key, self.new_key))
+            else:
+                _init_rekey_worker(self.old_key, self.new_key)
+            
+            for rows in self.batches(last_id):
+                if pool is None:
+                    self.write(rows, _rekey_batch(rows), stats, progress)
+                    continue
+                
+                # Batches finish in order so the checkpoint only ever moves forward
+                pending.append((rows, pool.submit(_rekey_batch, rows)))
+                while len(pending) > self.workers * 2:
+                    done_rows, future = pending.popleft()
+                    self.write(done_rows, future.result(), stats, progress)
+            
+            while pending:
+                done_rows, future = pending.popleft()
+                self.write(done_rows, future.result(), stats, progress)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        
+        self.conn.execute("UPDATE rekey_progress SET complete = 1 WHERE id = 1")
+        # Copies made before the rotation keep the old key and can no longer be synced with
+        self.conn.execute("UPDATE sync_replica SET key_epoch = ?", (key_epoch(self.new_key),))
+        self.conn.commit()
+        return stats["failed"]
+
+
+# Rows per fingerprint backfill batch; each batch commits on its own
+FINGERPRINT_BATCH_SIZE = 2000
+
+
+def _fingerprint_batch(rows):
+    """Fingerprint (id, token) rows; returns ((fingerprint, id) updates, failed ids)"""
+    updates = []
+    failed = []
+    for row_id, token in rows:
+        try:
+            plaintext = _worker_cipher.decrypt(token)
+        except Exception:
+            failed.append(row_id)
+            continue
+        updates.append((password_fingerprint(_worker_fingerprint_key, plaintext), row_id))
+    return updates, failed
+
+
+class FingerprintBackfill:
+    """Fingerprint entries stored before the fingerprint column existed, in parallel batches
+    
+    Only rows with a NULL fingerprint are read, so an interrupted backfill
+    picks up where it stopped and a finished one costs a single index probe.
+    """
+    
+    def __init__(self, conn, key, batch_size=FINGERPRINT_BATCH_SIZE, workers=None):
+        self.conn = conn
+        self.key = key
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else min(os.cpu_count() or 1, 8)
+    
+    @staticmethod
+    def needed(conn):
+        """Return True if some entry has no fingerprint yet"""
+        return conn.execute(
+            "SELECT 1 FROM passwords WHERE password_fingerprint IS NULL LIMIT 1"
+        ).fetchone() is not None
+    
+    def batches(self):
+        """Yield (id, token) batches of unfingerprinted rows in id order"""
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, encrypted_password FROM passwords "
+                "WHERE password_fingerprint IS NULL AND id > ? ORDER BY id LIMIT ?",
+                (last_id, self.batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+    
+    def write(self, result, stats, progress):
+        updates, failed = result
+        self.conn.executemany("UPDATE passwords SET password_fingerprint = ? WHERE id = ?", updates)
+        self.conn.commit()
+        stats["done"] += len(updates) + len(failed)
+        stats["failed"].extend(failed)
+        if progress:
+            progress(stats["done"], stats["total"])
+    
+    def run(self, progress=None):
+        """Fingerprint every remaining row; returns ids that could not be decrypted"""
+        if not self.needed(self.conn):
+            return []
+        stats = {
+            "done": 0,
+            "failed": [],
+            "total": self.conn.execute(
+                "SELECT COUNT(*) FROM passwords WHERE password_fingerprint IS NULL").fetchone()[0],
+        }
+        
+        pool = None
+        pending = deque()
+        try:
+            if self.workers > 1 and stats["total"] > self.batch_size:
+                pool = process_pool(self.workers, _init_cipher_worker, (self.key,))
+            else:
+                _init_cipher_worker(self.key)
+            
+            for rows in self.batches():
+                if pool is None:
+                    self.write(_fingerprint_batch(rows), stats, progress)
+                    continue
+                pending.append(pool.submit(_fingerprint_batch, rows))
+                while len(pending) > self.workers * 2:
+                    self.write(pending.popleft().result(), stats, progress)
+            
+            while pending:
+                self.write(pending.popleft().result(), stats, progress)
+        except BaseException:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return stats["failed"]
+
+
+def reuse_count(conn, fingerprint, exclude_id=None):
+    """Return how many other entries use the password with this fingerprint"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM passwords WHERE password_fingerprint = ? AND id != ?",
+        (fingerprint, exclude_id if exclude_id is not None else -1)
+    ).fetchone()[0]
+
+
+def reuse_groups(conn, cipher):
+    """Return lists of (id, service, email) rows that share a password, largest group first"""
+    rows = conn.execute(
+        "SELECT p.password_fingerprint, p.id, p.service_name, p.email, p.service_record, p.email_record "
+        "FROM passwords p "
+        "JOIN (SELECT password_fingerprint, COUNT(*) AS uses FROM passwords "
+        "      WHERE password_fingerprint IS NOT NULL "
+        "      GROUP BY password_fingerprint HAVING COUNT(*) > 1) r "
+        "ON r.password_fingerprint = p.password_fingerprint "
+        "ORDER BY r.uses DESC, p.password_fingerprint"
+    ).fetchall()
+    groups = []
+    previous = None
+    for row in rows:
+        if row[0] != previous:
+            groups.append([])
+            previous = row[0]
+        groups[-1].append(cipher.entry(row[1:]))
+    # Names are only readable after decryption, so groups are sorted here
+    for group in groups:
+        group.sort(key=lambda entry: entry[1].lower())
+    return groups
+
+
+# Rows per record migration batch; each batch commits on its own
+RECORD_MIGRATION_BATCH_SIZE = 2000
+
+
+def _upgrade_batch(rows):
+    """Re-encrypt (id, token) rows as records; returns ((record, id, token) updates, failed ids)"""
+    updates = []
+    failed = []
+    for row_id, token in rows:
+        try:
+            plaintext = _worker_cipher.decrypt(token)
+        except ValueError:
+            failed.append(row_id)
+            continue
+        updates.append((_worker_cipher.encrypt(plaintext), row_id, token))
+    return updates, failed
+
+
+class RecordMigration:
+    """Rewrite legacy Fernet tokens as compact records in parallel batches
+    
+    Each batch commits on its own and only replaces a token that has not
+    changed since it was read, so the vault stays usable while this runs.
+    Remaining rows are found through a partial index, which makes a finished
+    migration a single index probe.
+    """
+    
+    def __init__(self, conn, key, batch_size=RECORD_MIGRATION_BATCH_SIZE, workers=None):
+        self.conn = conn
+        self.key = key
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else min(os.cpu_count() or 1, 8)
+    
+    @staticmethod
+    def needed(conn):
+        """Return True if some entry still holds a Fernet token"""
+        return conn.execute(
+            "SELECT 1 FROM passwords WHERE typeof(encrypted_password) = 'text' LIMIT 1"
+        ).fetchone() is not None
+    
+    def batches(self):
+        """Yield (id, token) batches of legacy rows in id order"""
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, encrypted_password FROM passwords "
+                "WHERE typeof(encrypted_password) = 'text' AND id > ? ORDER BY id LIMIT ?",
+                (last_id, self.batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+    
+    def write(self, result, stats, progress):
+        updates, failed = result
+        self.conn.executemany(
+            "UPDATE passwords SET encrypted_password = ? WHERE id = ? AND encrypted_password = ?", updates)
+        self.conn.commit()
+        stats["done"] += len(updates) + len(failed)
+        stats["failed"].extend(failed)
+        if progress:
+            progress(stats["done"], stats["total"])
+    
+    def run(self, progress=None):
+        """Convert every remaining legacy row; returns ids that could not be decrypted"""
+        if not self.needed(self.conn):
+            return []
+        stats = {
+            "done": 0,
+            "failed": [],
+            "total": self.conn.execute(
+                "SELECT COUNT(*) FROM passwords WHERE typeof(encrypted_password) = 'text'").fetchone()[0],
+        }
+        
+        pool = None
+        pending = deque()
+        try:
+            if self.workers > 1 and stats["total"] > self.batch_size:
+                pool = process_pool(self.workers, _init_cipher_worker, (self.key,))
+            else:
+                _init_cipher_worker(self.key)
+            
+            for rows in self.batches():
+                if pool is None:
+                    self.write(_upgrade_batch(rows), stats, progress)
+                    continue
+                pending.append(pool.submit(_upgrade_batch, rows))
+                while len(pending) > self.workers * 2:
+                    self.write(pending.popleft().result(), stats, progress)
+            
+            while pending:
+                self.write(pending.popleft().result(), stats, progress)
+        except BaseException:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return stats["failed"]
+
+
+# Rows per metadata encryption batch; each batch commits on its own
+METADATA_MIGRATION_BATCH_SIZE = 2000
+
+
+def _seal_metadata_batch(rows):
+    """Seal plaintext (id, service, email) rows; returns (sealed, id) pairs"""
+    return [(_worker_cipher.seal_entry(service, email), row_id) for row_id, service, email in rows]
+
+
+class MetadataMigration:
+    """Encrypt the service and email of entries stored before metadata encryption
+    
+    Each batch replaces the plaintext with records, an entry key and search
+    tokens, and commits on its own. secure_delete is on while this runs so the
+    old plaintext is overwritten rather than left in free space.
+    """
+    
+    def __init__(self, conn, key, batch_size=METADATA_MIGRATION_BATCH_SIZE, workers=None):
+        self.conn = conn
+        self.key = key
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else min(os.cpu_count() or 1, 8)
+    
+    @staticmethod
+    def needed(conn):
+        """Return True if some entry still has plaintext metadata"""
+        return conn.execute(
+            "SELECT 1 FROM passwords WHERE service_record IS NULL LIMIT 1"
+        ).fetchone() is not None
+    
+    def batches(self):
+        """Yield (id, service, email) batches of plaintext rows in id order"""
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, service_name, email FROM passwords "
+                "WHERE service_record IS NULL AND id > ? ORDER BY id LIMIT ?",
+                (last_id, self.batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+    
+    def write(self, sealed_rows, stats, progress):
+        token_rows = []
+        for (service_record, email_record, key, tokens), row_id in sealed_rows:
+            # Skip rows that were rewritten since they were read
+            if self.conn.execute(
+                    "UPDATE passwords SET service_name = '', email = '', service_record = ?, email_record = ?, "
+                    "entry_key = ? WHERE id = ? AND service_record IS NULL",
+                    (service_record, email_record, key, row_id)).rowcount:
+                token_rows.extend((token, row_id) for token in tokens)
+        # Plaintext rows have no tokens yet; inserting in key order keeps B-tree writes local
+        token_rows.sort()
+        self.conn.executemany("INSERT OR IGNORE INTO search_tokens (token, entry_id) VALUES (?, ?)", token_rows)
+        self.conn.commit()
+        stats["done"] += len(sealed_rows)
+        if progress:
+            progress(stats["done"], stats["total"])
+    
+    def run(self, progress=None):
+        """Encrypt every remaining row; returns an empty list, as plaintext never fails to read"""
+        if not self.needed(self.conn):
+            return []
+        stats = {
+            "done": 0,
+            "total": self.conn.execute("SELECT COUNT(*) FROM passwords WHERE service_record IS NULL").fetchone()[0],
+        }
+        secure_delete = self.conn.execute("PRAGMA secure_delete").fetchone()[0]
+        self.conn.execute("PRAGMA secure_delete = ON")
+        
+        pool = None
+        pending = deque()
+        try:
+            if self.workers > 1 and stats["total"] > self.batch_size:
+                pool = process_pool(self.workers, _init_cipher_worker, (self.key,))
+            else:
+                _init_cipher_worker(self.key)
+            
+            for rows in self.batches():
+                if pool is None:
+                    self.write(_seal_metadata_batch(rows), stats, progress)
+                    continue
+                pending.append(pool.submit(_seal_metadata_batch, rows))
+                while len(pending) > self.workers * 2:
+                    self.write(pending.popleft().result(), stats, progress)
+            
+            while pending:
+                self.write(pending.popleft().result(), stats, progress)
+        except BaseException:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            self.conn.execute(f"PRAGMA secure_delete = {int(secure_delete)}")
+        return []
+
+
+# Rows per bulk decryption chunk; at most a few chunks of plaintext exist at once
+DECRYPT_CHUNK_ROWS = 1000
+
+
+def _decrypt_batch(rows):
+    """Decrypt ENTRY_COLUMNS + token rows to (id, service, email, password)
+    
+    Where decryption fails, service, email and password are all None.
+    """
+    results = []
+    for row in rows:
+        try:
+            _, service, email = _worker_cipher.entry(row[:5])
+            password = _worker_cipher.decrypt(row[5]).decode("utf-8")
+        except (ValueError, UnicodeDecodeError):
+            service = email = password = None
+        results.append((row[0], service, email, password))
+    return results
+
+
+class BulkDecryptor:
+    """Decrypt the whole vault in chunks on a process pool, yielding chunks in id order
+    
+    Only a bounded number of chunks is in flight, so memory stays flat for any
+    vault size. Nothing is cached: once the caller moves on to the next chunk
+    the previous one's plaintext is no longer referenced here.
+    """
+    
+    def __init__(self, conn, key, chunk_rows=DECRYPT_CHUNK_ROWS, workers=None):
+        self.conn = conn
+        self.key = key
+        self.chunk_rows = chunk_rows
+        self.workers = workers if workers is not None else min(os.cpu_count() or 1, 8)
+    
+    def total(self):
+        return self.conn.execute("SELECT COUNT(*) FROM passwords").fetchone()[0]
+    
+    def batches(self):
+        """Yield ENTRY_COLUMNS + token batches in id order"""
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                f"SELECT {ENTRY_COLUMNS}, encrypted_password FROM passwords "
+                "WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, self.chunk_rows)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+    
+    def chunks(self):
+        """Yield lists of (id, service, email, password) rows"""
+        pool = None
+        pending = deque()
+        try:
+            # Starting worker processes only pays off beyond a couple of chunks
+            if self.workers > 1 and self.total() > self.chunk_rows * 2:
+                pool = process_pool(self.workers, _init_cipher_worker, (self.key,))
+            else:
+                _init_cipher_worker(self.key)
+            
+            for rows in self.batches():
+                if pool is None:
+                    yield _decrypt_batch(rows)
+                    continue
+                pending.append(pool.submit(_decrypt_batch, rows))
+                while len(pending) > self.workers * 2:
+                    yield pending.popleft().result()
+            
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Also runs when the consumer stops early
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+    
+    def search(self, text, progress=None):
+        """Yield lists of (id, service, email) whose password contains text, one list per chunk"""
+        done = 0
+        total = self.total()
+        for chunk in self.chunks():
+            matches = [(row_id, service, email) for row_id, service, email, password in chunk
+                       if password is not None and text in password]
+            done += len(chunk)
+            del chunk
+            if progress:
+                progress(done, total)
+            yield matches
+
+
+# Breach lists are sorted files of raw 20-byte SHA-1 digests
+BREACH_RECORD_SIZE = 20
+# Entries decrypted and checked per worker task during an audit
+AUDIT_BATCH_SIZE = 2000
+
+
+class BreachDatabase:
+    """Look up SHA-1 digests in a sorted binary hash file without loading it
+    
+    The file is memory-mapped and binary searched, so a lookup touches about
+    log2(n) pages that the OS caches, and memory use does not grow with the
+    file. A 256-entry table of where each first byte starts narrows every
+    search before it begins.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size % BREACH_RECORD_SIZE:
+            self.file.close()
+            raise ValueError(f"{path} is not a binary SHA-1 list (size is not a multiple of 20 bytes)")
+        self.count = size // BREACH_RECORD_SIZE
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.buckets = [self.lower_bound(bytes([value]), 0, self.count) for value in range(256)]
+        self.buckets.append(self.count)
+    
+    def record(self, index):
+        start = index * BREACH_RECORD_SIZE
+        return self.map[start:start + BREACH_RECORD_SIZE]
+    
+    def lower_bound(self, digest, lo, hi):
+        """Return the first index in [lo, hi) whose record is >= digest"""
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.record(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def __contains__(self, digest):
+        lo, hi = self.buckets[digest[0]], self.buckets[digest[0] + 1]
+        index = self.lower_bound(digest, lo, hi)
+        return index < hi and self.record(index) == digest
+    
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert_breach_list(source, destination, progress=None):
+    """Convert a text list of "SHA1HEX[:count]" lines sorted by hash to the binary format"""
+    count = 0
+    previous = b""
+    tmp_path = destination + ".tmp"
+    try:
+        with open(source, "r", encoding="ascii", errors="replace") as src, open(tmp_path, "wb") as dst:
+            for line in src:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    digest = bytes.fromhex(line.split(":", 1)[0])
+                except ValueError:
+                    raise ValueError(f"Line {count + 1} is not a SHA-1 hash")
+                if len(digest) != BREACH_RECORD_SIZE:
+                    raise ValueError(f"Line {count + 1} is not a SHA-1 hash")
+                if digest < previous:
+                    raise ValueError("Hashes must be sorted; download the list ordered by hash")
+                if digest != previous:
+                    dst.write(digest)
+                    count += 1
+                    previous = digest
+                    if progress and count % 1000000 == 0:
+                        progress(count)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, destination)
+    return count
+
+
+# Per-process breach list for parallel audits, set up by the pool initializer
+_worker_breaches = None
+
+
+def _init_audit_worker(key, breach_path):
+    """Open the cipher and the memory-mapped breach list once per worker process"""
+    global _worker_cipher, _worker_breaches
+    _worker_cipher = VaultCipher(key)
+    _worker_breaches = BreachDatabase(breach_path)
+
+
+def _audit_batch(rows):
+    """Check (id, token) rows; returns (breached ids, ids that failed to decrypt)
+    
+    Plaintext passwords and their hashes never leave the worker process.
+    """
+    breached = []
+    failed = []
+    for row_id, token in rows:
+        try:
+            plaintext = _worker_cipher.decrypt(token)
+        except Exception:
+            failed.append(row_id)
+            continue
+        if hashlib.sha1(plaintext).digest() in _worker_breaches:
+            breached.append(row_id)
+    return breached, failed
+
+
+class BreachAudit:
+    """Check every entry against an offline breach list, decrypting in parallel"""
+    
+    def __init__(self, conn, key, breach_path, batch_size=AUDIT_BATCH_SIZE, workers=None):
+        self.conn = conn
+        self.key = key
+        self.breach_path = breach_path
+        self.batch_size = batch_size
+        self.workers = workers if workers is not None else min(os.cpu_count() or 1, 8)
+    
+    def batches(self):
+        """Yield (id, token) batches in id order"""
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, encrypted_password FROM passwords WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, self.batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+    
+    def run(self, progress=None):
+        """Return a report with the breached (id, service, email) rows and counts"""
+        # Opening the list here reports a bad file before any worker starts
+        BreachDatabase(self.breach_path).close()
+        
+        total = self.conn.execute("SELECT COUNT(*) FROM passwords").fetchone()[0]
+        stats = {"checked": 0, "total": total, "breached": [], "failed": []}
+        
+        def collect(rows, result):
+            breached, failed = result
+            stats["breached"].extend(breached)
+            stats["failed"].extend(failed)
+            stats["checked"] += len(rows)
+            if progress:
+                progress(stats["checked"], total)
+        
+        pool = None
+        pending = deque()
+        try:
+            if self.workers > 1:
+                pool = process_pool(self.workers, _init_audit_worker, (self.key, self.breach_path))
+            else:
+                _init_audit_worker(self.key, self.breach_path)
+            
+            for rows in self.batches():
+                if pool is None:
+                    collect(rows, _audit_batch(rows))
+                    continue
+                pending.append((rows, pool.submit(_audit_batch, rows)))
+                while len(pending) > self.workers * 2:
+                    done_rows, future = pending.popleft()
+                    collect(done_rows, future.result())
+            
+            while pending:
+                done_rows, future = pending.popleft()
+                collect(done_rows, future.result())
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        
+        # Look up and decrypt names only for the hits
+        cipher = VaultCipher(self.key)
+        breached = []
+        ids = stats["breached"]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            breached.extend(cipher.entry(row) for row in self.conn.execute(
+                f"SELECT {ENTRY_COLUMNS} FROM passwords WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ))
+        breached.sort(key=lambda row: (row[1].lower(), row[2].lower()))
+        return {"checked": stats["checked"], "breached": breached, "failed": stats["failed"]}
+
+
+# Sync log rows read per query while merging
+SYNC_BATCH_SIZE = 2000
+# Sync log columns that identify one version of an entry
+SYNC_LOG_COLUMNS = "sync_id, entry_id, revision, modified, origin"
+
+
+def open_sync_target(path, db_path=DB_PATH):
+    """Open another vault database to sync with, refusing files that are not one"""
+    if not os.path.exists(path):
+        raise ValueError(f"No vault database at {path}")
+    if os.path.exists(db_path) and os.path.samefile(path, db_path):
+        raise ValueError("Cannot sync a vault with itself")
+    conn = connect_database(path)
+    try:
+        is_vault = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'passwords'").fetchone() is not None
+    finally:
+        conn.close()
+    if not is_vault:
+        raise ValueError(f"{path} is not a password vault")
+    # Copies made by older versions get the sync log here
+    return open_database(path)
+
+
+class VaultSync:
+    """Merge two copies of a vault in both directions, exchanging only what changed since they last met
+    
+    Every entry has a random sync id shared by all copies, and each local
+    change gives it the next revision and moves its sync log row to the end
+    of the log. Each vault records, per copy it has met, the last log position
+    it merged, so a sync reads only the rows after it. Both copies use the
+    same vault key: records are copied as they are, after checking that
+    they decrypt. Each vault stores the id of its key once it has been
+    rotated or synced, and copies whose ids differ are refused before
+    anything is written.
+    
+    When both copies changed an entry, the version with the higher
+    (revision, modified, origin) wins on both sides, so the result does not
+    depend on which vault starts the sync. Entries without shared history
+    that have the same service and email, e.g. in copies upgraded separately,
+    become one entry under the smaller sync id.
+    """
+    
+    def __init__(self, conn, other_conn, key, batch_size=SYNC_BATCH_SIZE):
+        self.conn = conn
+        self.other = other_conn
+        self.key = key
+        self.cipher = VaultCipher(key)
+        self.batch_size = batch_size
+    
+    @staticmethod
+    def replica_id(conn):
+        return conn.execute("SELECT replica_id FROM sync_replica").fetchone()[0]
+    
+    @staticmethod
+    def peer(conn, replica_id):
+        """Return (log position merged up to, token) for the copy replica_id, or None"""
+        return conn.execute("SELECT last_seq, token FROM sync_peers WHERE replica_id = ?",
+                            (replica_id,)).fetchone()
+    
+    @staticmethod
+    def set_peer(conn, replica_id, seq, token):
+        conn.execute("INSERT OR REPLACE INTO sync_peers (replica_id, last_seq, token, synced) VALUES (?, ?, ?, ?)",
+                     (replica_id, seq, token, time.time()))
+    
+    @staticmethod
+    def new_replica_id(conn):
+        with conn:
+            conn.execute("UPDATE sync_replica SET replica_id = ?", (secrets.token_bytes(SYNC_ID_BYTES),))
+    
+    def check_key(self):
+        """Refuse another vault whose entries use a different key, e.g. one copied before a rotation"""
+        stored = self.other.execute("SELECT key_epoch FROM sync_replica").fetchone()
+        if stored is not None and stored[0] is not None:
+            same_key = stored[0] == key_epoch(self.key)
+        else:
+            # Not rotated or synced since it got a key id: check that an entry decrypts
+            row = self.other.execute("SELECT encrypted_password FROM passwords ORDER BY id LIMIT 1").fetchone()
+            same_key = True
+            if row is not None:
+                try:
+                    self.cipher.decrypt(row[0])
+                except ValueError:
+                    same_key = False
+        if not same_key:
+            raise ValueError("The other vault uses a different vault key, so it cannot be synced with this one. "
+                             "This happens when either copy had its key rotated; "
+                             "replace the other with a fresh copy of the rotated vault")
+    
+    def set_key_epoch(self, conn):
+        conn.execute("UPDATE sync_replica SET key_epoch = ?", (key_epoch(self.key),))
+    
+    @staticmethod
+    def max_seq(conn):
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_log").fetchone()[0]
+    
+    @staticmethod
+    def reconcile(conn):
+        """Log entries that versions without the sync log added or deleted"""
+        # Counts and highest ids agree unless such a version wrote to the vault
+        if conn.execute("SELECT COUNT(*), MAX(id) FROM passwords").fetchone() == conn.execute(
+                "SELECT COUNT(*), MAX(entry_id) FROM sync_log WHERE entry_id IS NOT NULL").fetchone():
+            return
+        log_existing_entries(conn, "id NOT IN (SELECT entry_id FROM sync_log WHERE entry_id IS NOT NULL)")
+        gone = conn.execute(
+            "SELECT entry_id FROM sync_log WHERE entry_id IS NOT NULL "
+            "AND entry_id NOT IN (SELECT id FROM passwords)").fetchall()
+        for (entry_id,) in gone:
+            log_change(conn, entry_id, deleted=True)
+    
+    def prepare(self):
+        """Bring both logs up to date; returns the log positions each side has merged up to
+        
+        A vault file copied wholesale shares its replica id and log positions
+        with the original, though their logs diverge after the copy. It is
+        told apart by its replica id, or by a token that no longer matches the
+        one stored at the other side's last sync; both vaults then get new
+        replica ids and exchange their whole logs once.
+        """
+        # Before anything is written to the other vault with this vault's key
+        self.check_key()
+        # Matching entries by service and email needs entry keys on every row
+        for conn in (self.conn, self.other):
+            MetadataMigration(conn, self.key).run()
+            with conn:
+                self.reconcile(conn)
+        if self.replica_id(self.conn) == self.replica_id(self.other):
+            self.new_replica_id(self.other)
+        
+        mine = self.peer(self.conn, self.replica_id(self.other))
+        theirs = self.peer(self.other, self.replica_id(self.conn))
+        tokens = (mine[1] if mine else None, theirs[1] if theirs else None)
+        if tokens[0] is not None and tokens[0] == tokens[1]:
+            return mine[0], theirs[0]
+        if tokens != (None, None):
+            self.new_replica_id(self.conn)
+            self.new_replica_id(self.other)
+        return 0, 0
+    
+    def changes(self, conn, since):
+        """Yield batches of log rows after position since, with the columns of entries that still exist"""
+        while True:
+            rows = conn.execute(
+                "SELECT l.seq, l.sync_id, l.entry_id, l.revision, l.modified, l.origin, "
+                "p.service_name, p.email, p.service_record, p.email_record, "
+                "p.encrypted_password, p.password_fingerprint "
+                "FROM sync_log l LEFT JOIN passwords p ON p.id = l.entry_id "
+                "WHERE l.seq > ? ORDER BY l.seq LIMIT ?",
+                (since, self.batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            since = rows[-1][0]
+            yield rows
+    
+    def open_entry(self, row):
+        """Check that a live entry's records decrypt; returns (sealed, token, fingerprint)"""
+        _, _, entry_id, _, _, _, service_name, email, service_record, email_record, token, fingerprint = row
+        try:
+            _, service, email = self.cipher.entry((entry_id, service_name, email, service_record, email_record))
+            self.cipher.decrypt(token)
+        except ValueError:
+            raise ValueError("The other vault is not a copy of this one: its entries use a different vault key. "
+                             "If either copy had its key rotated, replace the other with a fresh copy of it")
+        index_key = self.cipher.index_key
+        sealed = (service_record, email_record, entry_key(index_key, service, email),
+                  blind_tokens(index_key, service, email))
+        return sealed, token, fingerprint
+    
+    def same_entry(self, conn, source, key):
+        """Find a live entry in conn with entry key key that source has no history of"""
+        for row in conn.execute(
+                "SELECT l.sync_id, l.entry_id, l.revision, l.modified, l.origin "
+                "FROM passwords p JOIN sync_log l ON l.entry_id = p.id WHERE p.entry_key = ?", (key,)):
+            if source.execute("SELECT 1 FROM sync_log WHERE sync_id = ?", (row[0],)).fetchone() is None:
+                return row
+        return None
+    
+    def apply(self, conn, source, rows, stats, counter):
+        """Merge log rows read from source into conn; returns the versions conn now holds unchanged"""
+        taken = set()
+        for row in rows:
+            sync_id, entry_id, version = row[1], row[2], row[3:6]
+            local = conn.execute(f"SELECT {SYNC_LOG_COLUMNS} FROM sync_log WHERE sync_id = ?",
+                                 (sync_id,)).fetchone()
+            # Most rows after a wholesale copy are versions this side already has
+            if local is not None and version <= local[2:]:
+                continue
+            entry = self.open_entry(row) if entry_id is not None else None
+            adopted = local is None and entry is not None
+            if adopted:
+                sealed = entry[0]
+                local = self.same_entry(conn, source, sealed[2])
+                if local is not None and version <= local[2:]:
+                    # The entries are one from now on; the other side learns the shared id next
+                    conn.execute(f"INSERT OR REPLACE INTO sync_log ({SYNC_LOG_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                                 (min(sync_id, local[0]), local[1]) + local[2:])
+                    continue
+            
+            local_entry_id = local[1] if local is not None else None
+            if entry is None:
+                if local_entry_id is not None:
+                    conn.execute("DELETE FROM passwords WHERE id = ?", (local_entry_id,))
+            elif local_entry_id is not None:
+                update_entry(conn, local_entry_id, *entry)
+            else:
+                local_entry_id = insert_entry(conn, *entry)
+            merged_id = min(sync_id, local[0]) if adopted and local is not None else sync_id
+            conn.execute(f"INSERT OR REPLACE INTO sync_log ({SYNC_LOG_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                         (merged_id, local_entry_id if entry is not None else None) + version)
+            if merged_id == sync_id:
+                taken.add((sync_id,) + version)
+            stats[counter] += 1
+        return taken
+    
+    def run(self, progress=None):
+        """Pull the other vault's changes, then push this vault's; returns counts of received and sent entries
+        
+        Each direction commits on its own, the receiving side's position in
+        the sender's log in the same transaction, so an interrupted sync is
+        finished by running it again.
+        """
+        stats = {"received": 0, "sent": 0}
+        received_seq, sent_seq = self.prepare()
+        local_id, other_id = self.replica_id(self.conn), self.replica_id(self.other)
+        old_token = (self.peer(self.conn, other_id) or (0, None))[1]
+        try:
+            # Nothing else may write to the other vault until both directions are done
+            self.other.execute("BEGIN IMMEDIATE")
+            self.conn.execute("BEGIN IMMEDIATE")
+            taken = set()
+            for rows in self.changes(self.other, received_seq):
+                taken |= self.apply(self.conn, self.other, rows, stats, "received")
+                self.set_peer(self.conn, other_id, rows[-1][0], old_token)
+                if progress:
+                    progress(dict(stats))
+            self.conn.commit()
+            
+            # What was just received is not sent back
+            token = secrets.token_bytes(SYNC_ID_BYTES)
+            for rows in self.changes(self.conn, sent_seq):
+                self.apply(self.other, self.conn,
+                           [row for row in rows if (row[1],) + row[3:6] not in taken], stats, "sent")
+                sent_seq = rows[-1][0]
+                if progress:
+                    progress(dict(stats))
+            self.set_peer(self.other, local_id, sent_seq, token)
+            self.set_key_epoch(self.other)
+            other_seq = self.max_seq(self.other)
+            self.other.commit()
+            
+            # The other vault's new rows only repeat what this one sent
+            with self.conn:
+                self.set_peer(self.conn, other_id, other_seq, token)
+                self.set_key_epoch(self.conn)
+        except BaseException:
+            for conn in (self.conn, self.other):
+                if conn.in_transaction:
+                    conn.rollback()
+            raise
+        return stats
+
+
+# Entries per query or transaction in the headless store's bulk methods
+STORE_BATCH_SIZE = 1000
+# Most candidates reported when a lookup matches more than one entry
+LOOKUP_MAX_MATCHES = 20
+
+
+class EntryLookupError(ValueError):
+    """A lookup found no entry, or more than one"""
+    
+    def __init__(self, message, matches=None):
+        super().__init__(message)
+        # (id, service, email) rows when the lookup was ambiguous
+        self.matches = matches or []
+
+
+class VaultStore:
+    """Headless access to an unlocked vault for scripts and batch jobs; needs no display"""
+    
+    def __init__(self, vault_key, db_path=DB_PATH):
+        load_crypto()
+        self.vault_key = vault_key
+        self.db_path = db_path
+        self.cipher = VaultCipher(vault_key)
+        self.fingerprint_key = fingerprint_key(vault_key)
+        self.conn = open_database(db_path)
+        self.search_index = SearchIndex(self.conn, self.cipher)
+    
+    @classmethod
+    def unlock(cls, password, db_path=DB_PATH, config_path=CONFIG_PATH):
+        """Open the vault with the master password"""
+        return cls(unlock_vault_key(password, config_path), db_path)
+    
+    def close(self):
+        self.conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM passwords").fetchone()[0]
+    
+    def decrypt(self, token):
+        """Decrypt one stored token"""
+        return self.cipher.decrypt(token).decode("utf-8")
+    
+    def iter_entries(self, decrypt=True, batch_size=STORE_BATCH_SIZE):
+        """Yield (id, service, email, password) in id order, one batch in memory at a time
+        
+        Entries are decrypted in parallel chunks; one that cannot be decrypted
+        has None as its service, email and password. With decrypt=False the
+        password is left out and only the metadata is decrypted.
+        """
+        if decrypt:
+            for chunk in BulkDecryptor(self.conn, self.vault_key, batch_size).chunks():
+                yield from chunk
+            return
+        
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                f"SELECT {ENTRY_COLUMNS} FROM passwords WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for row in rows:
+                yield self.cipher.entry(row)
+    
+    def get_many(self, ids):
+        """Return (id, service, email, password) for the ids that exist, in id order"""
+        ids = sorted(set(int(pid) for pid in ids))
+        entries = []
+        for start in range(0, len(ids), STORE_BATCH_SIZE):
+            chunk = ids[start:start + STORE_BATCH_SIZE]
+            rows = self.conn.execute(
+                f"SELECT {ENTRY_COLUMNS}, encrypted_password FROM passwords "
+                f"WHERE id IN ({','.join('?' * len(chunk))}) ORDER BY id",
+                chunk
+            ).fetchall()
+            entries.extend(self.cipher.entry(row[:5]) + (self.decrypt(row[5]),) for row in rows)
+        return entries
+    
+    def lookup(self, entry_id=None, term=None):
+        """Return (id, service, email, password) of the entry with entry_id, or the one entry matching term
+        
+        With both, term is only searched when no entry has entry_id, so a
+        service named "1234" is still found by name.
+        """
+        if entry_id is not None:
+            entries = self.get_many([entry_id])
+            if entries:
+                return entries[0]
+            if term is None:
+                raise EntryLookupError(f"No entry with ID {entry_id}")
+        
+        term = term or ""
+        matches = self.search_index.search(term) or []
+        # An exact service name picks one entry even if others share the prefix
+        exact = [row for row in matches if row[1].lower() == term.lower()]
+        if len(exact) == 1:
+            matches = exact
+        if not matches:
+            raise EntryLookupError(f"No entry matches '{term}'")
+        if len(matches) > 1:
+            raise EntryLookupError(f"{len(matches)} entries match '{term}'; give an ID instead",
+                                   matches[:LOOKUP_MAX_MATCHES])
+        return self.get_many([matches[0][0]])[0]
+    
+    def search(self, term):
+        """Return (id, service, email) rows matching term, best match first"""
+        rows = self.search_index.search(term)
+        return list(self.iter_entries(decrypt=False)) if rows is None else rows
+    
+    def put_many(self, records, batch_size=STORE_BATCH_SIZE):
+        """Store (service, email, password) records in one transaction
+        
+        A record replaces the password of an existing entry with the same
+        service and email; anything else is inserted. Returns counts of
+        inserted and updated entries.
+        """
+        stats = {"inserted": 0, "updated": 0}
+        # Existing entries are matched by entry key, which older rows get from the migration
+        self.upgrade_metadata()
+        batch = []
+        try:
+            for record in records:
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    self.write_batch(batch, stats)
+                    batch = []
+            if batch:
+                self.write_batch(batch, stats)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return stats
+    
+    def write_batch(self, batch, stats):
+        """Encrypt one batch and apply it as updates and inserts"""
+        updates = []
+        for service, email, password in batch:
+            token = self.cipher.encrypt(password)
+            fingerprint = password_fingerprint(self.fingerprint_key, password)
+            existing = self.conn.execute(
+                "SELECT id FROM passwords WHERE entry_key = ? LIMIT 1",
+                (entry_key(self.cipher.index_key, service, email),)
+            ).fetchone()
+            if existing:
+                updates.append((token, fingerprint, existing[0]))
+            else:
+                insert_entry(self.conn, self.cipher.seal_entry(service, email), token, fingerprint)
+                stats["inserted"] += 1
+        self.conn.executemany(
+            "UPDATE passwords SET encrypted_password = ?, password_fingerprint = ? WHERE id = ?", updates
+        )
+        for _, _, entry_id in updates:
+            log_change(self.conn, entry_id)
+        stats["updated"] += len(updates)
+    
+    def delete_many(self, ids):
+        """Delete entries by id in one transaction; returns how many were removed"""
+        with self.conn:
+            return sum(delete_entry(self.conn, int(pid)) for pid in ids)
+    
+    def search_passwords(self, text):
+        """Return (id, service, email) of entries whose password contains text"""
+        matches = []
+        for chunk in BulkDecryptor(self.conn, self.vault_key).search(text):
+            matches.extend(chunk)
+        return matches
+    
+    def upgrade_records(self, progress=None):
+        """Convert legacy Fernet entries to compact records; returns ids that could not be decrypted"""
+        return RecordMigration(self.conn, self.vault_key).run(progress)
+    
+    def upgrade_metadata(self, progress=None):
+        """Encrypt the service and email of entries that still store them in plaintext"""
+        return MetadataMigration(self.conn, self.vault_key).run(progress)
+    
+    def reuse_groups(self, progress=None):
+        """Return groups of (id, service, email) entries sharing a password"""
+        FingerprintBackfill(self.conn, self.vault_key).run(progress)
+        return reuse_groups(self.conn, self.cipher)
+    
+    def import_records(self, records, progress=None):
+        """Bulk import (service, email, password) records, skipping duplicates"""
+        return BulkImporter(self.conn, self.vault_key).run(records, progress)
+    
+    def sync(self, path, progress=None):
+        """Exchange changes with another copy of this vault; returns counts of received and sent entries"""
+        other = open_sync_target(path, self.db_path)
+        try:
+            return VaultSync(self.conn, other, self.vault_key).run(progress)
+        finally:
+            other.close()
+
+
+# Background conversions of entries saved by older versions, in the order they run,
+# with the status bar label shown while each one works
+VAULT_UPGRADES = (
+    (RecordMigration, "Upgrading stored passwords"),
+    (MetadataMigration, "Encrypting names and emails"),
+    (FingerprintBackfill, "Indexing passwords for reuse checks"),
+)
+
+
+# User preferences that are not secret, e.g. auto-lock policies
+SETTINGS_PATH = os.path.join(os.path.expanduser("~"), ".password_manager_settings.json")
+DEFAULT_SETTINGS = {
+    "auto_lock_seconds": 180,
+    "lock_on_minimize": False,
+    "lock_on_sleep": True,
+    "agent_enabled": False,
+}
+
+
+def load_settings(path=SETTINGS_PATH):
+    """Return the saved settings merged over the defaults"""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return settings
+    if isinstance(saved, dict):
+        settings.update({key: value for key, value in saved.items() if key in DEFAULT_SETTINGS})
+    return settings
+
+
+def save_settings(settings, path=SETTINGS_PATH):
+    """Write settings atomically"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# A timer firing this much later than scheduled, or the wall clock running this far
+# ahead of the monotonic clock, means the machine slept
+SLEEP_DETECT_SECONDS = 5
+# Longest wait between sleep checks while lock_on_sleep is set; longer sleeps are always noticed
+SLEEP_CHECK_SECONDS = 30
+# How often a lock that waits for a bulk job checks whether it has finished
+BUSY_LOCK_RECHECK_SECONDS = 1
+
+
+class SleepWatch:
+    """Notice a system suspend from a timer or timeout that fires much later than scheduled
+    
+    Whether time.monotonic() counts time asleep depends on the platform: it
+    stops on Linux and macOS but keeps counting on Windows. So both clocks are
+    read. The wall clock pulling ahead of the monotonic one, or either clock
+    showing the tick arrived late, means the machine slept. A wall clock step
+    looks the same, which errs towards locking.
+    """
+    
+    def __init__(self, wall=None, monotonic=None):
+        self.wall = wall or time.time
+        self.monotonic = monotonic or time.monotonic
+        self.expect(0)
+    
+    def expect(self, delay):
+        """Note that the next tick is due delay seconds from now"""
+        self.scheduled = (self.wall(), self.monotonic())
+        self.delay = delay
+    
+    def slept(self):
+        """Return True if the machine was suspended since expect() was last called"""
+        wall_elapsed = self.wall() - self.scheduled[0]
+        monotonic_elapsed = self.monotonic() - self.scheduled[1]
+        if wall_elapsed - monotonic_elapsed > SLEEP_DETECT_SECONDS:
+            return True
+        return max(wall_elapsed, monotonic_elapsed) - self.delay > SLEEP_DETECT_SECONDS
+
+
+class AutoLock:
+    """Lock after a period of inactivity using one timer armed for the real deadline
+    
+    Input only records a timestamp. When the timer fires it either locks or
+    re-arms for the time that is left, so an idle session wakes the event loop
+    about once per timeout, or every SLEEP_CHECK_SECONDS while lock_on_sleep
+    is set, instead of every second.
+    """
+    
+    def __init__(self, root, on_lock, settings, busy=None):
+        self.root = root
+        self.on_lock = on_lock
+        self.settings = settings
+        # Returns True while locking would abandon a bulk job half way
+        self.busy = busy
+        self.timer = None
+        self.active = False
+        self.lock_pending = False
+        self.last_activity = time.monotonic()
+        self.sleep_watch = SleepWatch()
+        
+        self.root.bind("<Unmap>", self.on_unmap, add="+")
+    
+    @property
+    def timeout(self):
+        return self.settings["auto_lock_seconds"]
+    
+    def start(self):
+        """Begin watching for inactivity after an unlock"""
+        self.active = True
+        self.lock_pending = False
+        self.last_activity = time.monotonic()
+        self.arm(self.timeout)
+    
+    def stop(self):
+        """Stop watching; called when the vault locks"""
+        self.active = False
+        self.lock_pending = False
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+            self.timer = None
+    
+    def touch(self, event=None):
+        """Record user activity; runs on every key press and click, so it stays cheap"""
+        if self.active and self.slept():
+            # First input after waking: lock before the event does anything else
+            self.root.after_idle(self.lock)
+            return
+        self.last_activity = time.monotonic()
+    
+    def slept(self):
+        """Return True if the machine was suspended since the timer was armed and that policy is on"""
+        return self.settings["lock_on_sleep"] and self.sleep_watch.slept()
+    
+    def arm(self, delay):
+        """Schedule the next deadline check delay seconds from now"""
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+        if self.settings["lock_on_sleep"]:
+            # A short sleep between two distant checks would go unnoticed otherwise
+            delay = min(delay, SLEEP_CHECK_SECONDS)
+        self.sleep_watch.expect(delay)
+        self.timer = self.root.after(max(1, int(delay * 1000) + 1), self.check)
+    
+    def check(self):
+        """Lock if the deadline has passed, otherwise re-arm for what remains"""
+        self.timer = None
+        if not self.active:
+            return
+        remaining = self.last_activity + self.timeout - time.monotonic()
+        if self.lock_pending or self.slept() or remaining <= 0:
+            self.lock()
+            return
+        self.arm(remaining)
+    
+    def on_unmap(self, event):
+        """Lock when the main window is minimized, if that policy is on"""
+        if event.widget is self.root and self.active and self.settings["lock_on_minimize"]:
+            if self.root.state() == "iconic":
+                self.lock()
+    
+    def apply_settings(self):
+        """Re-arm for a changed timeout or sleep policy"""
+        if self.active:
+            self.arm(max(0, self.last_activity + self.timeout - time.monotonic()))
+    
+    def lock(self):
+        if not self.active:
+            return
+        if self.busy is not None and self.busy():
+            # Lock as soon as the job is done
+            self.lock_pending = True
+            self.arm(BUSY_LOCK_RECHECK_SECONDS)
+            return
+        self.stop()
+        self.on_lock()
+
+
+# The agent socket lives in the per-user runtime directory when there is one
+AGENT_SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or os.path.expanduser("~"),
+                                 ".password_manager_agent.sock")
+# Longest request line the agent reads
+AGENT_REQUEST_BYTES = 64 * 1024
+# How long a client waits for the agent, and a new agent for its socket
+AGENT_TIMEOUT_SECONDS = 5
+
+
+class AgentError(ValueError):
+    """The agent refused or could not answer a request"""
+    
+    def __init__(self, message, matches=None):
+        super().__init__(message)
+        # (id, service, email) rows when a lookup was ambiguous
+        self.matches = matches or []
+
+
+class VaultAgent:
+    """Answer lookups from an unlocked vault over a Unix socket, like ssh-agent
+    
+    The vault key stays in this process only. Requests are newline-terminated
+    JSON objects, one per connection. The socket is created owner-only and
+    clients from other users are turned away. The agent exits after
+    auto_lock_seconds without a request, or when the machine has slept and
+    lock_on_sleep is set, the same policies that lock the GUI.
+    """
+    
+    def __init__(self, store, settings, path=AGENT_SOCKET_PATH):
+        self.store = store
+        self.settings = settings
+        self.path = path
+        self.running = False
+        self.deadline = None
+        self.sleep_watch = SleepWatch()
+    
+    def slept(self):
+        """Return True if the machine was suspended while waiting for a request and that policy is on"""
+        return self.settings["lock_on_sleep"] and self.sleep_watch.slept()
+    
+    def touch(self):
+        self.deadline = time.monotonic() + self.settings["auto_lock_seconds"]
+    
+    def listen(self):
+        """Bind the socket, replacing a stale one left by an agent that died"""
+        import socket
+        if os.path.exists(self.path):
+            if agent_running(self.path):
+                raise AgentError(f"An agent is already running on {self.path}")
+            os.unlink(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # The umask makes the socket owner-only from the moment it exists
+        old_umask = os.umask(0o177)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        listener.listen(8)
+        return listener
+    
+    def serve(self):
+        """Answer requests until the agent times out or is told to lock"""
+        import socket
+        listener = self.listen()
+        self.running = True
+        self.touch()
+        self.sleep_watch.expect(0)
+        try:
+            while self.running:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0 or self.slept():
+                    break
+                wait = min(remaining, SLEEP_CHECK_SECONDS) if self.settings["lock_on_sleep"] else remaining
+                self.sleep_watch.expect(wait)
+                listener.settimeout(wait)
+                try:
+                    conn, _ = listener.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    self.handle(conn)
+        finally:
+            listener.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+    
+    def handle(self, conn):
+        """Read one request from conn and write the response"""
+        import socket
+        # Only processes of the same user may ask; SO_PEERCRED is Linux-only, the
+        # socket permissions cover other systems
+        if hasattr(socket, "SO_PEERCRED"):
+            creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+            if struct.unpack("3i", creds)[1] != os.getuid():
+                return
+        conn.settimeout(AGENT_TIMEOUT_SECONDS)
+        try:
+            data = b""
+            while not data.endswith(b"\n") and len(data) <= AGENT_REQUEST_BYTES:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            
+            # Waking from sleep locks before anything is answered
+            if self.slept():
+                self.running = False
+                response = {"ok": False, "error": "The agent locked after system sleep"}
+            else:
+                self.touch()
+                response = self.respond(data)
+            conn.sendall(json.dumps(response).encode("utf-8") + b"\n")
+        except OSError:
+            # The client went away; nothing to answer
+            pass
+    
+    def respond(self, data):
+        """Turn one request line into a response object"""
+        try:
+            request = json.loads(data)
+            op = request["op"]
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": "Malformed request"}
+        try:
+            if op == "status":
+                return {"ok": True, "entries": self.store.count(), "pid": os.getpid(),
+                        "locks_in": round(self.deadline - time.monotonic())}
+            if op == "list":
+                return {"ok": True, "entries": list(self.store.iter_entries(decrypt=False))}
+            if op == "search":
+                return {"ok": True, "entries": self.store.search(str(request.get("term", "")))}
+            if op == "get":
+                return {"ok": True, "entry": self.store.lookup(request.get("id"), request.get("term"))}
+            if op == "lock":
+                self.running = False
+                return {"ok": True}
+        except EntryLookupError as e:
+            return {"ok": False, "error": str(e), "matches": e.matches}
+        except (ValueError, sqlite3.Error) as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": False, "error": f"Unknown request: {op}"}
+
+
+def agent_request(op, path=AGENT_SOCKET_PATH, **params):
+    """Send one request to the agent and return its response
+    
+    Raises OSError if no agent is listening and AgentError if it refuses.
+    """
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(AGENT_TIMEOUT_SECONDS)
+        conn.connect(path)
+        conn.sendall(json.dumps(dict(params, op=op)).encode("utf-8") + b"\n")
+        data = b""
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    try:
+        response = json.loads(data)
+    except ValueError:
+        raise AgentError("The agent sent an unreadable response")
+    if not response.get("ok"):
+        raise AgentError(response.get("error", "Request failed"), response.get("matches"))
+    return response
+
+
+def agent_running(path=AGENT_SOCKET_PATH):
+    """Return True if an agent answers on path"""
+    try:
+        agent_request("status", path)
+        return True
+    except (OSError, AgentError):
+        return False
+
+
+def start_agent(vault_key, path=AGENT_SOCKET_PATH):
+    """Start a detached agent process holding vault_key; returns False if one was already running"""
+    import subprocess
+    if agent_running(path):
+        return False
+    # The key goes through a pipe, never the command line or the environment
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--agent-serve"],
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    process.stdin.write(vault_key + b"\n")
+    process.stdin.close()
+    
+    deadline = time.monotonic() + AGENT_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if agent_running(path):
+            return True
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    raise AgentError("The agent did not start")
+
+
+def stop_agent(path=AGENT_SOCKET_PATH):
+    """Tell a running agent to forget the key and exit; returns False if none was running"""
+    try:
+        agent_request("lock", path)
+        return True
+    except (OSError, AgentError):
+        return False
+
 
 class PasswordManager:
     def __init__(self, root):
-        # Add at the beginning of __init__ method, before other code
-        # Check for reset command
-        if len(sys.argv) == 3 and sys.argv[1] == '--reset':
-            self.reset_master_password(sys.argv[2])
-            sys.exit(0)
-            
         self.root = root
         self.root.title("Secure Password Manager")
         self.root.geometry("900x600")
@@ -30,6 +4118,10 @@ class PasswordManager:
         style = ttk.Style()
         style.theme_use('clam')
         
+        # Fixed row height lets the virtual list work out how many rows fit
+        self.tree_row_height = 24
+        self.tree_heading_height = 28
+        
         # Colors
         self.bg_color = "#2E3440"  # Dark blue-gray
         self.accent_color = "#88C0D0"  # Light blue
@@ -61,32 +4153,40 @@ class PasswordManager:
                         background=self.bg_color, 
                         foreground=self.accent_color, 
                         font=("Segoe UI", 20, "bold"))
-        style.configure("Treeview", 
-                        background="#3B4252", 
-                        foreground=self.text_color, 
-                        fieldbackground="#3B4252",
-                        font=("Segoe UI", 10))
-        style.map("Treeview", 
-                 background=[("selected", self.highlight_color)],
-                 foreground=[("selected", self.text_color)])
-        style.configure("Treeview.Heading", 
-                        background=self.bg_color, 
-                        foreground=self.accent_color, 
-                        font=("Segoe UI", 11, "bold"))
+        # Styles only the main screen uses are configured when it is first shown
+        self.main_styles_configured = False
         
         # Security variables
-        self.master_password = None
         self.cipher_suite = None
+        self.vault_key = None
         self.salt = None
-        self.inactivity_timer = None
-        self.auto_lock_time = 180  # seconds (3 minutes)
-        self.last_activity_time = time.time()
+        self.settings = load_settings()
+        self.password_generator = None
+        
+        # Key derivation runs on a worker thread; results come back through this queue
+        self.unlock_queue = queue.Queue()
+        self.unlock_job = 0
+        self.unlock_widgets = []
+        self.search_controller = None
+        
+        # Fuzzy index for the quick switcher, built in the background after unlock
+        self.quick_index = None
+        self.quick_index_job = 0
+        self.quick_switcher = None
+        self.secrets_window = None
+        
+        # Bumped on lock; results of background work started before then are dropped
+        self.operation_generation = 0
+        
+        # Latency histograms are written to a local rotating log on lock and exit
+        self.metrics_log = MetricsLog()
+        self.diagnostics_window = None
         
         # Database setup
         self.setup_database()
         
         # Define a consistent path for config.dat
-        self.config_path = os.path.join(os.path.expanduser("~"), ".password_manager_config.dat")
+        self.config_path = CONFIG_PATH
         
         # Check if first run
         self.first_run = not os.path.exists(self.config_path)
@@ -98,55 +4198,92 @@ class PasswordManager:
         # Show login screen first
         self.show_login_screen()
         
-        # Bind activity monitoring
-        self.root.bind("<Button-1>", self.reset_inactivity_timer)
-        self.root.bind("<Key>", self.reset_inactivity_timer)
+        # Bind activity monitoring; events only record a timestamp
+        self.auto_lock = AutoLock(self.root, self.lock_application, self.settings,
+                                  busy=lambda: self.storage is not None and self.storage.busy())
+        self.root.bind("<Button-1>", self.auto_lock.touch)
+        self.root.bind("<Key>", self.auto_lock.touch)
+        self.root.bind("<Control-k>", self.show_quick_switcher)
         
+        # Load cryptography and open the database once the login screen has painted
+        self.root.after_idle(self.start_preload)
+    
+    def configure_main_styles(self):
+        """Configure the Treeview styles the first time the main screen is shown"""
+        if self.main_styles_configured:
+            return
+        self.main_styles_configured = True
+        style = ttk.Style()
+        style.configure("Treeview", 
+                        background="#3B4252", 
+                        foreground=self.text_color, 
+                        fieldbackground="#3B4252",
+                        font=("Segoe UI", 10),
+                        rowheight=self.tree_row_height)
+        style.map("Treeview", 
+                 background=[("selected", self.highlight_color)],
+                 foreground=[("selected", self.text_color)])
+        style.configure("Treeview.Heading", 
+                        background=self.bg_color, 
+                        foreground=self.accent_color, 
+                        font=("Segoe UI", 11, "bold"))
+    
     def setup_database(self):
         # Use a consistent path for the database
-        db_path = os.path.join(os.path.expanduser("~"), "passwords.db")
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
-        
-        # Create tables if they don't exist
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS passwords (
-            id INTEGER PRIMARY KEY,
-            service_name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            encrypted_password TEXT NOT NULL
-        )
-        ''')
+        self.db_path = DB_PATH
         
-        self.conn.commit()
+        # Created by the preload thread: tables are created and migrated there, writes
+        # go through the storage writer thread and reads use per-thread connections
+        self.storage = None
+        self.search_index = None
+        self.preload_thread = None
+        self.preload_error = None
     
-    def reset_inactivity_timer(self, event=None):
-        """Reset the inactivity timer"""
-        self.last_activity_time = time.time()
-        if self.inactivity_timer:
-            self.root.after_cancel(self.inactivity_timer)
-        
-        if self.master_password:  # Only set timer if logged in
-            self.inactivity_timer = self.root.after(1000, self.check_inactivity)
+    def start_preload(self):
+        """Start importing cryptography and opening the database in the background, once"""
+        if self.preload_thread is None:
+            self.preload_thread = threading.Thread(target=self.preload, daemon=True)
+            self.preload_thread.start()
     
-    def check_inactivity(self):
-        """Check for inactivity and lock if necessary"""
-        if time.time() - self.last_activity_time > self.auto_lock_time:
-            # Lock the application
-            self.lock_application()
-            return
-        
-        # Continue checking
-        self.inactivity_timer = self.root.after(1000, self.check_inactivity)
+    def preload(self):
+        try:
+            with METRICS.timer("startup.preload"):
+                load_crypto()
+                self.storage = VaultStorage(self.db_path)
+        except Exception as e:
+            self.preload_error = e
+    
+    def wait_for_preload(self):
+        """Block until the preload has finished (worker threads only); re-raises its error"""
+        self.preload_thread.join()
+        if self.preload_error is not None:
+            raise self.preload_error
     
     def lock_application(self):
         """Lock the application and return to login screen"""
-        if self.inactivity_timer:
-            self.root.after_cancel(self.inactivity_timer)
-            self.inactivity_timer = None
+        self.auto_lock.stop()
+        # A locked vault must not stay readable through the command line
+        if self.settings["agent_enabled"]:
+            stop_agent()
         
-        self.master_password = None
         self.cipher_suite = None
+        self.vault_key = None
+        self.operation_generation += 1
+        
+        # Stop background search work
+        if self.search_controller:
+            self.search_controller.close()
+            self.search_controller = None
+        
+        # The quick switcher index holds decrypted metadata; a build still running is discarded
+        self.quick_index = None
+        self.quick_index_job += 1
+        if self.quick_switcher is not None and self.quick_switcher.winfo_exists():
+            self.quick_switcher.destroy()
+        # Password contents search results are closed too; destroying the window stops its search
+        if self.secrets_window is not None and self.secrets_window.winfo_exists():
+            self.secrets_window.destroy()
+        self.metrics_log.write("lock")
         
         # Clear and show login screen
         for widget in self.container.winfo_children():
@@ -154,20 +4291,6 @@ class PasswordManager:
         
         self.show_login_screen()
     
-    def derive_key(self, password, salt=None):
-        """Derive encryption key from password"""
-        if salt is None:
-            salt = secrets.token_bytes(16)
-        
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-        return key, salt
-    
     def show_login_screen(self):
         """Display the login screen"""
         self.clear_container()
@@ -216,6 +4339,10 @@ class PasswordManager:
     
     def pulse_animation(self, widget, alpha=1.0, direction=-1):
         """Create a pulsing animation effect"""
+        # Stop once the login screen has been torn down
+        if not widget.winfo_exists():
+            return
+        
         new_alpha = alpha + direction * 0.05
         
         if new_alpha <= 0.5:
@@ -235,6 +4362,10 @@ class PasswordManager:
     
     def authenticate(self):
         """Authenticate the user with their master password"""
+        # Ignore repeated submits while a derivation is already running
+        if self.unlock_widgets:
+            return
+        
         entered_password = self.password_entry.get()
         
         if not entered_password:
@@ -263,74 +4394,154 @@ class PasswordManager:
                 messagebox.showerror("Error", "Passwords do not match. Please try again.")
                 return
             
-            try:
-                # Create salt and initial key
-                self.salt = secrets.token_bytes(16)
-                key, _ = self.derive_key(entered_password, self.salt)
-                
-                # Save salt and key for future verification
-                with open(self.config_path, "wb") as f:
-                    f.write(self.salt + key)
-                
-                # Initialize cipher suite
-                self.cipher_suite = Fernet(key)
-                self.master_password = entered_password
-                
-                messagebox.showinfo("Success", 
-                                  "Master password created successfully!\n\n"
-                                  "Please remember this password carefully.\n"
-                                  "You can reset it later using:\n"
-                                  "python3 password-manager.py --reset <newpasswd>")
-                
-                self.first_run = False
-                self.show_main_screen()
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to initialize password manager: {str(e)}")
-                return
+            # Calibrate the KDF for this machine and create the vault key off the main thread
+            self.start_key_derivation(lambda: create_vault_config(entered_password, self.config_path),
+                                      self.finish_first_run,
+                                      self.first_run_failed)
         else:
-            try:
-                # Load stored salt and key hash
-                with open(self.config_path, "rb") as f:
-                    data = f.read()
-                    stored_salt = data[:16]
-                    stored_key = data[16:]
-                
-                # Derive key from entered password using stored salt
-                derived_key, _ = self.derive_key(entered_password, stored_salt)
-                
-                # Compare derived key with stored key
-                if derived_key != stored_key:
-                    messagebox.showerror("Error", "Incorrect password")
-                    self.password_entry.delete(0, tk.END)
-                    return
-                
-                # Password verified, setup cipher suite
-                self.cipher_suite = Fernet(derived_key)
-                self.master_password = entered_password
-                
-                # Visual feedback
-                self.password_entry.config(state="disabled")
-                unlock_label = ttk.Label(self.container, text="Unlocking vault...", style="TLabel")
-                unlock_label.place(relx=0.5, rely=0.65, anchor="center")
-                
-                # Show main screen after brief delay
-                self.root.after(800, lambda: [unlock_label.destroy(), self.show_main_screen()])
-                
-                # Start inactivity timer
-                self.reset_inactivity_timer()
-                
-            except FileNotFoundError:
+            # Half the entries may already use the new key until the rotation completes
+            if os.path.exists(self.config_path + PENDING_CONFIG_SUFFIX):
+                messagebox.showerror("Error", 
+                                   "A key rotation was interrupted.\n\n"
+                                   "Finish it with:\n"
+                                   "python3 password-manager.py --rotate-key")
+                return
+            
+            if not os.path.exists(self.config_path):
                 messagebox.showerror("Error", "Configuration file not found. Please reset the application.")
                 return
+            
+            # Derive the key-encryption key and unwrap the vault key
+            self.start_key_derivation(lambda: unlock_vault_key(entered_password, self.config_path),
+                                      self.finish_unlock,
+                                      self.unlock_failed)
+    
+    def start_key_derivation(self, derive, on_success, on_error):
+        """Run derive() on a worker thread and show the unlocking state"""
+        self.unlock_job += 1
+        job_id = self.unlock_job
+        
+        # The user may have been quicker than the idle callback that starts the preload
+        self.start_preload()
+        
+        # Visual feedback while the KDF runs
+        self.password_entry.config(state="disabled")
+        unlock_label = ttk.Label(self.container, text="Unlocking vault...", style="TLabel")
+        unlock_label.place(relx=0.5, rely=0.75, anchor="center")
+        progress = ttk.Progressbar(self.container, mode="indeterminate", length=200)
+        progress.place(relx=0.5, rely=0.80, anchor="center")
+        progress.start(15)
+        cancel_button = ttk.Button(self.container, text="Cancel", command=self.cancel_key_derivation)
+        cancel_button.place(relx=0.5, rely=0.87, anchor="center")
+        self.unlock_widgets = [unlock_label, progress, cancel_button]
+        
+        def worker():
+            try:
+                self.wait_for_preload()
+                with METRICS.timer("unlock.derive"):
+                    key = derive()
+                self.unlock_queue.put((job_id, key, None))
             except Exception as e:
-                messagebox.showerror("Error", "Invalid password or corrupted configuration")
-                self.password_entry.delete(0, tk.END)
-                return
+                self.unlock_queue.put((job_id, None, e))
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(50, lambda: self.poll_key_derivation(job_id, on_success, on_error, time.time()))
+    
+    def poll_key_derivation(self, job_id, on_success, on_error, started):
+        """Check the worker queue for a derived key without blocking the event loop"""
+        # A newer job or a cancel has superseded this one
+        if job_id != self.unlock_job:
+            return
+        
+        try:
+            result_job, result, error = self.unlock_queue.get_nowait()
+        except queue.Empty:
+            if self.unlock_widgets:
+                elapsed = time.time() - started
+                self.unlock_widgets[0].config(text=f"Unlocking vault... ({elapsed:.1f}s)")
+            self.root.after(50, lambda: self.poll_key_derivation(job_id, on_success, on_error, started))
+            return
+        
+        # Results from cancelled jobs are stale; keep waiting for ours
+        if result_job != job_id:
+            self.root.after(50, lambda: self.poll_key_derivation(job_id, on_success, on_error, started))
+            return
+        
+        self.clear_unlock_state()
+        if error is not None:
+            on_error(error)
+            return
+        on_success(result)
+    
+    def cancel_key_derivation(self):
+        """Abandon the running key derivation and return to the password prompt"""
+        # The worker cannot be interrupted, but bumping the job id discards its result
+        self.unlock_job += 1
+        self.clear_unlock_state()
+        self.password_entry.delete(0, tk.END)
+    
+    def clear_unlock_state(self):
+        """Remove the unlocking indicator and re-enable the password entry"""
+        for widget in self.unlock_widgets:
+            widget.destroy()
+        self.unlock_widgets = []
+        if self.password_entry.winfo_exists():
+            self.password_entry.config(state="normal")
+            self.password_entry.focus_set()
+    
+    def finish_first_run(self, key):
+        """Complete first time setup once the vault key is created"""
+        # Initialize cipher suite; the master password is not kept once the key exists
+        self.cipher_suite = VaultCipher(key)
+        self.vault_key = key
+        
+        messagebox.showinfo("Success", 
+                          "Master password created successfully!\n\n"
+                          "Please remember this password carefully.\n"
+                          "You can reset it later using:\n"
+                          "python3 password-manager.py --reset <newpasswd>")
+        
+        self.first_run = False
+        self.show_main_screen()
+        
+        # Start inactivity timer
+        self.auto_lock.start()
+        self.start_agent_if_enabled()
+        self.start_quick_index()
+    
+    def first_run_failed(self, error):
+        """Report a failed first time setup"""
+        messagebox.showerror("Error", f"Failed to initialize password manager: {str(error)}")
+    
+    def finish_unlock(self, key):
+        """Complete login once the vault key has been unwrapped"""
+        # Password verified, setup cipher suite; only the vault key stays in memory
+        self.cipher_suite = VaultCipher(key)
+        self.vault_key = key
+        
+        self.show_main_screen()
+        
+        # Start inactivity timer
+        self.auto_lock.start()
+        self.start_agent_if_enabled()
+        self.start_quick_index()
+        
+        # Vaults from older versions are converted step by step in the background
+        self.start_vault_upgrades()
+    
+    def unlock_failed(self, error):
+        """Report a wrong password or unreadable config"""
+        if isinstance(error, IncorrectPasswordError):
+            messagebox.showerror("Error", "Incorrect password")
+        else:
+            messagebox.showerror("Error", "Invalid password or corrupted configuration")
+        self.password_entry.delete(0, tk.END)
     
     def show_main_screen(self):
         """Display the main password manager screen"""
         self.clear_container()
+        self.configure_main_styles()
+        self.search_index = SearchIndex(self.storage.reader(), self.cipher_suite)
         
         # Header frame
         header_frame = ttk.Frame(self.container, style="TFrame")
@@ -355,6 +4566,29 @@ class PasswordManager:
         delete_button = ttk.Button(buttons_frame, text="Delete", command=self.delete_password)
         delete_button.pack(side=tk.LEFT, padx=5)
         
+        # Less frequent vault operations live in a drop-down menu
+        tools_button = ttk.Menubutton(buttons_frame, text="Tools")
+        self.tools_menu = tk.Menu(tools_button, tearoff=False)
+        self.tools_menu.add_command(label="Quick Switch...", accelerator="Ctrl+K", command=self.show_quick_switcher)
+        self.tools_menu.add_separator()
+        self.tools_menu.add_command(label="Import...", command=self.import_passwords)
+        self.tools_menu.add_command(label="Generate Passwords...", command=self.bulk_generate)
+        self.tools_menu.add_command(label="Breach Audit...", command=self.audit_vault)
+        self.tools_menu.add_command(label="Password Reuse...", command=self.show_reuse_report)
+        self.tools_menu.add_command(label="Search Password Contents...", command=self.search_secrets)
+        self.tools_menu.add_separator()
+        self.tools_menu.add_command(label="Back Up...", command=self.backup_vault)
+        self.tools_menu.add_command(label="Restore Backup...", command=self.restore_vault)
+        self.tools_menu.add_command(label="Sync With Vault File...", command=self.sync_vault)
+        self.tools_menu.add_separator()
+        self.tools_menu.add_cascade(label="Auto-Lock", menu=self.build_auto_lock_menu(self.tools_menu))
+        self.agent_var = tk.BooleanVar(value=self.settings["agent_enabled"])
+        self.tools_menu.add_checkbutton(label="Serve Command-Line Lookups", variable=self.agent_var,
+                                        command=self.update_agent)
+        self.tools_menu.add_command(label="Diagnostics...", command=self.show_diagnostics)
+        tools_button.configure(menu=self.tools_menu)
+        tools_button.pack(side=tk.LEFT, padx=5)
+        
         # Add a spacer
         ttk.Frame(buttons_frame, width=40, style="TFrame").pack(side=tk.LEFT)
         
@@ -367,6 +4601,8 @@ class PasswordManager:
         
         self.search_var = tk.StringVar()
         self.search_var.trace("w", lambda name, index, mode: self.filter_passwords())
+        self.search_controller = SearchController(self.root, self.db_path, self.cipher_suite,
+                                                  self.show_search_results)
         search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=20, style="TEntry")
         search_entry.pack(side=tk.LEFT, padx=5)
         
@@ -390,11 +4626,12 @@ class PasswordManager:
         # Hide the ID column (we'll keep it for reference)
         self.tree.column("ID", width=0, stretch=tk.NO)
         
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(self.tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscroll=scrollbar.set)
+        # Add scrollbar; the virtual list only keeps the visible rows in the tree
+        scrollbar = ttk.Scrollbar(self.tree_frame, orient=tk.VERTICAL)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.tree_view = VirtualTreeview(self.tree, scrollbar,
+                                         self.tree_row_height, self.tree_heading_height)
         
         # Status bar
         status_frame = ttk.Frame(self.container, style="TFrame")
@@ -404,10 +4641,8 @@ class PasswordManager:
         self.status_label.pack(side=tk.LEFT)
         
         # Auto-lock information
-        auto_lock_label = ttk.Label(status_frame, 
-                                   text=f"Auto-lock after {self.auto_lock_time//60} minutes of inactivity", 
-                                   style="TLabel")
-        auto_lock_label.pack(side=tk.RIGHT)
+        self.auto_lock_label = ttk.Label(status_frame, text=self.auto_lock_text(), style="TLabel")
+        self.auto_lock_label.pack(side=tk.RIGHT)
         
         # Double click to view password
         self.tree.bind("<Double-1>", lambda event: self.view_password())
@@ -422,41 +4657,28 @@ class PasswordManager:
     
     def load_passwords(self):
         """Load passwords from database"""
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Get passwords from database
-        self.cursor.execute("SELECT id, service_name, email FROM passwords")
-        passwords = self.cursor.fetchall()
-        
-        # Insert into treeview
-        for password in passwords:
-            self.tree.insert("", tk.END, values=password)
+        # Rows are paged in from SQLite as they scroll into view
+        self.tree_view.set_source(TableRowSource(self.storage.reader(), self.cipher_suite))
         
-        self.status_label.config(text=f"Loaded {len(passwords)} passwords")
+        self.status_label.config(text=f"Loaded {self.tree_view.total()} passwords")
     
     def filter_passwords(self):
         """Filter passwords based on search term"""
-        search_term = self.search_var.get().lower()
-        
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Get passwords from database
-        self.cursor.execute("SELECT id, service_name, email FROM passwords")
-        passwords = self.cursor.fetchall()
+        # Debounced; results arrive in show_search_results
+        self.search_controller.schedule(self.search_var.get())
+    
+    def show_search_results(self, passwords):
+        """Display search results, or every password when the search is empty"""
+        if passwords is None:
+            self.load_passwords()
+            return
         
-        # Filter and insert into treeview
-        filtered_count = 0
-        for password in passwords:
-            if (search_term in password[1].lower() or 
-                search_term in password[2].lower()):
-                self.tree.insert("", tk.END, values=password)
-                filtered_count += 1
+        # Show matches best first; only the visible ones become tree items.
+        # Rows added or edited later stay in the list only if they still match
+        tokens = self.search_index.tokenize(self.search_var.get())
+        self.tree_view.set_source(ListRowSource(passwords, lambda row: self.search_index.matches(row, tokens)))
         
-        self.status_label.config(text=f"Found {filtered_count} matching passwords")
+        self.status_label.config(text=f"Found {len(passwords)} matching passwords")
     
     def add_password(self):
         """Add a new password"""
@@ -506,30 +4728,85 @@ class PasswordManager:
     
     def generate_password(self, entry_widget):
         """Generate a strong random password"""
-        # Characters to use in password
-        uppercase = "ABCDEFGHJKLMNPQRSTUVWXYZ"  # Removed confusing characters
-        lowercase = "abcdefghijkmnopqrstuvwxyz"  # Removed confusing characters
-        digits = "23456789"  # Removed confusing characters
-        symbols = "!@#$%^&*()_+-=[]{}|;:,.<>?"
-        
-        # Generate password with at least one of each type
-        password = []
-        password.append(secrets.choice(uppercase))
-        password.append(secrets.choice(lowercase))
-        password.append(secrets.choice(digits))
-        password.append(secrets.choice(symbols))
-        
-        # Fill up to 16 characters
-        all_chars = uppercase + lowercase + digits + symbols
-        password.extend(secrets.choice(all_chars) for _ in range(12))
-        
-        # Shuffle the password
-        secrets.SystemRandom().shuffle(password)
+        # 16 characters with at least one of each class, from the shared buffered generator
+        if self.password_generator is None:
+            self.password_generator = PasswordGenerator()
         
         # Set the password in the entry widget
-        password_str = ''.join(password)
         entry_widget.delete(0, tk.END)
-        entry_widget.insert(0, password_str)
+        entry_widget.insert(0, self.password_generator.generate())
+    
+    def bulk_generate(self):
+        """Generate many passwords or passphrases for a policy and save or copy them"""
+        popup = tk.Toplevel(self.root)
+        popup.title("Generate Passwords")
+        popup.geometry("460x520")
+        popup.configure(bg=self.bg_color)
+        popup.transient(self.root)
+        
+        frame = ttk.Frame(popup, style="TFrame")
+        frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        ttk.Label(frame, text="Generate Passwords", style="Header.TLabel").grid(row=0, column=0, columnspan=4, pady=(0, 15))
+        
+        count_var = tk.IntVar(value=100)
+        length_var = tk.IntVar(value=16)
+        words_var = tk.IntVar(value=0)
+        exclude_var = tk.StringVar()
+        class_vars = {name: tk.BooleanVar(value=True) for name in PASSWORD_CLASSES}
+        
+        ttk.Label(frame, text="How many:", style="TLabel").grid(row=1, column=0, sticky=tk.W, pady=3)
+        ttk.Spinbox(frame, from_=1, to=100000, textvariable=count_var, width=8).grid(row=1, column=1, sticky=tk.W)
+        ttk.Label(frame, text="Length:", style="TLabel").grid(row=2, column=0, sticky=tk.W, pady=3)
+        ttk.Spinbox(frame, from_=4, to=128, textvariable=length_var, width=8).grid(row=2, column=1, sticky=tk.W)
+        ttk.Label(frame, text="Passphrase words:", style="TLabel").grid(row=3, column=0, sticky=tk.W, pady=3)
+        ttk.Spinbox(frame, from_=0, to=20, textvariable=words_var, width=8).grid(row=3, column=1, sticky=tk.W)
+        ttk.Label(frame, text="(0 = characters)", style="TLabel").grid(row=3, column=2, columnspan=2, sticky=tk.W)
+        ttk.Label(frame, text="Exclude:", style="TLabel").grid(row=4, column=0, sticky=tk.W, pady=3)
+        ttk.Entry(frame, textvariable=exclude_var, width=20, style="TEntry").grid(row=4, column=1, columnspan=3, sticky=tk.W)
+        for index, name in enumerate(PASSWORD_CLASSES):
+            ttk.Checkbutton(frame, text=name.capitalize(), variable=class_vars[name]).grid(
+                row=5, column=index, sticky=tk.W, pady=5)
+        
+        output = tk.Text(frame, height=12, width=48, bg="#3B4252", fg=self.text_color, font=("Consolas", 10))
+        output.grid(row=7, column=0, columnspan=4, pady=10)
+        status = ttk.Label(frame, text="", style="TLabel")
+        status.grid(row=8, column=0, columnspan=4, sticky=tk.W)
+        
+        def generate():
+            try:
+                policy = PasswordPolicy(length=length_var.get(),
+                                        classes=[name for name, var in class_vars.items() if var.get()],
+                                        exclude=exclude_var.get(), words=words_var.get())
+                generator = PasswordGenerator(policy)
+                passwords = "\n".join(generator.stream(count_var.get()))
+            except (ValueError, OSError, tk.TclError) as e:
+                messagebox.showerror("Error", str(e), parent=popup)
+                return
+            output.delete("1.0", tk.END)
+            output.insert("1.0", passwords)
+            status.config(text=f"{count_var.get()} generated, about {generator.entropy_bits():.0f} bits each")
+        
+        def save():
+            path = filedialog.asksaveasfilename(parent=popup, title="Save Passwords", defaultextension=".txt",
+                                                filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+            if not path:
+                return
+            try:
+                # Plaintext passwords: readable by the owner only
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(output.get("1.0", "end-1c") + "\n")
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save: {str(e)}", parent=popup)
+                return
+            status.config(text=f"Saved to {path}")
+        
+        buttons = ttk.Frame(frame, style="TFrame")
+        buttons.grid(row=6, column=0, columnspan=4, pady=5)
+        ttk.Button(buttons, text="Generate", command=generate).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Save...", command=save).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Close", command=popup.destroy).pack(side=tk.LEFT, padx=5)
     
     def save_password(self, popup, service, email, password):
         """Save password to database"""
@@ -544,38 +4821,51 @@ class PasswordManager:
                 self.lock_application()
                 return
                 
-            # Ensure password is in bytes before encryption
-            password_bytes = password.encode('utf-8')
-            encrypted_password = self.cipher_suite.encrypt(password_bytes)
-            
-            # Store as string in database
-            encrypted_string = encrypted_password.decode('utf-8')
-            
-            # Save to database
-            self.cursor.execute(
-                "INSERT INTO passwords (service_name, email, encrypted_password) VALUES (?, ?, ?)",
-                (service, email, encrypted_string)
-            )
-            self.conn.commit()
+            # Warn before reusing a password; the fingerprint index answers without decrypting
+            fingerprint = password_fingerprint(fingerprint_key(self.vault_key), password)
+            if not self.confirm_reuse(fingerprint, parent=popup):
+                return
             
-            # Update the view
-            self.load_passwords()
-            popup.destroy()
-            self.status_label.config(text=f"Added password for {service}")
+            with METRICS.timer("crypto.encrypt"):
+                record = self.cipher_suite.encrypt(password)
+                sealed = self.cipher_suite.seal_entry(service, email)
+            
+            # Save to database on the writer thread
+            def insert(conn):
+                return insert_entry(conn, sealed, record, fingerprint)
+            
+            def on_saved(password_id, error):
+                if error is not None:
+                    messagebox.showerror("Error", f"Failed to save password: {str(error)}")
+                    return
+                if not self.tree.winfo_exists():
+                    return
+                self.search_controller.invalidate()
+                self.update_quick_index(lambda index: index.add((password_id, service, email)))
+                
+                # Update the view
+                self.tree_view.apply_insert((password_id, service, email))
+                if popup.winfo_exists():
+                    popup.destroy()
+                self.status_label.config(text=f"Added password for {service}")
+            
+            self.status_label.config(text=f"Saving password for {service}...")
+            self.write_async(insert, on_saved)
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save password: {str(e)}")
     
-    def view_password(self):
-        """View the selected password"""
-        # Get selected item
-        selected = self.tree.selection()
-        if not selected:
-            messagebox.showinfo("Info", "Please select a password to view")
-            return
-        
-        # Get password ID
-        password_id = self.tree.item(selected[0], "values")[0]
+    def view_password(self, password_id=None):
+        """View the selected password, or the entry password_id"""
+        if password_id is None:
+            # Get selected item
+            selected = self.tree.selection()
+            if not selected:
+                messagebox.showinfo("Info", "Please select a password to view")
+                return
+            
+            # Get password ID
+            password_id = self.tree.item(selected[0], "values")[0]
         
         try:
             # Verify cipher suite is initialized
@@ -585,41 +4875,62 @@ class PasswordManager:
                 return
 
             # Get encrypted password from database
-            self.cursor.execute("SELECT service_name, email, encrypted_password FROM passwords WHERE id = ?", (password_id,))
-            result = self.cursor.fetchone()
+            result = self.storage.reader().execute(
+                f"SELECT {ENTRY_COLUMNS}, encrypted_password FROM passwords WHERE id = ?", (password_id,)
+            ).fetchone()
             
             if not result:
                 messagebox.showerror("Error", "Password not found")
                 return
             
-            service, email, encrypted_password = result
-            
             try:
-                # Ensure we're working with proper string/bytes encoding
-                if isinstance(encrypted_password, str):
-                    encrypted_bytes = encrypted_password.encode('utf-8')
-                else:
-                    encrypted_bytes = encrypted_password
-                    
-                # Decrypt the password
-                decrypted_password = self.cipher_suite.decrypt(encrypted_bytes)
-                if isinstance(decrypted_password, bytes):
-                    decrypted_password = decrypted_password.decode('utf-8')
-                
-                # Create and configure popup window for display
-                # ... rest of the popup creation code remains the same ...
-                
-            except Exception as e:
-                print(f"DEBUG - Decryption error details: {str(e)}")  # Detailed error for debugging
-                print(f"DEBUG - Encrypted password type: {type(encrypted_password)}")
-                print(f"DEBUG - Encrypted password: {encrypted_password[:20]}...")  # Show first 20 chars
+                service, email, decrypted_password = self.decrypt_row(result)
+            except Exception:
+                # Never print or log the token or the error text; timings are in the metrics
                 messagebox.showerror("Error", 
                                    "Failed to decrypt password. Please try logging out and back in.")
                 self.status_label.config(text="Error: Failed to decrypt password")
                 return
+            self.record_access(int(password_id))
                 
             # Create popup window to display password
-            # ... rest of the view_password method remains the same ...
+            popup = tk.Toplevel(self.root)
+            popup.title("View Password")
+            popup.geometry("400x260")
+            popup.resizable(False, False)
+            popup.configure(bg=self.bg_color)
+            popup.transient(self.root)
+            popup.grab_set()
+            
+            # Center the popup
+            popup.geometry("+%d+%d" % (self.root.winfo_x() + 250, self.root.winfo_y() + 150))
+            
+            frame = ttk.Frame(popup, style="TFrame")
+            frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+            
+            ttk.Label(frame, text=service, style="Header.TLabel").grid(row=0, column=0, columnspan=3, pady=(0, 20))
+            
+            ttk.Label(frame, text="Email/Username:", style="TLabel").grid(row=1, column=0, sticky=tk.W, pady=5)
+            ttk.Label(frame, text=email, style="TLabel").grid(row=1, column=1, columnspan=2, sticky=tk.W, pady=5)
+            
+            ttk.Label(frame, text="Password:", style="TLabel").grid(row=2, column=0, sticky=tk.W, pady=5)
+            password_entry = ttk.Entry(frame, width=24, show="●", style="TEntry")
+            password_entry.insert(0, decrypted_password)
+            password_entry.config(state="readonly")
+            password_entry.grid(row=2, column=1, pady=5)
+            
+            show_button = ttk.Button(frame, text="Show")
+            show_button.config(command=lambda: self.toggle_password_visibility(password_entry, show_button))
+            show_button.grid(row=2, column=2, padx=5, pady=5)
+            
+            copy_button = ttk.Button(frame, text="Copy Password",
+                                     command=lambda: self.copy_to_clipboard(decrypted_password, int(password_id)))
+            copy_button.grid(row=3, column=0, columnspan=3, pady=10)
+            
+            close_button = ttk.Button(frame, text="Close", command=popup.destroy)
+            close_button.grid(row=4, column=0, columnspan=3, pady=5)
+            
+            self.status_label.config(text=f"Viewing password for {service}")
             
         except Exception as e:
             messagebox.showerror("Error", f"Error accessing password: {str(e)}")
@@ -634,8 +4945,17 @@ class PasswordManager:
             entry_widget.config(show="●")
             button.config(text="Show")
     
-    def copy_to_clipboard(self, text):
-        """Copy text to clipboard"""
+    def decrypt_row(self, row):
+        """Decrypt an ENTRY_COLUMNS + encrypted_password row to (service, email, password)"""
+        # Records and legacy Fernet tokens are both handled by the cipher
+        with METRICS.timer("crypto.decrypt"):
+            _, service, email = self.cipher_suite.entry(row[:5])
+            return service, email, self.cipher_suite.decrypt(row[5]).decode('utf-8')
+    
+    def copy_to_clipboard(self, text, password_id=None):
+        """Copy text to clipboard; password_id counts as an access to that entry"""
+        if password_id is not None:
+            self.record_access(password_id)
         self.root.clipboard_clear()
         self.root.clipboard_append(text)
         self.status_label.config(text="Password copied to clipboard (will clear in 10 sec)")
@@ -656,18 +4976,19 @@ class PasswordManager:
         password_id = self.tree.item(selected[0], "values")[0]
         
         # Get password from database
-        self.cursor.execute("SELECT service_name, email, encrypted_password FROM passwords WHERE id = ?", (password_id,))
-        result = self.cursor.fetchone()
+        result = self.storage.reader().execute(
+            f"SELECT {ENTRY_COLUMNS}, encrypted_password FROM passwords WHERE id = ?", (password_id,)
+        ).fetchone()
         
         if not result:
             messagebox.showerror("Error", "Password not found")
             return
         
-        service, email, encrypted_password = result
-        
         try:
-            # Decrypt password
-            decrypted_password = self.cipher_suite.decrypt(encrypted_password.encode()).decode()
+            # Decrypt the entry
+            with METRICS.timer("crypto.decrypt"):
+                _, service, email = self.cipher_suite.entry(result[:5])
+                decrypted_password = self.cipher_suite.decrypt(result[5]).decode()
             
             # Create popup window
             popup = tk.Toplevel(self.root)
@@ -727,27 +5048,53 @@ class PasswordManager:
             return
         
         try:
-            # Encrypt password
-            encrypted_password = self.cipher_suite.encrypt(password.encode()).decode()
+            fingerprint = password_fingerprint(fingerprint_key(self.vault_key), password)
+            if not self.confirm_reuse(fingerprint, exclude_id=int(password_id), parent=popup):
+                return
             
-            # Update database
-            self.cursor.execute(
-                "UPDATE passwords SET service_name = ?, email = ?, encrypted_password = ? WHERE id = ?",
-                (service, email, encrypted_password, password_id)
-            )
-            self.conn.commit()
+            # Encrypt password
+            with METRICS.timer("crypto.encrypt"):
+                encrypted_password = self.cipher_suite.encrypt(password)
+                sealed = self.cipher_suite.seal_entry(service, email)
             
-            # Update the view
-            self.load_passwords()
+            # Update database on the writer thread
+            def update(conn):
+                update_entry(conn, int(password_id), sealed, encrypted_password, fingerprint)
+                log_change(conn, int(password_id))
             
-            # Close popup
-            popup.destroy()
+            def on_updated(_, error):
+                if error is not None:
+                    messagebox.showerror("Error", f"Failed to update password: {str(error)}")
+                    return
+                if not self.tree.winfo_exists():
+                    return
+                self.search_controller.invalidate()
+                self.update_quick_index(lambda index: index.replace((int(password_id), service, email)))
+                
+                # Update the view
+                self.tree_view.apply_update((int(password_id), service, email))
+                
+                # Close popup
+                if popup.winfo_exists():
+                    popup.destroy()
+                
+                # Show success message
+                self.status_label.config(text=f"Updated password for {service}")
             
-            # Show success message
-            self.status_label.config(text=f"Updated password for {service}")
+            self.write_async(update, on_updated)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to update password: {str(e)}")
     
+    def confirm_reuse(self, fingerprint, exclude_id=None, parent=None):
+        """Ask before saving a password other entries already use; returns True to go ahead"""
+        count = reuse_count(self.storage.reader(), fingerprint, exclude_id)
+        if not count:
+            return True
+        entries = "entry" if count == 1 else "entries"
+        return messagebox.askyesno("Password Reuse",
+                                   f"This password is already used by {count} other {entries}.\n\n"
+                                   "Save it anyway?", parent=parent)
+    
     def delete_password(self):
         """Delete the selected password"""
         # Get selected item
@@ -767,100 +5114,704 @@ class PasswordManager:
         if not confirm:
             return
         
-        try:
-            # Delete from database
-            self.cursor.execute("DELETE FROM passwords WHERE id = ?", (password_id,))
-            self.conn.commit()
+        # Delete from database on the writer thread
+        def delete(conn):
+            delete_entry(conn, int(password_id))
+        
+        def on_deleted(_, error):
+            if error is not None:
+                messagebox.showerror("Error", f"Failed to delete password: {str(error)}")
+                return
+            if not self.tree.winfo_exists():
+                return
+            self.search_controller.invalidate()
+            self.update_quick_index(lambda index: index.remove(int(password_id)))
             
             # Update the view
-            self.load_passwords()
+            self.tree_view.apply_delete(int(password_id))
             
             # Show success message
             self.status_label.config(text=f"Deleted password for {service}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to delete password: {str(e)}")
-
-    def reset_master_password(self, new_password):
-        """Reset the master password and re-encrypt all stored passwords"""
-        config_path = os.path.join(os.path.expanduser("~"), ".password_manager_config.dat")
-        db_path = os.path.join(os.path.expanduser("~"), "passwords.db")
-
-        # Validate new password strength
-        if len(new_password) < 8:
-            print("Error: Password must be at least 8 characters long")
-            sys.exit(1)
         
-        if not any(c.isupper() for c in new_password) or \
-           not any(c.islower() for c in new_password) or \
-           not any(c.isdigit() for c in new_password):
-            print("Error: Password must contain uppercase, lowercase letters and numbers")
-            sys.exit(1)
+        self.write_async(delete, on_deleted)
+    
+    def start_vault_upgrades(self, pending=None):
+        """Bring entries saved by older versions up to date in the background, one step at a time"""
+        if pending is None:
+            pending = list(VAULT_UPGRADES)
+        while pending and not pending[0][0].needed(self.storage.reader()):
+            pending.pop(0)
+        if not pending:
+            return
+        upgrade, label = pending.pop(0)
+        key = self.vault_key
+        
+        def work(progress):
+            return self.storage.submit(lambda conn: upgrade(conn, key).run(
+                lambda done, total: progress((done, total))), exclusive=True).result()
+        
+        def on_progress(value):
+            if self.tree.winfo_exists():
+                self.status_label.config(text=f"{label}... {value[0]}/{value[1]}")
+        
+        def on_done(failed, error):
+            if not self.tree.winfo_exists():
+                return
+            if error is not None:
+                self.status_label.config(text=f"{label} stopped: {str(error)}")
+                return
+            if failed:
+                self.status_label.config(text=f"{label} skipped {len(failed)} unreadable passwords")
+            else:
+                self.status_label.config(text="Ready")
+            # Steps run one after the other so they do not compete for the writer or the status bar
+            self.start_vault_upgrades(pending)
+        
+        self.run_in_background(work, on_progress, on_done)
+    
+    def search_secrets(self):
+        """Find entries whose password contains some text, listing matches as they are found"""
+        text = simpledialog.askstring("Search Password Contents",
+                                      "Find passwords containing:", show="●", parent=self.root)
+        if not text:
+            return
+        
+        # One search at a time, so lock_application has a single window to close
+        if self.secrets_window is not None and self.secrets_window.winfo_exists():
+            self.secrets_window.destroy()
+        window = tk.Toplevel(self.root)
+        window.title("Password Contents Search")
+        window.geometry("520x400")
+        window.configure(bg=self.bg_color)
+        self.secrets_window = window
+        
+        # Tk may only be touched from its own thread, so the worker watches this instead
+        closed = threading.Event()
+        window.bind("<Destroy>", lambda event: closed.set() if event.widget is window else None)
+        
+        frame = ttk.Frame(window, style="TFrame")
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        summary = ttk.Label(frame, text="Searching...", style="TLabel")
+        summary.pack(anchor=tk.W, pady=(0, 10))
+        
+        table = ttk.Treeview(frame, columns=("Service", "Email"), show="headings")
+        table.heading("Service", text="Service")
+        table.heading("Email", text="Email/Username")
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        table.pack(fill=tk.BOTH, expand=True)
+        ttk.Button(window, text="Close", command=window.destroy).pack(pady=10)
+        
+        key = self.vault_key
+        db_path = self.db_path
+        found = [0]
+        
+        def work(progress):
+            # Matches go to the window chunk by chunk; plaintext stays in this thread
+            conn = connect_database(db_path)
+            try:
+                searcher = BulkDecryptor(conn, key)
+                for matches in searcher.search(text, lambda done, total: progress((done, total, None))):
+                    if matches:
+                        progress((None, None, matches))
+                    if closed.is_set():
+                        break
+            finally:
+                conn.close()
+        
+        def on_progress(value):
+            if not table.winfo_exists():
+                return
+            done, total, matches = value
+            if matches:
+                found[0] += len(matches)
+                for _, service, email in matches:
+                    table.insert("", tk.END, values=(service, email))
+            else:
+                summary.config(text=f"Searching... {done}/{total} checked, {found[0]} found")
+        
+        def on_done(_, error):
+            if not table.winfo_exists():
+                return
+            if error is not None:
+                summary.config(text=f"Search failed: {str(error)}")
+                return
+            summary.config(text=f"{found[0]} passwords contain the text")
+        
+        self.run_in_background(work, on_progress, on_done)
+    
+    def show_reuse_report(self):
+        """List groups of entries that share a password"""
+        groups = reuse_groups(self.storage.reader(), self.cipher_suite)
+        
+        window = tk.Toplevel(self.root)
+        window.title("Password Reuse")
+        window.geometry("520x400")
+        window.configure(bg=self.bg_color)
+        
+        frame = ttk.Frame(window, style="TFrame")
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        reused = sum(len(group) for group in groups)
+        summary = f"{reused} entries share {len(groups)} passwords" if groups else "No passwords are reused"
+        if FingerprintBackfill.needed(self.storage.reader()):
+            summary += " (indexing is still running; some entries are not checked yet)"
+        ttk.Label(frame, text=summary, style="TLabel").pack(anchor=tk.W, pady=(0, 10))
+        
+        table = ttk.Treeview(frame, columns=("Service", "Email"), show="tree headings")
+        table.heading("#0", text="Group")
+        table.heading("Service", text="Service")
+        table.heading("Email", text="Email/Username")
+        table.column("#0", width=80)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        table.pack(fill=tk.BOTH, expand=True)
+        for number, group in enumerate(groups, 1):
+            parent = table.insert("", tk.END, text=f"#{number} ({len(group)})", open=True)
+            for _, service, email in group:
+                table.insert(parent, tk.END, values=(service, email))
+        
+        ttk.Button(window, text="Close", command=window.destroy).pack(pady=10)
+    
+    def write_async(self, job, on_done):
+        """Run job(conn) on the storage writer thread and call on_done(result, error) on the Tk thread"""
+        future = self.storage.submit(job)
+        generation = self.operation_generation
+        
+        def poll():
+            if generation != self.operation_generation:
+                # Locked meanwhile: the widgets the result was meant for are gone
+                return
+            if not future.done():
+                self.root.after(20, poll)
+                return
+            error = future.exception()
+            on_done(None if error is not None else future.result(), error)
+        
+        self.root.after(20, poll)
 
+    def run_in_background(self, work, on_progress, on_done):
+        """Run work(progress) on a worker thread, relaying progress and the result via root.after
+        
+        Progress and the result are dropped if the vault is locked before they arrive.
+        """
+        updates = queue.Queue()
+        generation = self.operation_generation
+        
+        def worker():
+            try:
+                result = work(lambda value: updates.put(("progress", value)))
+                updates.put(("done", result))
+            except Exception as e:
+                updates.put(("error", e))
+        
+        def poll():
+            if generation != self.operation_generation:
+                return
+            try:
+                while True:
+                    kind, value = updates.get_nowait()
+                    if kind == "progress":
+                        on_progress(value)
+                    else:
+                        on_done(value if kind == "done" else None, value if kind == "error" else None)
+                        return
+            except queue.Empty:
+                pass
+            self.root.after(100, poll)
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+    
+    def import_passwords(self):
+        """Bulk import passwords from a CSV or JSON export"""
+        path = filedialog.askopenfilename(
+            title="Import Passwords",
+            filetypes=[("Password exports", "*.csv *.json"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        
+        key = self.vault_key
+        
+        def work(progress):
+            # The import runs alone on the writer thread as a single transaction
+            return self.storage.submit(
+                lambda conn: BulkImporter(conn, key).run(iter_import_records(path), progress),
+                exclusive=True
+            ).result()
+        
+        def on_progress(stats):
+            self.status_label.config(text=f"Importing... {stats['imported']} added, {stats['skipped']} duplicates")
+        
+        def on_done(stats, error):
+            if error is not None:
+                messagebox.showerror("Error", f"Import failed: {str(error)}")
+                self.status_label.config(text="Import failed; no entries were added")
+                return
+            if self.search_controller:
+                self.search_controller.invalidate()
+            self.start_quick_index()
+            self.load_passwords()
+            self.status_label.config(
+                text=f"Imported {stats['imported']} passwords "
+                     f"({stats['skipped']} duplicates, {stats['invalid']} without a password skipped)")
+        
+        self.status_label.config(text="Importing...")
+        self.run_in_background(work, on_progress, on_done)
+    
+    def backup_vault(self):
+        """Write an encrypted backup of the whole vault"""
+        path = filedialog.asksaveasfilename(
+            title="Back Up Vault",
+            defaultextension=".pmbak",
+            initialfile=f"passwords-{time.strftime('%Y%m%d')}.pmbak",
+            filetypes=[("Password manager backup", "*.pmbak"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        
+        passphrase = simpledialog.askstring("Backup Password", "Password for this backup:", show="●")
+        if not passphrase:
+            return
+        confirm = simpledialog.askstring("Confirm Password", "Confirm the backup password:", show="●")
+        if confirm != passphrase:
+            messagebox.showerror("Error", "Passwords do not match. Please try again.")
+            return
+        
+        key = self.vault_key
+        db_path = self.db_path
+        config_path = self.config_path
+        
+        def work(progress):
+            # Protect the backup with this vault's KDF cost
+            kdf_params = load_config(config_path)["kdf"]
+            conn = connect_database(db_path)
+            try:
+                return write_backup(conn, key, path, passphrase, kdf_params, progress)
+            finally:
+                conn.close()
+        
+        def on_done(count, error):
+            if error is not None:
+                messagebox.showerror("Error", f"Backup failed: {str(error)}")
+                self.status_label.config(text="Backup failed")
+                return
+            self.status_label.config(text=f"Backed up {count} passwords to {os.path.basename(path)}")
+        
+        self.status_label.config(text="Backing up...")
+        self.run_in_background(work, lambda count: self.status_label.config(text=f"Backing up... {count} passwords"),
+                               on_done)
+    
+    def audit_vault(self):
+        """Check every password against an offline breach list and show the hits"""
+        path = filedialog.askopenfilename(
+            title="Choose Breach List",
+            filetypes=[("Binary SHA-1 list", "*.bin"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        
+        key = self.vault_key
+        db_path = self.db_path
+        
+        def work(progress):
+            conn = connect_database(db_path)
+            try:
+                return BreachAudit(conn, key, path).run(lambda done, total: progress((done, total)))
+            finally:
+                conn.close()
+        
+        def on_done(report, error):
+            if error is not None:
+                messagebox.showerror("Error", f"Audit failed: {str(error)}")
+                self.status_label.config(text="Audit failed")
+                return
+            self.status_label.config(text=f"Audit: {len(report['breached'])} of {report['checked']} "
+                                          f"passwords found in the breach list")
+            self.show_audit_report(report)
+        
+        self.status_label.config(text="Auditing passwords...")
+        self.run_in_background(
+            work, lambda value: self.status_label.config(text=f"Auditing passwords... {value[0]}/{value[1]}"),
+            on_done)
+    
+    def show_audit_report(self, report):
+        """List the entries whose passwords appear in the breach list"""
+        window = tk.Toplevel(self.root)
+        window.title("Breach Audit")
+        window.geometry("520x400")
+        window.configure(bg=self.bg_color)
+        
+        frame = ttk.Frame(window, style="TFrame")
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        summary = f"{len(report['breached'])} of {report['checked']} passwords appear in known breaches"
+        if report["failed"]:
+            summary += f"; {len(report['failed'])} could not be decrypted"
+        ttk.Label(frame, text=summary, style="TLabel").pack(anchor=tk.W, pady=(0, 10))
+        
+        table = ttk.Treeview(frame, columns=("Service", "Email"), show="headings")
+        table.heading("Service", text="Service")
+        table.heading("Email", text="Email/Username")
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        table.pack(fill=tk.BOTH, expand=True)
+        for _, service, email in report["breached"]:
+            table.insert("", tk.END, values=(service, email))
+        
+        ttk.Button(window, text="Close", command=window.destroy).pack(pady=10)
+    
+    def restore_vault(self):
+        """Merge entries from an encrypted backup into the vault"""
+        path = filedialog.askopenfilename(
+            title="Restore Backup",
+            filetypes=[("Password manager backup", "*.pmbak"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        
+        passphrase = simpledialog.askstring("Backup Password", "Password for this backup:", show="●")
+        if passphrase:
+            self.restore_backup(path, passphrase, retry=True)
+    
+    def restore_backup(self, path, passphrase, retry):
+        """Open and merge a backup in the background; the KDF and decryption stay off the Tk thread"""
+        key = self.vault_key
+        
+        def work(progress):
+            reader = BackupReader(path, passphrase)
+            return self.storage.submit(
+                lambda conn: BulkImporter(conn, key).run(reader.records(), progress),
+                exclusive=True
+            ).result()
+        
+        def on_done(stats, error):
+            if isinstance(error, WrongBackupPasswordError) and retry:
+                self.status_label.config(text="Ready")
+                other = simpledialog.askstring("Backup Password", "Wrong password. Password for this backup:",
+                                               show="●")
+                if other:
+                    self.restore_backup(path, other, retry=False)
+                return
+            if isinstance(error, OSError):
+                messagebox.showerror("Error", f"Cannot open backup: {str(error)}")
+                self.status_label.config(text="Restore failed; no entries were added")
+                return
+            if error is not None:
+                messagebox.showerror("Error", f"Restore failed: {str(error)}")
+                self.status_label.config(text="Restore failed; no entries were added")
+                return
+            if self.search_controller:
+                self.search_controller.invalidate()
+            self.start_quick_index()
+            self.load_passwords()
+            self.status_label.config(
+                text=f"Restored {stats['imported']} passwords ({stats['skipped']} already present)")
+        
+        self.status_label.config(text="Restoring...")
+        self.run_in_background(
+            work, lambda stats: self.status_label.config(text=f"Restoring... {stats['imported']} added"), on_done)
+    
+    def sync_vault(self):
+        """Exchange changes with another copy of the vault, e.g. one on a USB drive"""
+        path = filedialog.askopenfilename(
+            title="Sync With Vault File",
+            filetypes=[("Vault database", "*.db"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        
+        key = self.vault_key
+        db_path = self.db_path
+        
+        def sync(conn, progress):
+            other = open_sync_target(path, db_path)
+            try:
+                return VaultSync(conn, other, key).run(progress)
+            finally:
+                other.close()
+        
+        def work(progress):
+            return self.storage.submit(lambda conn: sync(conn, progress), exclusive=True).result()
+        
+        def on_done(stats, error):
+            if error is not None:
+                messagebox.showerror("Error", f"Sync failed: {str(error)}")
+                self.status_label.config(text="Sync failed")
+                return
+            if self.search_controller:
+                self.search_controller.invalidate()
+            self.start_quick_index()
+            self.load_passwords()
+            self.status_label.config(text=f"Synced with {os.path.basename(path)}: "
+                                          f"{stats['received']} changes received, {stats['sent']} sent")
+        
+        self.status_label.config(text="Syncing...")
+        self.run_in_background(
+            work, lambda stats: self.status_label.config(
+                text=f"Syncing... {stats['received']} received, {stats['sent']} sent"), on_done)
+    
+    def build_auto_lock_menu(self, parent):
+        """Menu for the auto-lock timeout and lock policies"""
+        menu = tk.Menu(parent, tearoff=False)
+        self.auto_lock_vars = {
+            "auto_lock_seconds": tk.IntVar(value=self.settings["auto_lock_seconds"]),
+            "lock_on_minimize": tk.BooleanVar(value=self.settings["lock_on_minimize"]),
+            "lock_on_sleep": tk.BooleanVar(value=self.settings["lock_on_sleep"]),
+        }
+        for minutes in (1, 3, 5, 15, 30):
+            menu.add_radiobutton(label=f"After {minutes} minute{'s' if minutes > 1 else ''}",
+                                 value=minutes * 60, variable=self.auto_lock_vars["auto_lock_seconds"],
+                                 command=self.update_auto_lock)
+        menu.add_separator()
+        menu.add_checkbutton(label="Lock When Minimized", variable=self.auto_lock_vars["lock_on_minimize"],
+                             command=self.update_auto_lock)
+        menu.add_checkbutton(label="Lock on System Sleep", variable=self.auto_lock_vars["lock_on_sleep"],
+                             command=self.update_auto_lock)
+        return menu
+    
+    def update_auto_lock(self):
+        """Apply and save auto-lock choices from the menu"""
+        for key, var in self.auto_lock_vars.items():
+            self.settings[key] = var.get()
+        self.auto_lock.apply_settings()
+        self.auto_lock_label.config(text=self.auto_lock_text())
+        try:
+            save_settings(self.settings)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to save settings: {str(e)}")
+    
+    def update_agent(self):
+        """Save the agent choice from the menu and start or stop the agent to match"""
+        self.settings["agent_enabled"] = self.agent_var.get()
         try:
-            # Generate new salt and key
-            new_salt = secrets.token_bytes(16)
-            new_key, _ = self.derive_key(new_password, new_salt)
-            new_cipher = Fernet(new_key)
-
-            # If passwords exist, require old password for migration
-            if os.path.exists(config_path) and os.path.exists(db_path):
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM passwords")
-                if cursor.fetchone()[0] > 0:
-                    old_password = input("Enter current master password to migrate existing passwords: ")
-                    try:
-                        with open(config_path, "rb") as f:
-                            data = f.read()
-                            old_salt = data[:16]
-                            old_stored_key = data[16:]
-                        
-                        # Verify old password
-                        old_key, _ = self.derive_key(old_password, old_salt)
-                        if old_key != old_stored_key:
-                            print("Error: Incorrect current password")
-                            sys.exit(1)
-                        
-                        # Re-encrypt all passwords
-                        old_cipher = Fernet(old_key)
-                        cursor.execute("SELECT id, encrypted_password FROM passwords")
-                        for pid, encrypted_pass in cursor.fetchall():
-                            try:
-                                decrypted = old_cipher.decrypt(encrypted_pass.encode())
-                                new_encrypted = new_cipher.encrypt(decrypted)
-                                cursor.execute(
-                                    "UPDATE passwords SET encrypted_password = ? WHERE id = ?",
-                                    (new_encrypted.decode(), pid)
-                                )
-                            except Exception as e:
-                                print(f"Warning: Could not migrate password ID {pid}")
-                                continue
-                    except Exception as e:
-                        print("Error: Failed to verify current password")
-                        sys.exit(1)
-
-            # Save new configuration
-            with open(config_path, "wb") as f:
-                f.write(new_salt + new_key)
-
-            # Commit changes if database exists
-            if 'conn' in locals():
-                conn.commit()
+            save_settings(self.settings)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to save settings: {str(e)}")
+        if self.settings["agent_enabled"]:
+            self.start_agent_if_enabled()
+        else:
+            stop_agent()
+            self.status_label.config(text="Command-line lookups stopped")
+    
+    def start_agent_if_enabled(self):
+        """Hand the vault key to a background agent so --get and --list skip the master password"""
+        if not self.settings["agent_enabled"] or self.vault_key is None:
+            return
+        vault_key = self.vault_key
+        
+        def on_done(started, error):
+            if not self.status_label.winfo_exists():
+                return
+            if error is not None:
+                self.status_label.config(text=f"Command-line agent failed to start: {str(error)}")
+            elif started:
+                self.status_label.config(text="Serving command-line lookups (--get, --list)")
+        
+        self.run_in_background(lambda progress: start_agent(vault_key), lambda value: None, on_done)
+    
+    def start_quick_index(self):
+        """(Re)build the quick switcher index on a worker thread from the decrypted metadata"""
+        self.quick_index = None
+        self.quick_index_job += 1
+        job = self.quick_index_job
+        db_path = self.db_path
+        cipher = self.cipher_suite
+        
+        def work(progress):
+            conn = connect_database(db_path)
+            try:
+                return QuickSwitchIndex.load(conn, cipher)
+            finally:
                 conn.close()
+        
+        def on_done(index, error):
+            # A later build, or locking the vault, makes this one stale
+            if job != self.quick_index_job:
+                return
+            if error is not None:
+                self.status_label.config(text=f"Quick switch unavailable: {str(error)}")
+                return
+            self.quick_index = index
+        
+        self.run_in_background(work, lambda value: None, on_done)
+    
+    def update_quick_index(self, change):
+        """Apply change(index) to the quick switcher index, or rebuild it if a build is running"""
+        if self.quick_index is not None:
+            change(self.quick_index)
+        elif self.vault_key is not None:
+            # The running build may have read the database before this change
+            self.start_quick_index()
+    
+    def record_access(self, password_id):
+        """Count a view or copy of an entry towards its quick switcher ranking"""
+        when = time.time()
+        if self.quick_index is not None:
+            self.quick_index.record_use(password_id, when)
+        # Usage counts are best effort; a failed write only affects ranking
+        self.write_async(lambda conn: record_usage(conn, password_id, when), lambda result, error: None)
+    
+    def show_quick_switcher(self, event=None):
+        """Jump to an entry by typing part of its service name or email"""
+        if self.vault_key is None:
+            return "break"
+        if self.quick_switcher is not None and self.quick_switcher.winfo_exists():
+            self.quick_switcher.lift()
+            self.quick_switcher.focus_force()
+            return "break"
+        
+        window = tk.Toplevel(self.root)
+        window.title("Quick Switch")
+        window.geometry("480x360+%d+%d" % (self.root.winfo_x() + 210, self.root.winfo_y() + 80))
+        window.configure(bg=self.bg_color)
+        window.transient(self.root)
+        self.quick_switcher = window
+        
+        frame = ttk.Frame(window, style="TFrame")
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        query = tk.StringVar()
+        entry = ttk.Entry(frame, textvariable=query, style="TEntry")
+        entry.pack(fill=tk.X)
+        results = tk.Listbox(frame, activestyle="none", exportselection=False, font=("Arial", 10))
+        results.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        hint = ttk.Label(frame, text="Enter: view   Ctrl+C: copy password   Esc: close", style="TLabel")
+        hint.pack(anchor=tk.W, pady=(5, 0))
+        rows = []
+        
+        def refresh(*_):
+            if not window.winfo_exists():
+                return
+            results.delete(0, tk.END)
+            rows.clear()
+            if self.quick_index is None:
+                # Still building after unlock; try again shortly
+                hint.config(text="Indexing entries...")
+                window.after(200, refresh)
+                return
+            rows.extend(self.quick_index.search(query.get()))
+            for _, service, email in rows:
+                results.insert(tk.END, f"{service}  —  {email}")
+            if rows:
+                results.selection_set(0)
+            hint.config(text="Enter: view   Ctrl+C: copy password   Esc: close" if rows or query.get()
+                        else "Type to search entries")
+        
+        def move(step):
+            if rows:
+                current = results.curselection()
+                index = min(max((current[0] if current else 0) + step, 0), len(rows) - 1)
+                results.selection_clear(0, tk.END)
+                results.selection_set(index)
+                results.see(index)
+            return "break"
+        
+        def selected_id():
+            current = results.curselection()
+            return rows[current[0]][0] if current else None
+        
+        def open_selected(event=None):
+            password_id = selected_id()
+            if password_id is not None:
+                window.destroy()
+                self.view_password(password_id)
+            return "break"
+        
+        def copy_selected(event=None):
+            password_id = selected_id()
+            if password_id is None:
+                return "break"
+            row = self.storage.reader().execute(
+                f"SELECT {ENTRY_COLUMNS}, encrypted_password FROM passwords WHERE id = ?", (password_id,)
+            ).fetchone()
+            try:
+                _, _, password = self.decrypt_row(row)
+            except Exception:
+                # Never print or log the token or the error text
+                hint.config(text="Failed to decrypt password")
+                return "break"
+            window.destroy()
+            self.copy_to_clipboard(password, password_id)
+            return "break"
+        
+        query.trace_add("write", refresh)
+        entry.bind("<Down>", lambda event: move(1))
+        entry.bind("<Up>", lambda event: move(-1))
+        entry.bind("<Return>", open_selected)
+        entry.bind("<Control-Return>", copy_selected)
+        entry.bind("<Control-c>", copy_selected)
+        results.bind("<Double-Button-1>", open_selected)
+        window.bind("<Escape>", lambda event: window.destroy())
+        entry.focus_set()
+        refresh()
+        return "break"
 
-            print("Master password has been successfully reset!")
-            print("Please restart the application to use the new password.")
-            sys.exit(0)
-
-        except Exception as e:
-            print(f"Error resetting master password: {str(e)}")
-            sys.exit(1)
-
+    def auto_lock_text(self):
+        minutes = self.settings["auto_lock_seconds"] // 60
+        return f"Auto-lock after {minutes} minute{'s' if minutes != 1 else ''} of inactivity"
+    
+    def show_diagnostics(self):
+        """Show latency histograms for the hot paths, refreshed while the window is open"""
+        if self.diagnostics_window is not None and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostics")
+        window.geometry("640x360")
+        window.configure(bg=self.bg_color)
+        self.diagnostics_window = window
+        
+        frame = ttk.Frame(window, style="TFrame")
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        columns = ("Operation", "Count", "Mean", "p50", "p95", "p99", "Max")
+        table = ttk.Treeview(frame, columns=columns, show="headings")
+        for column in columns:
+            table.heading(column, text=column if column in ("Operation", "Count") else f"{column} (ms)")
+            table.column(column, width=160 if column == "Operation" else 70,
+                         anchor=tk.W if column == "Operation" else tk.E)
+        table.pack(fill=tk.BOTH, expand=True)
+        
+        buttons = ttk.Frame(frame, style="TFrame")
+        buttons.pack(fill=tk.X, pady=(10, 0))
+        ttk.Label(buttons, text=f"Log: {METRICS_LOG_PATH}", style="TLabel").pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Close", command=window.destroy).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons, text="Reset", command=lambda: [METRICS.reset(), refresh(reschedule=False)]).pack(
+            side=tk.RIGHT, padx=5)
+        ttk.Button(buttons, text="Write to Log", command=lambda: self.metrics_log.write("manual")).pack(
+            side=tk.RIGHT, padx=5)
+        
+        def refresh(reschedule=True):
+            if not table.winfo_exists():
+                return
+            table.delete(*table.get_children())
+            for name, summary in METRICS.snapshot().items():
+                table.insert("", tk.END, values=(
+                    name, summary["count"], f"{summary['mean_ms']:.2f}", f"{summary['p50_ms']:.2f}",
+                    f"{summary['p95_ms']:.2f}", f"{summary['p99_ms']:.2f}", f"{summary['max_ms']:.2f}"))
+            if reschedule:
+                window.after(1000, refresh)
+        
+        refresh()
+    
     def on_closing(self):
         """Handle application closing"""
         # Clean up resources
-        if self.conn:
-            self.conn.close()
+        if self.search_controller:
+            self.search_controller.close()
+        if self.preload_thread is not None:
+            self.preload_thread.join()
+        if self.settings["agent_enabled"]:
+            stop_agent()
+        if self.storage:
+            self.storage.close()
+        self.metrics_log.write("exit")
+        self.metrics_log.close()
         
         # Clear clipboard for security
         self.root.clipboard_clear()
@@ -868,16 +5819,498 @@ class PasswordManager:
         # Close the application
         self.root.destroy()
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        if len(sys.argv) == 3 and sys.argv[1] == '--reset':
-            PasswordManager(None)
+def unlock_cli(allow_pending=False):
+    """Prompt for the master password and return (password, vault key), exiting on failure"""
+    if not os.path.exists(CONFIG_PATH):
+        print("Error: No vault configured yet. Start the application once to create one.")
+        sys.exit(1)
+    if not allow_pending and os.path.exists(CONFIG_PATH + PENDING_CONFIG_SUFFIX):
+        print("Error: An interrupted key rotation is pending. Finish it with --rotate-key first.")
+        sys.exit(1)
+    
+    password = getpass.getpass("Master password: ")
+    try:
+        return password, unlock_vault_key(password)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+
+
+def reset_cli(new_password):
+    """Reset the master password by re-wrapping the vault key"""
+    config_path = CONFIG_PATH
+    db_path = DB_PATH
+
+    # Validate new password strength
+    if len(new_password) < 8:
+        print("Error: Password must be at least 8 characters long")
+        sys.exit(1)
+
+    if not any(c.isupper() for c in new_password) or \
+       not any(c.islower() for c in new_password) or \
+       not any(c.isdigit() for c in new_password):
+        print("Error: Password must contain uppercase, lowercase letters and numbers")
+        sys.exit(1)
+
+    # Rewrapping the old key while some entries already use the new one would lose them
+    if os.path.exists(config_path + PENDING_CONFIG_SUFFIX):
+        print("Error: An interrupted key rotation is pending. Finish it with --rotate-key first.")
+        sys.exit(1)
+
+    try:
+        load_crypto()
+        conn = open_database(db_path) if os.path.exists(db_path) else None
+        if conn is not None:
+            RekeyEngine.discard_stale_checkpoint(conn)
+
+        # If passwords exist, the current password is needed to keep the vault key
+        has_entries = conn is not None and conn.execute("SELECT COUNT(*) FROM passwords").fetchone()[0] > 0
+        if os.path.exists(config_path) and has_entries:
+            data_key = prompt_current_key(config_path)
         else:
-            print("Usage:")
-            print("  Normal start: python3 password-manager.py")
-            print("  Reset password: python3 password-manager.py --reset <newpasswd>")
+            # Nothing to keep: start over with a fresh vault key
+            data_key = Fernet.generate_key()
+
+        # Only the wrapped vault key changes; stored passwords are not touched
+        write_vault_config(config_path, new_password, data_key)
+
+        if conn is not None:
+            conn.close()
+
+        print("Master password has been successfully reset!")
+        print("Please restart the application to use the new password.")
+        sys.exit(0)
+
+    except Exception as e:
+        print(f"Error resetting master password: {str(e)}")
+        sys.exit(1)
+
+def prompt_current_key(config_path):
+    """Ask for the current master password and return the vault key it unlocks"""
+    old_password = getpass.getpass("Enter current master password: ")
+    try:
+        return unlock_config(load_config(config_path), old_password)
+    except IncorrectPasswordError:
+        print("Error: Incorrect current password")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error: Failed to verify current password: {str(e)}")
+        sys.exit(1)
+
+
+def import_cli(path, fmt=None):
+    """Import an export file from the command line"""
+    _, key = unlock_cli()
+    
+    def progress(stats):
+        print(f"\r  {stats['read']} read, {stats['imported']} imported, {stats['skipped']} duplicates",
+              end="", flush=True)
+    
+    with VaultStore(key) as store:
+        try:
+            started = time.time()
+            stats = store.import_records(iter_import_records(path, fmt), progress)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"\nError: Import failed, no entries were added: {str(e)}")
             sys.exit(1)
+    
+    print(f"\nImported {stats['imported']} passwords in {time.time() - started:.1f}s "
+          f"({stats['skipped']} duplicates, {stats['invalid']} without a password skipped)")
+
+
+def backup_cli(path):
+    """Write an encrypted backup from the command line"""
+    password, key = unlock_cli()
+    with VaultStore(key) as store:
+        try:
+            started = time.time()
+            count = write_backup(store.conn, key, path, password, load_config(CONFIG_PATH)["kdf"],
+                                 lambda count: print(f"\r  {count} passwords written", end="", flush=True))
+        except OSError as e:
+            print(f"\nError: Backup failed: {str(e)}")
+            sys.exit(1)
+    print(f"\nBacked up {count} passwords to {path} in {time.time() - started:.1f}s")
+
+
+def restore_cli(path):
+    """Merge entries from an encrypted backup from the command line"""
+    password, key = unlock_cli()
+    try:
+        try:
+            reader = BackupReader(path, password)
+        except WrongBackupPasswordError:
+            # Backups from another vault may use a different password
+            reader = BackupReader(path, getpass.getpass("Backup password: "))
+    except (OSError, ValueError) as e:
+        print(f"Error: Cannot open backup: {str(e)}")
+        sys.exit(1)
+    
+    with VaultStore(key) as store:
+        try:
+            stats = store.import_records(
+                reader.records(),
+                lambda stats: print(f"\r  {stats['imported']} restored", end="", flush=True))
+        except (OSError, ValueError) as e:
+            print(f"\nError: Restore failed, no entries were added: {str(e)}")
+            sys.exit(1)
+    print(f"\nRestored {stats['imported']} passwords ({stats['skipped']} already present)")
+
+
+def sync_cli(path):
+    """Merge changes with another copy of the vault from the command line"""
+    _, key = unlock_cli()
+    with VaultStore(key) as store:
+        try:
+            started = time.time()
+            stats = store.sync(path, lambda stats: print(
+                f"\r  {stats['received']} received, {stats['sent']} sent", end="", flush=True))
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"\nError: Sync failed: {str(e)}")
+            sys.exit(1)
+    print(f"\nSynced with {path} in {time.time() - started:.1f}s: "
+          f"{stats['received']} changes received, {stats['sent']} sent")
+
+
+def list_cli(term):
+    """Print matching entries without their passwords, through the agent if one is running"""
+    try:
+        rows = agent_request("search", term=term)["entries"] if term else agent_request("list")["entries"]
+    except OSError:
+        _, key = unlock_cli()
+        with VaultStore(key) as store:
+            rows = store.search(term)
+    except AgentError as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    for pid, service, email in rows:
+        print(f"{pid}\t{service}\t{email}")
+
+
+def get_cli(target):
+    """Print one entry's password, and nothing else, for scripts"""
+    # A number is tried as an ID first, then as a name
+    entry_id = int(target) if target.isdigit() else None
+    try:
+        entry = agent_request("get", id=entry_id, term=target)["entry"]
+    except OSError:
+        # No agent: unlock here, paying for the key derivation
+        _, key = unlock_cli()
+        with VaultStore(key) as store:
+            try:
+                entry = store.lookup(entry_id, target)
+            except EntryLookupError as e:
+                report_lookup_error(e)
+    except AgentError as e:
+        report_lookup_error(e)
+    print(entry[3])
+
+
+def report_lookup_error(error):
+    """Print a failed lookup with any candidate entries and exit"""
+    print(f"Error: {str(error)}", file=sys.stderr)
+    for pid, service, email in error.matches:
+        print(f"  {pid}\t{service}\t{email}", file=sys.stderr)
+    sys.exit(1)
+
+
+def agent_cli():
+    """Unlock the vault once and leave an agent answering --get and --list"""
+    _, key = unlock_cli()
+    try:
+        started = start_agent(key)
+    except AgentError as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    if not started:
+        print(f"An agent is already running on {AGENT_SOCKET_PATH}")
+        return
+    minutes = load_settings()["auto_lock_seconds"] // 60
+    print(f"Agent listening on {AGENT_SOCKET_PATH}. It locks after {minutes} minutes without requests; "
+          "stop it sooner with --stop-agent.")
+
+
+def agent_serve_cli():
+    """Run the agent in this process with the vault key start_agent writes to stdin"""
+    key = sys.stdin.buffer.readline().strip()
+    sys.stdin.close()
+    # A core dump would contain the key
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    except (ImportError, ValueError, OSError):
+        pass
+    with VaultStore(key) as store:
+        VaultAgent(store, load_settings()).serve()
+
+
+def stop_agent_cli():
+    print("Agent stopped" if stop_agent() else "No agent is running")
+
+
+def export_cli(path):
+    """Write every entry, decrypted, to a CSV file the importer can read back"""
+    _, key = unlock_cli()
+    with VaultStore(key) as store:
+        try:
+            # The file holds plaintext passwords: create it readable by the owner only
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["name", "username", "password"])
+                count = 0
+                for pid, service, email, password in store.iter_entries():
+                    if password is None:
+                        print(f"Warning: Could not decrypt password ID {pid}; not exported")
+                        continue
+                    writer.writerow([service, email, password])
+                    count += 1
+        except OSError as e:
+            print(f"Error: Export failed: {str(e)}")
+            sys.exit(1)
+    print(f"Exported {count} passwords to {path}. The file is not encrypted; delete it when done.")
+
+
+def generate_cli(count, args):
+    """Print count generated passwords or passphrases, one per line"""
+    policy = PasswordPolicy(length=args.length, classes=args.classes.split(","), exclude=args.exclude,
+                            words=args.words, separator=args.separator, wordlist=args.wordlist)
+    try:
+        generator = PasswordGenerator(policy)
+    except (ValueError, OSError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    
+    # Write in blocks; one write per password would dominate for large batches
+    stream = generator.stream(count)
+    while True:
+        block = [password for _, password in zip(range(1000), stream)]
+        if not block:
+            break
+        sys.stdout.write("\n".join(block) + "\n")
+    sys.stdout.flush()
+
+
+def reuse_cli():
+    """Print groups of entries that share a password"""
+    _, key = unlock_cli()
+    indexed = []
+    
+    def progress(done, total):
+        # Only shown the first time, while older entries get their fingerprints
+        indexed.append(done)
+        print(f"\r  Indexed {done}/{total} passwords", end="", flush=True)
+    
+    with VaultStore(key) as store:
+        groups = store.reuse_groups(progress)
+    if indexed:
+        print()
+    if not groups:
+        print("No passwords are reused")
+        return
+    print(f"{sum(len(group) for group in groups)} entries share {len(groups)} passwords")
+    for number, group in enumerate(groups, 1):
+        print(f"Group {number}:")
+        for pid, service, email in group:
+            print(f"  {pid}\t{service}\t{email}")
+
+
+def audit_cli(breach_path):
+    """Report entries whose passwords appear in an offline breach list"""
+    _, key = unlock_cli()
+    with VaultStore(key) as store:
+        try:
+            started = time.time()
+            report = BreachAudit(store.conn, key, breach_path).run(
+                lambda done, total: print(f"\r  Checked {done}/{total} passwords", end="", flush=True))
+        except (OSError, ValueError) as e:
+            print(f"\nError: Audit failed: {str(e)}")
+            sys.exit(1)
+    print(f"\n{len(report['breached'])} of {report['checked']} passwords appear in known breaches "
+          f"({time.time() - started:.1f}s)")
+    for pid, service, email in report["breached"]:
+        print(f"{pid}\t{service}\t{email}")
+    for pid in report["failed"]:
+        print(f"Warning: Could not decrypt password ID {pid}")
+
+
+def compact_cli():
+    """Bring older entries up to the current storage format and give the freed space back"""
+    _, key = unlock_cli()
+    size_before = os.path.getsize(DB_PATH)
+    
+    steps = []
+    
+    def progress(what):
+        def report(done, total):
+            # Each step gets its own progress line
+            if what not in steps:
+                if steps:
+                    print()
+                steps.append(what)
+            print(f"\r  {what} {done}/{total}", end="", flush=True)
+        return report
+    
+    with VaultStore(key) as store:
+        failed = store.upgrade_records(progress("Converted passwords"))
+        store.upgrade_metadata(progress("Encrypted names and emails of entries"))
+        if steps:
+            print()
+        print("  Reclaiming free space...")
+        store.conn.execute("VACUUM")
+        store.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size_after = os.path.getsize(DB_PATH)
+    print(f"Database is {size_after // 1024} KiB, was {size_before // 1024} KiB")
+    for pid in failed:
+        print(f"Warning: Could not decrypt password ID {pid}; left in the old format")
+
+
+def convert_breach_list_cli(source, destination):
+    """Convert a sorted text hash list (e.g. a HIBP SHA-1 download) to the binary format"""
+    try:
+        count = convert_breach_list(source, destination,
+                                    lambda count: print(f"\r  {count} hashes", end="", flush=True))
+    except (OSError, ValueError) as e:
+        print(f"\nError: Conversion failed: {str(e)}")
+        sys.exit(1)
+    print(f"\nWrote {count} hashes to {destination}")
+
+
+def finish_rotation_cli(conn, old_key, new_key, pending_path, config_path):
+    """Re-encrypt remaining entries to new_key, then switch to the pending config"""
+    failed = RekeyEngine(conn, old_key, new_key).run(
+        lambda done, total: print(f"\r  Re-encrypted {done}/{total} passwords", end="", flush=True))
+    print()
+    for pid in failed:
+        print(f"Warning: Could not migrate password ID {pid}")
+    
+    # Every row now uses the new key: switch configs atomically
+    os.replace(pending_path, config_path)
+    RekeyEngine.clear_checkpoint(conn)
+
+
+def rotate_key_cli():
+    """Re-encrypt every entry under a new random vault key"""
+    password, data_key = unlock_cli(allow_pending=True)
+    pending_path = CONFIG_PATH + PENDING_CONFIG_SUFFIX
+    conn = open_database(DB_PATH)
+    try:
+        if os.path.exists(pending_path):
+            try:
+                new_key = unlock_config(load_config(pending_path), password)
+            except IncorrectPasswordError:
+                print("Error: The pending key rotation was started under another master password. "
+                      "Run --rotate-key with that password to finish it.")
+                sys.exit(1)
+            print("Resuming interrupted key rotation...")
+        else:
+            RekeyEngine.discard_stale_checkpoint(conn)
+            new_key = Fernet.generate_key()
+            # Record the new key before touching any rows so a crash can resume
+            write_vault_config(pending_path, password, new_key, load_config(CONFIG_PATH)["kdf"])
+        
+        finish_rotation_cli(conn, data_key, new_key, pending_path, CONFIG_PATH)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"\nError: Key rotation stopped: {str(e)}. Run --rotate-key again to resume.")
+        sys.exit(1)
+    finally:
+        conn.close()
+    print("Vault key rotated; all passwords are now encrypted with the new key.")
+    print("Copies of the vault made before the rotation can no longer be synced; copy the vault to them again.")
+
+
+def parse_args(argv):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(
+        prog="password-manager.py",
+        description="Secure Password Manager. Starts the GUI when no option is given."
+    )
+    commands = parser.add_mutually_exclusive_group()
+    commands.add_argument("--reset", metavar="NEWPASSWD",
+                          help="reset the master password; stored passwords keep their vault key")
+    commands.add_argument("--import", dest="import_file", metavar="FILE",
+                          help="bulk import a CSV (browser, Bitwarden, KeePass) or JSON export")
+    commands.add_argument("--rotate-key", action="store_true",
+                          help="re-encrypt all passwords under a new random vault key; "
+                               "existing copies of the vault can no longer be synced with it")
+    commands.add_argument("--backup", metavar="FILE",
+                          help="write an encrypted, compressed backup of the vault")
+    commands.add_argument("--restore", metavar="FILE",
+                          help="merge entries from an encrypted backup into the vault")
+    commands.add_argument("--sync", metavar="FILE",
+                          help="merge changes both ways with another copy of the vault database")
+    commands.add_argument("--list", nargs="?", const="", metavar="TERM",
+                          help="list entries (id, service, email) matching TERM, or all of them")
+    commands.add_argument("--get", metavar="ID_OR_NAME",
+                          help="print the password of one entry; fast when an agent is running")
+    commands.add_argument("--agent", action="store_true",
+                          help="unlock once and keep an agent running for --get and --list")
+    commands.add_argument("--stop-agent", action="store_true", help="lock and stop a running agent")
+    commands.add_argument("--agent-serve", action="store_true", help=argparse.SUPPRESS)
+    commands.add_argument("--export", metavar="FILE",
+                          help="write all entries, decrypted, to a CSV file")
+    commands.add_argument("--find-reuse", action="store_true",
+                          help="list groups of entries that share a password")
+    commands.add_argument("--audit", metavar="BREACHFILE",
+                          help="check every password against a binary SHA-1 breach list")
+    commands.add_argument("--convert-breach-list", nargs=2, metavar=("TEXTFILE", "BREACHFILE"),
+                          help="convert a sorted SHA1[:count] text list to the binary breach list format")
+    commands.add_argument("--compact", action="store_true",
+                          help="rewrite older entries in the current format and shrink the database")
+    commands.add_argument("--generate", type=int, metavar="COUNT",
+                          help="print COUNT generated passwords (or passphrases with --words)")
+    parser.add_argument("--format", choices=["csv", "json"],
+                        help="import file format (default: from the file extension)")
+    
+    generation = parser.add_argument_group("password generation (with --generate)")
+    generation.add_argument("--length", type=int, default=16, help="characters per password (default: 16)")
+    generation.add_argument("--classes", default=",".join(PASSWORD_CLASSES),
+                            help="character classes that must all appear (default: %(default)s)")
+    generation.add_argument("--exclude", default="", metavar="CHARS", help="characters never to use")
+    generation.add_argument("--words", type=int, default=0, help="make passphrases of this many words")
+    generation.add_argument("--separator", default="-", help="passphrase word separator (default: -)")
+    generation.add_argument("--wordlist", metavar="FILE", help="passphrase wordlist (default: system dictionary)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.reset is not None:
+        reset_cli(args.reset)
+    elif args.import_file is not None:
+        import_cli(args.import_file, args.format)
+    elif args.rotate_key:
+        rotate_key_cli()
+    elif args.backup is not None:
+        backup_cli(args.backup)
+    elif args.restore is not None:
+        restore_cli(args.restore)
+    elif args.sync is not None:
+        sync_cli(args.sync)
+    elif args.list is not None:
+        list_cli(args.list)
+    elif args.get is not None:
+        get_cli(args.get)
+    elif args.agent:
+        agent_cli()
+    elif args.stop_agent:
+        stop_agent_cli()
+    elif args.agent_serve:
+        agent_serve_cli()
+    elif args.export is not None:
+        export_cli(args.export)
+    elif args.find_reuse:
+        reuse_cli()
+    elif args.audit is not None:
+        audit_cli(args.audit)
+    elif args.convert_breach_list is not None:
+        convert_breach_list_cli(*args.convert_breach_list)
+    elif args.compact:
+        compact_cli()
+    elif args.generate is not None:
+        generate_cli(args.generate, args)
     else:
+        # Only the GUI imports Tk
+        load_tk()
         root = tk.Tk()
         app = PasswordManager(root)
         root.protocol("WM_DELETE_WINDOW", app.on_closing)
@@ -0,0 +1,52 @@
+"""Shared fixtures for the behaviour tests.
+
+The application is a single script, so it is loaded by path the same way
+benchmarks/vault_bench.py does. Run with:
+
+    python -m pytest tests
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, os.pardir, "password-manager.py")
+
+MASTER_PASSWORD = "Test-Passw0rd"
+# Cheap KDF settings; these tests check behaviour, not key stretching
+FAST_KDF = {"name": "pbkdf2-sha256", "iterations": 1000}
+
+
+def load_app():
+    """Import password-manager.py as a module"""
+    spec = importlib.util.spec_from_file_location("password_manager", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # Worker processes unpickle functions by module name
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    module.load_crypto()
+    return module
+
+
+def make_vault(app, key, path, count):
+    """Create a vault database holding count numbered entries"""
+    with app.VaultStore(key, path) as store:
+        store.put_many([(f"service{i}", f"user{i}@example.com", f"password{i}") for i in range(count)])
+
+
+def read_vault(app, key, path):
+    """Return every (service, email, password) in a vault, sorted"""
+    with app.VaultStore(key, path) as store:
+        return sorted((service, email, password) for _, service, email, password in store.iter_entries())
+
+
+@pytest.fixture(scope="session")
+def app():
+    return load_app()
+
+
+@pytest.fixture
+def vault_key(app):
+    return app.Fernet.generate_key()
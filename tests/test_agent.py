@@ -0,0 +1,98 @@
+"""Behaviour tests for the unlock agent and entry lookups behind --get"""
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from conftest import make_vault
+
+
+@pytest.fixture
+def store(app, vault_key, tmp_path):
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 5)
+    with app.VaultStore(vault_key, db_path) as store:
+        store.put_many([("1234", "digits@example.com", "numeric name")])
+        yield store
+
+
+@pytest.fixture
+def agent_path(app, store, tmp_path):
+    """Path of an agent serving store's vault from a thread; stopped after the test"""
+    path = str(tmp_path / "agent.sock")
+
+    def serve():
+        # SQLite connections belong to the thread that opened them, as in --agent-serve
+        with app.VaultStore(store.vault_key, store.db_path) as own_store:
+            app.VaultAgent(own_store, dict(app.DEFAULT_SETTINGS), path=path).serve()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    while not app.agent_running(path):
+        assert thread.is_alive()
+    yield path
+    assert app.stop_agent(path)
+    thread.join(5)
+    assert not os.path.exists(path)
+
+
+def ask(agent, data):
+    """Send raw request bytes to agent.handle and return the decoded response"""
+    server, client = socket.socketpair()
+    with server, client:
+        client.sendall(data)
+        agent.handle(server)
+        return json.loads(client.recv(65536))
+
+
+def test_lookup_by_id_falls_back_to_name(app, store):
+    assert store.lookup(1)[1:] == ("service0", "user0@example.com", "password0")
+    assert store.lookup(1, "1")[1] == "service0"
+    # No entry has ID 1234, so the all-digit target is a service name
+    assert store.lookup(1234, "1234")[1:] == ("1234", "digits@example.com", "numeric name")
+    with pytest.raises(app.EntryLookupError, match="No entry with ID 1234"):
+        store.lookup(1234)
+    with pytest.raises(app.EntryLookupError) as error:
+        store.lookup(term="service")
+    assert [row[1] for row in error.value.matches] == [f"service{i}" for i in range(5)]
+
+
+def test_agent_answers_requests_over_its_socket(app, store, agent_path):
+    path = agent_path
+    assert app.agent_request("status", path)["entries"] == 6
+    assert len(app.agent_request("list", path)["entries"]) == 6
+    assert [row[1] for row in app.agent_request("search", path, term="service3")["entries"]] == ["service3"]
+    assert app.agent_request("get", path, id=None, term="service4")["entry"][3] == "password4"
+    assert app.agent_request("get", path, id=1234, term="1234")["entry"][3] == "numeric name"
+    with pytest.raises(app.AgentError) as error:
+        app.agent_request("get", path, id=None, term="service")
+    assert error.value.matches
+    with pytest.raises(app.AgentError, match="Unknown request"):
+        app.agent_request("forget", path)
+    # A second agent on the same socket is refused while this one answers
+    with pytest.raises(app.AgentError, match="already running"):
+        app.VaultAgent(store, dict(app.DEFAULT_SETTINGS), path=path).listen()
+
+
+@pytest.mark.parametrize("data", [b"not json\n", b'{"term": "x"}\n', b"[]\n"])
+def test_agent_rejects_malformed_requests(app, store, tmp_path, data):
+    agent = app.VaultAgent(store, dict(app.DEFAULT_SETTINGS), path=str(tmp_path / "agent.sock"))
+    agent.touch()
+    assert ask(agent, data) == {"ok": False, "error": "Malformed request"}
+
+
+@pytest.mark.skipif(not hasattr(socket, "SO_PEERCRED"), reason="peer credentials are Linux-only")
+def test_agent_ignores_other_users(app, store, tmp_path, monkeypatch):
+    agent = app.VaultAgent(store, dict(app.DEFAULT_SETTINGS), path=str(tmp_path / "agent.sock"))
+    agent.touch()
+    uid = os.getuid()
+    monkeypatch.setattr(app.os, "getuid", lambda: uid + 1)
+
+    server, client = socket.socketpair()
+    with server, client:
+        client.sendall(b'{"op": "list"}\n')
+        agent.handle(server)
+        server.shutdown(socket.SHUT_WR)
+        assert client.recv(65536) == b""
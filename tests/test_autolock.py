@@ -0,0 +1,173 @@
+"""Behaviour tests for auto-lock timing and suspend detection, with both clocks faked"""
+import json
+import socket
+
+import pytest
+
+
+class FakeClock:
+    """Stands in for the time module; wall and monotonic time advance separately"""
+
+    def __init__(self):
+        self.wall = 1_700_000_000.0
+        self.mono = 1000.0
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+    def advance(self, wall, mono=None):
+        self.wall += wall
+        self.mono += wall if mono is None else mono
+
+
+class FakeRoot:
+    """Just enough of a Tk root for AutoLock: timers run when the test fires them"""
+
+    def __init__(self):
+        self.timers = {}
+        self.idle = []
+        self.next_id = 0
+
+    def after(self, ms, callback):
+        self.next_id += 1
+        self.timers[self.next_id] = (ms, callback)
+        return self.next_id
+
+    def after_cancel(self, timer):
+        self.timers.pop(timer, None)
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+
+    def bind(self, *args, **kwargs):
+        pass
+
+    def pending_delay(self):
+        (ms, _), = self.timers.values()
+        return ms / 1000
+
+    def fire(self):
+        (timer, (_, callback)), = self.timers.items()
+        del self.timers[timer]
+        callback()
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(app, "time", fake)
+    return fake
+
+
+@pytest.mark.parametrize("wall, mono, delay, slept", [
+    (30, 30, 30, False),        # on time
+    (10, 10, 30, False),        # input before the timer was due
+    (32, 30, 30, False),        # NTP slew
+    (33, 33, 30, False),        # a busy event loop, under the threshold
+    (3600, 30, 30, True),       # Linux/macOS: the monotonic clock stopped while asleep
+    (3600, 3600, 30, True),     # Windows: both clocks kept counting, the timer came late
+    (20, 20, 0, True),          # late against a zero delay, e.g. the first request to an agent
+])
+def test_sleep_watch(app, wall, mono, delay, slept):
+    clock = FakeClock()
+    watch = app.SleepWatch(clock.time, clock.monotonic)
+    watch.expect(delay)
+    clock.advance(wall, mono)
+    assert watch.slept() is slept
+
+
+def make_autolock(app, root, **settings):
+    locked = []
+    options = dict(app.DEFAULT_SETTINGS, auto_lock_seconds=180, **settings)
+    return app.AutoLock(root, lambda: locked.append(True), options), locked
+
+
+def test_idle_timeout_locks_once_the_deadline_passes(app, clock):
+    root = FakeRoot()
+    autolock, locked = make_autolock(app, root, lock_on_sleep=False)
+    autolock.start()
+    assert root.pending_delay() == pytest.approx(180, abs=0.01)
+
+    clock.advance(100)
+    autolock.touch()
+    clock.advance(80)
+    root.fire()
+    # Activity moved the deadline, so the timer re-arms for what is left
+    assert not locked and root.pending_delay() == pytest.approx(100, abs=0.01)
+    clock.advance(100)
+    root.fire()
+    assert locked == [True]
+
+
+@pytest.mark.parametrize("mono_counts_sleep", [False, True])
+def test_sleep_locks_on_every_platform(app, clock, mono_counts_sleep):
+    root = FakeRoot()
+    autolock, locked = make_autolock(app, root)
+    autolock.start()
+    # Sleep checks run more often than the idle timeout
+    assert root.pending_delay() == pytest.approx(app.SLEEP_CHECK_SECONDS, abs=0.01)
+
+    clock.advance(600, 600 if mono_counts_sleep else 0)
+    root.fire()
+    assert locked == [True]
+
+
+@pytest.mark.parametrize("mono_counts_sleep", [False, True])
+def test_first_input_after_sleep_locks(app, clock, mono_counts_sleep):
+    root = FakeRoot()
+    autolock, locked = make_autolock(app, root)
+    autolock.start()
+    clock.advance(600, 600 if mono_counts_sleep else 0)
+    autolock.touch()
+    for callback in root.idle:
+        callback()
+    assert locked == [True]
+
+
+def test_sleep_is_ignored_when_the_policy_is_off(app, clock):
+    root = FakeRoot()
+    autolock, locked = make_autolock(app, root, lock_on_sleep=False)
+    autolock.start()
+    clock.advance(100, 100)
+    autolock.touch()
+    assert not root.idle
+    clock.advance(60, 60)
+    root.fire()
+    assert not locked
+
+
+def test_lock_waits_for_a_bulk_job(app, clock):
+    root = FakeRoot()
+    busy = [True]
+    locked = []
+    autolock = app.AutoLock(root, lambda: locked.append(True),
+                            dict(app.DEFAULT_SETTINGS, auto_lock_seconds=10), busy=lambda: busy[0])
+    autolock.start()
+    clock.advance(11)
+    root.fire()
+    assert not locked and root.pending_delay() == pytest.approx(app.BUSY_LOCK_RECHECK_SECONDS, abs=0.01)
+    busy[0] = False
+    clock.advance(1)
+    root.fire()
+    assert locked == [True]
+
+
+@pytest.mark.parametrize("mono_counts_sleep", [False, True])
+def test_agent_refuses_requests_after_sleep(app, vault_key, tmp_path, clock, mono_counts_sleep):
+    with app.VaultStore(vault_key, str(tmp_path / "passwords.db")) as store:
+        agent = app.VaultAgent(store, dict(app.DEFAULT_SETTINGS), path=str(tmp_path / "agent.sock"))
+        agent.running = True
+        agent.touch()
+        agent.sleep_watch.expect(app.SLEEP_CHECK_SECONDS)
+
+        clock.advance(600, 600 if mono_counts_sleep else 0)
+        server, client = socket.socketpair()
+        with server, client:
+            client.sendall(b'{"op": "status"}\n')
+            agent.handle(server)
+            response = json.loads(client.recv(4096))
+    assert response == {"ok": False, "error": "The agent locked after system sleep"}
+    assert not agent.running
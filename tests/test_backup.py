@@ -0,0 +1,68 @@
+"""Behaviour tests for encrypted backups"""
+import struct
+
+import pytest
+
+from conftest import FAST_KDF, MASTER_PASSWORD, make_vault
+
+
+@pytest.fixture
+def backup(app, vault_key, tmp_path, monkeypatch):
+    """A backup of 35 entries split over several frames; returns (path, header bytes, frames)"""
+    monkeypatch.setattr(app, "BACKUP_CHUNK_ROWS", 10)
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 35)
+    path = str(tmp_path / "vault.pmbak")
+    conn = app.open_database(db_path)
+    try:
+        assert app.write_backup(conn, vault_key, path, MASTER_PASSWORD, FAST_KDF) == 35
+    finally:
+        conn.close()
+
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = app.BackupReader(path, MASTER_PASSWORD).data_offset
+    frames = []
+    while offset + len(b"".join(frames)) < len(data):
+        start = offset + len(b"".join(frames))
+        _, length = struct.unpack(">BI", data[start:start + 5])
+        frames.append(data[start:start + 5 + length])
+    assert len(frames) == 5
+    return path, data[:offset], frames
+
+
+def rewrite(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_backup_round_trip(app, backup):
+    path, _, _ = backup
+    records = list(app.BackupReader(path, MASTER_PASSWORD).records())
+    assert sorted(records) == sorted((f"service{i}", f"user{i}@example.com", f"password{i}") for i in range(35))
+    with pytest.raises(app.WrongBackupPasswordError):
+        app.BackupReader(path, "wrong password")
+
+
+@pytest.mark.parametrize("cut", [1, 30, 200])
+def test_truncated_backup_is_rejected(app, backup, cut):
+    path, header, frames = backup
+    rewrite(path, (header + b"".join(frames))[:-cut])
+    with pytest.raises(ValueError) as error:
+        list(app.BackupReader(path, MASTER_PASSWORD).records())
+    assert not isinstance(error.value, app.WrongBackupPasswordError)
+
+
+def test_backup_missing_final_frame_is_rejected(app, backup):
+    path, header, frames = backup
+    rewrite(path, header + b"".join(frames[:-1]))
+    with pytest.raises(ValueError, match="truncated"):
+        list(app.BackupReader(path, MASTER_PASSWORD).records())
+
+
+def test_reordered_backup_frames_are_rejected(app, backup):
+    path, header, frames = backup
+    rewrite(path, header + frames[0] + frames[2] + frames[1] + b"".join(frames[3:]))
+    with pytest.raises(ValueError, match="reordered") as error:
+        list(app.BackupReader(path, MASTER_PASSWORD).records())
+    assert not isinstance(error.value, app.WrongBackupPasswordError)
@@ -0,0 +1,75 @@
+"""Behaviour tests for the blind search index and entry keys that replaced plaintext search"""
+import sqlite3
+
+
+def test_blind_tokens_cover_every_word_prefix(app, vault_key):
+    index_key = app.blind_index_key(vault_key)
+    tokens = app.blind_tokens(index_key, "GitHub Work", "dev@example.com")
+    words = ["github", "work", "dev", "example", "com"]
+    prefixes = {word[:length] for word in words for length in range(1, min(len(word), app.BLIND_PREFIX_MAX) + 1)}
+    assert sorted(tokens) == sorted(app.blind_token(index_key, prefix) for prefix in prefixes)
+    assert all(len(token) == app.BLIND_TOKEN_BYTES for token in tokens)
+
+    # Words longer than BLIND_PREFIX_MAX share the token of their cut-off prefix
+    long_word = "x" * (app.BLIND_PREFIX_MAX + 5)
+    assert app.blind_token(index_key, long_word) == app.blind_token(index_key, long_word[:app.BLIND_PREFIX_MAX])
+    # Another vault key gives unrelated tokens
+    other_key = app.blind_index_key(app.Fernet.generate_key())
+    assert not set(tokens) & set(app.blind_tokens(other_key, "GitHub Work", "dev@example.com"))
+
+
+def test_entry_key_identifies_service_and_email(app, vault_key):
+    index_key = app.blind_index_key(vault_key)
+    key = app.entry_key(index_key, "github", "dev@example.com")
+    assert key == app.entry_key(index_key, "github", "dev@example.com")
+    assert key != app.entry_key(index_key, "dev@example.com", "github")
+    assert key != app.entry_key(index_key, "github", "ops@example.com")
+    assert key != app.entry_key(app.blind_index_key(app.Fernet.generate_key()), "github", "dev@example.com")
+    # Entry keys never collide with search tokens
+    assert key not in app.blind_tokens(index_key, "github", "dev@example.com")
+
+
+def test_search_matches_word_prefixes_only(app, vault_key, tmp_path):
+    db_path = str(tmp_path / "passwords.db")
+    with app.VaultStore(vault_key, db_path) as store:
+        store.put_many([
+            ("GitHub Work", "dev@example.com", "a"),
+            ("GitLab", "ops@example.com", "b"),
+            ("Bank", "me@github.example", "c"),
+        ])
+        services = lambda term: [service for _, service, _ in store.search(term)]
+        assert sorted(services("git")) == ["Bank", "GitHub Work", "GitLab"]
+        # Matches in the service name rank before matches in the email
+        assert services("github")[0] == "GitHub Work"
+        assert services("git work") == ["GitHub Work"]
+        assert services("ithub") == []
+        assert store.search_index.search("") is None
+
+
+def test_schema_migrations_build_no_plaintext_index(app, vault_key, tmp_path):
+    # A vault from before any migration, with plaintext names
+    path = str(tmp_path / "legacy.db")
+    cipher = app.VaultCipher(vault_key)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE passwords (id INTEGER PRIMARY KEY, service_name TEXT NOT NULL, "
+                 "email TEXT NOT NULL, encrypted_password BLOB NOT NULL)")
+    conn.executemany("INSERT INTO passwords (service_name, email, encrypted_password) VALUES (?, ?, ?)",
+                     [(f"plaintextservice{i}", f"plaintextuser{i}@example.com", cipher.encrypt("pw"))
+                      for i in range(50)])
+    conn.commit()
+
+    # The old full-text and (service_name, email) migrations no longer write anything
+    schema = conn.execute("SELECT * FROM sqlite_master").fetchall()
+    app.migrate_add_search_index(conn)
+    app.migrate_add_service_email_index(conn)
+    assert conn.execute("SELECT * FROM sqlite_master").fetchall() == schema
+    conn.close()
+
+    with app.VaultStore(vault_key, path) as store:
+        store.upgrade_metadata()
+        names = [row[0] for row in store.conn.execute("SELECT name FROM sqlite_master")]
+        store.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    assert not [name for name in names if "fts" in name or name == "idx_passwords_service_email"]
+    # Neither a live row nor a freed page keeps the old names
+    with open(path, "rb") as f:
+        assert b"plaintextservice" not in f.read()
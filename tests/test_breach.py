@@ -0,0 +1,90 @@
+"""Behaviour tests for the binary breach list and the offline audit"""
+import hashlib
+import os
+import random
+
+import pytest
+
+from conftest import make_vault
+
+
+def sha1(text):
+    return hashlib.sha1(text.encode()).digest()
+
+
+def write_text_list(path, digests, counts=True):
+    with open(path, "w", encoding="ascii") as f:
+        for index, digest in enumerate(digests):
+            f.write(digest.hex().upper() + (f":{index + 1}" if counts else "") + "\n")
+
+
+@pytest.fixture
+def digests():
+    rng = random.Random(17)
+    # Random hashes plus the edges of the first and last buckets and a run sharing one first byte
+    values = {rng.randbytes(20) for _ in range(3000)}
+    values |= {bytes(20), b"\xff" * 20, b"\x00" + b"\xff" * 19, b"\xff" + bytes(19)}
+    values |= {b"\x42" + rng.randbytes(19) for _ in range(50)}
+    return sorted(values)
+
+
+def test_converted_list_finds_every_hash_and_nothing_else(app, digests, tmp_path):
+    source = str(tmp_path / "hashes.txt")
+    destination = str(tmp_path / "breaches.bin")
+    # Repeated hashes and blank lines are tolerated
+    write_text_list(source, digests[:10] + digests[9:])
+    with open(source, "a") as f:
+        f.write("\n\n")
+    assert app.convert_breach_list(source, destination) == len(digests)
+    assert os.path.getsize(destination) == 20 * len(digests)
+
+    rng = random.Random(71)
+    with app.BreachDatabase(destination) as breaches:
+        assert breaches.count == len(digests)
+        assert all(digest in breaches for digest in digests)
+        misses = {rng.randbytes(20) for _ in range(2000)} | {b"\x42" + bytes(19), b"\xff" * 19 + b"\xfe"}
+        assert not any(digest in breaches for digest in misses - set(digests))
+
+
+@pytest.mark.parametrize("lines, message", [
+    (["B" * 40, "A" * 40], "sorted"),
+    (["A" * 40, "not a hash"], "Line 2"),
+    (["A" * 38], "Line 1"),
+])
+def test_bad_lists_leave_nothing_behind(app, tmp_path, lines, message):
+    source = str(tmp_path / "hashes.txt")
+    destination = str(tmp_path / "breaches.bin")
+    with open(source, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    with pytest.raises(ValueError, match=message):
+        app.convert_breach_list(source, destination)
+    assert os.listdir(tmp_path) == ["hashes.txt"]
+
+
+def test_odd_sized_and_empty_files(app, tmp_path):
+    path = tmp_path / "breaches.bin"
+    path.write_bytes(bytes(30))
+    with pytest.raises(ValueError, match="multiple of 20"):
+        app.BreachDatabase(str(path))
+    path.write_bytes(b"")
+    with app.BreachDatabase(str(path)) as breaches:
+        assert sha1("password") not in breaches
+
+
+def test_audit_reports_breached_entries(app, vault_key, tmp_path):
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 40)
+    breach_path = str(tmp_path / "breaches.bin")
+    with open(breach_path, "wb") as f:
+        f.write(b"".join(sorted(sha1(f"password{i}") for i in (3, 17, 38, 1000))))
+
+    conn = app.open_database(db_path)
+    try:
+        progress = []
+        report = app.BreachAudit(conn, vault_key, breach_path, batch_size=16, workers=1).run(
+            lambda done, total: progress.append((done, total)))
+    finally:
+        conn.close()
+    assert report["checked"] == 40 and report["failed"] == []
+    assert [row[1] for row in report["breached"]] == ["service17", "service3", "service38"]
+    assert progress == [(16, 40), (32, 40), (40, 40)]
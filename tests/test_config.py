@@ -0,0 +1,53 @@
+"""Behaviour tests for KDF calibration and the versioned vault config"""
+import base64
+import os
+
+import pytest
+
+from conftest import FAST_KDF, MASTER_PASSWORD
+
+
+def test_calibration_never_goes_below_legacy_cost(app):
+    params = app.calibrate_kdf(app.KDF_PBKDF2, target_ms=1)
+    assert params == {"name": app.KDF_PBKDF2, "iterations": app.LEGACY_KDF_PARAMS["iterations"]}
+    app.check_kdf_params(app.calibrate_kdf(app.KDF_SCRYPT, target_ms=1))
+
+
+def test_config_records_kdf_and_wraps_vault_key(app, vault_key, tmp_path):
+    config_path = str(tmp_path / "config.dat")
+    app.write_vault_config(config_path, MASTER_PASSWORD, vault_key, FAST_KDF)
+    config = app.load_config(config_path)
+    assert config["version"] == app.CONFIG_VERSION and config["kdf"] == FAST_KDF
+    assert app.unlock_vault_key(MASTER_PASSWORD, config_path) == vault_key
+    with pytest.raises(app.IncorrectPasswordError):
+        app.unlock_vault_key("wrong password", config_path)
+
+    # A new password rewraps the same vault key under a fresh salt
+    app.write_vault_config(config_path, "Other-Passw0rd", vault_key, FAST_KDF)
+    assert app.load_config(config_path)["salt"] != config["salt"]
+    assert app.unlock_vault_key("Other-Passw0rd", config_path) == vault_key
+
+
+def test_legacy_unlock_upgrades_without_calibrating(app, tmp_path, monkeypatch):
+    config_path = str(tmp_path / "config.dat")
+    salt = os.urandom(16)
+    legacy_key = base64.urlsafe_b64encode(app.derive_key_bytes(MASTER_PASSWORD, salt, app.LEGACY_KDF_PARAMS))
+    with open(config_path, "wb") as f:
+        f.write(salt + legacy_key)
+    monkeypatch.setattr(app, "calibrate_kdf", lambda *args, **kwargs: pytest.fail("unlock calibrated the KDF"))
+
+    assert app.unlock_vault_key(MASTER_PASSWORD, config_path) == legacy_key
+    config = app.load_config(config_path)
+    assert config["version"] == app.CONFIG_VERSION
+    assert config["kdf"] == app.LEGACY_KDF_PARAMS
+
+
+def test_current_password_prompt_reports_why_it_failed(app, tmp_path, monkeypatch, capsys):
+    config_path = str(tmp_path / "config.dat")
+    with open(config_path, "wb") as f:
+        f.write(app.CONFIG_MAGIC + bytes([app.CONFIG_VERSION + 1]))
+    monkeypatch.setattr(app.getpass, "getpass", lambda prompt: MASTER_PASSWORD)
+
+    with pytest.raises(SystemExit):
+        app.prompt_current_key(config_path)
+    assert "newer than this application supports" in capsys.readouterr().out
@@ -0,0 +1,29 @@
+"""Behaviour tests for decrypting the whole vault in chunks on a process pool"""
+import pytest
+
+from conftest import make_vault
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chunks_cover_the_vault_in_id_order(app, vault_key, tmp_path, workers):
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 95)
+    conn = app.open_database(db_path)
+    try:
+        chunks = list(app.BulkDecryptor(conn, vault_key, chunk_rows=20, workers=workers).chunks())
+    finally:
+        conn.close()
+    assert [len(chunk) for chunk in chunks] == [20, 20, 20, 20, 15]
+    rows = [row for chunk in chunks for row in chunk]
+    assert [row[0] for row in rows] == list(range(1, 96))
+    assert rows[42][1:] == ("service42", "user42@example.com", "password42")
+
+
+def test_pool_spawns_workers_when_run_as_a_script(app, monkeypatch):
+    # Pools start from background threads, where forking is unsafe
+    monkeypatch.setattr(app, "__name__", "__main__")
+    pool = app.process_pool(1, print, ())
+    try:
+        assert pool._mp_context.get_start_method() == "spawn"
+    finally:
+        pool.shutdown()
@@ -0,0 +1,69 @@
+"""Behaviour tests for policy-driven password and passphrase generation"""
+import itertools
+import string
+from collections import Counter
+
+import pytest
+
+
+def chi_squared(counts, expected):
+    return sum((count - expected) ** 2 / expected for count in counts)
+
+
+def test_generated_passwords_follow_the_policy(app):
+    policy = app.PasswordPolicy(length=6, classes=("upper", "digits", "symbols"), exclude="ABC!@#")
+    passwords = list(app.PasswordGenerator(policy, buffer_bytes=256).stream(2000))
+    assert len(set(passwords)) > 1990
+    for password in passwords:
+        assert len(password) == 6
+        assert not set(password) & set("ABC!@#")
+        assert not set(password) & set(string.ascii_lowercase)
+        for name in policy.classes:
+            assert set(password) & set(app.PASSWORD_CLASSES[name])
+
+
+@pytest.mark.parametrize("policy, message", [
+    ({"length": 3, "classes": ("upper", "lower", "digits", "symbols")}, "at least 4"),
+    ({"classes": ("upper", "emoji")}, "Unknown character class"),
+    ({"classes": ("digits",), "exclude": "23456789"}, "at least one allowed character"),
+])
+def test_impossible_policies_are_rejected(app, policy, message):
+    with pytest.raises(ValueError, match=message):
+        app.PasswordGenerator(app.PasswordPolicy(**policy))
+
+
+def test_rejection_sampling_maps_bytes_evenly(app):
+    generator = app.PasswordGenerator(app.PasswordPolicy(classes=("lower", "digits"), length=8))
+    size = len(generator.alphabet)
+    accepted = Counter(chr(value) for value in generator.table[:256 - 256 % size])
+    assert set(accepted) == set(generator.alphabet)
+    assert set(accepted.values()) == {256 // size}
+    assert len(generator.rejected) == 256 % size
+
+
+def test_characters_and_indexes_are_uniform(app):
+    generator = app.PasswordGenerator(app.PasswordPolicy(classes=("digits",), length=10), buffer_bytes=4096)
+    chars = Counter("".join(generator.stream(8000)))
+    alphabet = app.PASSWORD_CLASSES["digits"]
+    # 7 degrees of freedom; failing at 40 by chance is a one in a million event
+    assert chi_squared([chars[c] for c in alphabet], 80000 / len(alphabet)) < 40
+
+    draws = Counter(generator.below(3) for _ in range(30000))
+    assert sorted(draws) == [0, 1, 2]
+    assert chi_squared(draws.values(), 10000) < 30
+
+
+def test_passphrases_join_words_from_the_wordlist(app, tmp_path):
+    words = ["".join(letters) for letters in itertools.product("abcdefgh", repeat=4)][:1500]
+    path = tmp_path / "words.txt"
+    path.write_text("\n".join(f"{index}\t{word}" for index, word in enumerate(words)) + "\nName\nit's\n")
+
+    policy = app.PasswordPolicy(words=5, separator=".", wordlist=str(path))
+    generator = app.PasswordGenerator(policy)
+    phrase = generator.generate()
+    assert len(phrase.split(".")) == 5 and set(phrase.split(".")) <= set(words)
+    assert generator.entropy_bits() == pytest.approx(5 * 10.55, abs=0.01)
+
+    path.write_text("\n".join(words[:100]))
+    with pytest.raises(ValueError, match="only 100 usable words"):
+        app.PasswordGenerator(policy)
@@ -0,0 +1,96 @@
+"""Behaviour tests for bulk import: parsing, duplicate skipping and batched inserts"""
+import csv
+
+from conftest import make_vault, read_vault
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "url", "username", "password"])
+        writer.writerows(rows)
+
+
+def test_csv_import_counts_invalid_and_duplicate_rows(app, vault_key, tmp_path):
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 3)
+    export = str(tmp_path / "export.csv")
+    write_csv(export, [
+        ["new one", "", "a@example.com", "pw-a"],
+        ["", "https://login.example.org/path", "b@example.com", "pw-b"],
+        ["no password", "", "c@example.com", ""],
+        ["", "", "d@example.com", "pw-d"],
+        ["service1", "", "user1@example.com", "already stored"],
+        ["new one", "", "a@example.com", "repeated in the file"],
+    ])
+
+    conn = app.open_database(db_path)
+    try:
+        stats = app.BulkImporter(conn, vault_key, workers=1).run(app.iter_import_records(export))
+    finally:
+        conn.close()
+
+    assert stats == {"read": 6, "imported": 2, "skipped": 2, "invalid": 2}
+    entries = read_vault(app, vault_key, db_path)
+    assert ("new one", "a@example.com", "pw-a") in entries
+    # Without a title the host name of the URL names the entry
+    assert ("login.example.org", "b@example.com", "pw-b") in entries
+    assert ("service1", "user1@example.com", "password1") in entries
+    assert len(entries) == 5
+
+
+def test_batched_import_is_searchable_and_logged(app, vault_key, tmp_path):
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 10)
+    records = [(f"imported {i}", f"person{i}@example.net", f"secret{i}") for i in range(95)]
+    # Some of every batch already exists, so batches shrink and ids must still line up
+    records[::10] = [(f"service{i}", f"user{i}@example.com", "duplicate") for i in range(10)]
+    progress = []
+
+    conn = app.open_database(db_path)
+    try:
+        stats = app.BulkImporter(conn, vault_key, batch_size=20, workers=1).run(records, progress.append)
+        assert stats["imported"] == 95 - 10 and stats["skipped"] == 10
+        assert progress[-1]["imported"] == stats["imported"]
+
+        # Every new entry has its own search tokens and a sync log row
+        without_tokens = conn.execute(
+            "SELECT COUNT(*) FROM passwords WHERE id NOT IN (SELECT entry_id FROM search_tokens)").fetchone()[0]
+        assert without_tokens == 0
+        unlogged = conn.execute(
+            "SELECT COUNT(*) FROM passwords WHERE id NOT IN (SELECT entry_id FROM sync_log "
+            "WHERE entry_id IS NOT NULL)").fetchone()[0]
+        assert unlogged == 0
+    finally:
+        conn.close()
+
+    with app.VaultStore(vault_key, db_path) as store:
+        for i in (1, 55, 94):
+            _, _, email, password = store.lookup(term=f"imported {i}")
+            assert (email, password) == (f"person{i}@example.net", f"secret{i}")
+        # Matching goes through the blind index, so a word prefix finds every imported entry
+        assert len(store.search("imported")) == 85
+        assert read_vault(app, vault_key, db_path).count(("service1", "user1@example.com", "password1")) == 1
+
+
+def test_failed_import_leaves_vault_unchanged(app, vault_key, tmp_path):
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 4)
+    before = read_vault(app, vault_key, db_path)
+
+    def records():
+        for i in range(50):
+            yield f"partial {i}", "x@example.com", "pw"
+        raise OSError("export file went away")
+
+    conn = app.open_database(db_path)
+    try:
+        try:
+            app.BulkImporter(conn, vault_key, batch_size=10, workers=1).run(records())
+        except OSError:
+            pass
+        else:
+            raise AssertionError("the import should have failed")
+    finally:
+        conn.close()
+    assert read_vault(app, vault_key, db_path) == before
@@ -0,0 +1,84 @@
+"""Behaviour tests for the quick switcher's fuzzy matching and frecency ranking"""
+import pytest
+
+DAY = 86400
+NOW = 1_700_000_000
+
+ENTRIES = [
+    (1, "GitHub", "dev@example.com"),
+    (2, "GitLab", "ops@github.com"),
+    (3, "Bank", "me@example.com"),
+    (4, "github enterprise", "admin@corp.example"),
+    (5, "Gist", "a@b.example"),
+    (6, "12345", "n@n.example"),
+    (7, "123", "n@n.example"),
+]
+
+
+def ids(rows):
+    return [row[0] for row in rows]
+
+
+@pytest.fixture
+def index(app):
+    return app.QuickSwitchIndex(ENTRIES)
+
+
+def test_frecency_weighs_recent_use_more(app):
+    assert app.frecency(3, NOW - DAY, NOW) == 300
+    assert app.frecency(3, NOW - 10 * DAY, NOW) == 210
+    assert app.frecency(3, NOW - 365 * DAY, NOW) == 30
+    assert app.frecency(1, NOW, NOW) > app.frecency(2, NOW - 60 * DAY, NOW)
+
+
+def test_exact_words_rank_before_prefixes_and_service_before_email(index):
+    assert ids(index.search("github", now=NOW)) == [1, 4, 2]
+    assert ids(index.search("123", now=NOW)) == [7, 6]
+    assert ids(index.search("git", now=NOW)) == [1, 2, 4, 5]
+    # Every term has to match
+    assert ids(index.search("github admin", now=NOW)) == [4]
+    assert index.search("github nothing", now=NOW) == []
+
+
+@pytest.mark.parametrize("typo", ["gthub", "githib", "githbu"])
+def test_a_typo_still_finds_the_word(index, typo):
+    assert ids(index.search(typo, now=NOW))[:2] == [1, 4]
+
+
+def test_short_terms_and_numbers_are_not_fuzzy(index):
+    assert index.search("ub", now=NOW) == []
+    assert index.search("1245", now=NOW) == []
+    assert index.search("xyz", now=NOW) == []
+
+
+def test_frequently_used_entries_rank_first(index):
+    index.record_use(5, NOW - DAY)
+    assert ids(index.search("git", now=NOW))[0] == 5
+    # An exact match still beats a rarely used prefix match
+    assert ids(index.search("gist", now=NOW))[0] == 5
+    index.record_use(2, NOW - 100 * DAY)
+    assert ids(index.search("", now=NOW)) == [5, 2]
+
+
+def test_edits_keep_usage_and_deletes_forget_it(index):
+    index.record_use(3, NOW)
+    index.replace((3, "Credit Union", "me@example.com"))
+    assert index.search("bank", now=NOW) == []
+    assert ids(index.search("credit", now=NOW)) == [3]
+    assert ids(index.search("", now=NOW)) == [3]
+
+    index.remove(3)
+    assert index.search("credit", now=NOW) == [] and index.search("", now=NOW) == []
+    assert len(index) == len(ENTRIES) - 1
+
+
+def test_index_loads_entries_and_usage_from_the_vault(app, vault_key, tmp_path):
+    with app.VaultStore(vault_key, str(tmp_path / "passwords.db")) as store:
+        store.put_many([(service, email, "pw") for _, service, email in ENTRIES])
+        app.record_usage(store.conn, 3, NOW)
+        app.record_usage(store.conn, 3, NOW)
+        store.conn.commit()
+        index = app.QuickSwitchIndex.load(store.conn, store.cipher)
+    assert len(index) == len(ENTRIES)
+    assert index.usage == {3: (2, NOW)}
+    assert ids(index.search("bank", now=NOW)) == [3]
@@ -0,0 +1,56 @@
+"""Behaviour tests for finding reused passwords through keyed fingerprints"""
+from conftest import make_vault
+
+
+def test_fingerprints_are_keyed_per_vault(app, vault_key):
+    fp_key = app.fingerprint_key(vault_key)
+    assert app.password_fingerprint(fp_key, "hunter2") == app.password_fingerprint(fp_key, b"hunter2")
+    assert app.password_fingerprint(fp_key, "hunter2") != app.password_fingerprint(fp_key, "hunter3")
+    other_key = app.fingerprint_key(app.Fernet.generate_key())
+    assert app.password_fingerprint(fp_key, "hunter2") != app.password_fingerprint(other_key, "hunter2")
+
+
+def test_reuse_groups_list_shared_passwords_largest_first(app, vault_key, tmp_path):
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 10)
+    with app.VaultStore(vault_key, db_path) as store:
+        store.put_many([
+            ("bank", "me@example.com", "shared-twice"),
+            ("shop", "me@example.com", "shared-three"),
+            ("mail", "me@example.com", "shared-three"),
+            ("forum", "me@example.com", "shared-twice"),
+            ("news", "me@example.com", "shared-three"),
+        ])
+        groups = store.reuse_groups()
+        assert [sorted(row[1] for row in group) for group in groups] == [
+            ["mail", "news", "shop"], ["bank", "forum"]]
+
+        fingerprint = app.password_fingerprint(store.fingerprint_key, "shared-three")
+        shop_id = groups[0][[row[1] for row in groups[0]].index("shop")][0]
+        assert app.reuse_count(store.conn, fingerprint) == 3
+        assert app.reuse_count(store.conn, fingerprint, exclude_id=shop_id) == 2
+
+        # Changing a password moves the entry out of its group
+        store.put_many([("forum", "me@example.com", "unique now")])
+        assert [len(group) for group in store.reuse_groups()] == [3]
+
+
+def test_backfill_fingerprints_older_entries(app, vault_key, tmp_path):
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 30)
+    with app.VaultStore(vault_key, db_path) as store:
+        store.put_many([("copy", "a@example.com", "password7"), ("copy", "b@example.com", "password7")])
+        # Entries written before the fingerprint column existed
+        store.conn.execute("UPDATE passwords SET password_fingerprint = NULL WHERE id % 2 = 0")
+        store.conn.commit()
+        assert app.reuse_groups(store.conn, store.cipher) == []
+        assert app.FingerprintBackfill.needed(store.conn)
+
+        progress = []
+        assert app.FingerprintBackfill(store.conn, vault_key, batch_size=4, workers=1).run(
+            lambda done, total: progress.append((done, total))) == []
+        assert progress[-1] == (16, 16)
+        assert not app.FingerprintBackfill.needed(store.conn)
+        groups = app.reuse_groups(store.conn, store.cipher)
+        assert [sorted((row[1], row[2]) for row in group) for group in groups] == [[
+            ("copy", "a@example.com"), ("copy", "b@example.com"), ("service7", "user7@example.com")]]
@@ -0,0 +1,82 @@
+"""Behaviour tests for re-encrypting the vault under a new key and resetting the master password"""
+import pytest
+
+from conftest import FAST_KDF, MASTER_PASSWORD, make_vault, read_vault
+
+
+def test_rotation_resumes_from_checkpoint(app, vault_key, tmp_path):
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 50)
+    expected = read_vault(app, vault_key, db_path)
+    new_key = app.Fernet.generate_key()
+
+    class Interrupted(Exception):
+        pass
+
+    def crash(done, total):
+        raise Interrupted()
+
+    conn = app.open_database(db_path)
+    try:
+        with pytest.raises(Interrupted):
+            app.RekeyEngine(conn, vault_key, new_key, batch_size=10, workers=1).run(crash)
+        assert app.RekeyEngine.checkpoint(conn) == (10, 0)
+
+        # The first batch is committed under the new key, the rest still use the old one
+        old_cipher = app.VaultCipher(vault_key)
+        new_cipher = app.VaultCipher(new_key)
+        rows = conn.execute("SELECT id, encrypted_password FROM passwords ORDER BY id").fetchall()
+        assert all(new_cipher.decrypt(token) for row_id, token in rows if row_id <= 10)
+        assert all(old_cipher.decrypt(token) for row_id, token in rows if row_id > 10)
+
+        seen = []
+        failed = app.RekeyEngine(conn, vault_key, new_key, batch_size=10, workers=1).run(
+            lambda done, total: seen.append((done, total)))
+        assert failed == []
+        assert seen[-1] == (40, 40)
+        assert app.RekeyEngine.checkpoint(conn) == (50, 1)
+        app.RekeyEngine.clear_checkpoint(conn)
+    finally:
+        conn.close()
+
+    assert read_vault(app, new_key, db_path) == expected
+
+
+@pytest.fixture
+def cli_vault(app, vault_key, tmp_path, monkeypatch):
+    """A vault at the CLI's default paths; returns (config path, db path)"""
+    config_path = str(tmp_path / "config.dat")
+    db_path = str(tmp_path / "passwords.db")
+    monkeypatch.setattr(app, "CONFIG_PATH", config_path)
+    monkeypatch.setattr(app, "DB_PATH", db_path)
+    monkeypatch.setattr(app, "calibrate_kdf", lambda *args, **kwargs: dict(FAST_KDF))
+    monkeypatch.setattr(app.getpass, "getpass", lambda prompt: MASTER_PASSWORD)
+    app.write_vault_config(config_path, MASTER_PASSWORD, vault_key, FAST_KDF)
+    make_vault(app, vault_key, db_path, 5)
+    return config_path, db_path
+
+
+def test_reset_rewraps_the_vault_key(app, vault_key, cli_vault):
+    config_path, db_path = cli_vault
+    expected = read_vault(app, vault_key, db_path)
+    with pytest.raises(SystemExit) as exit:
+        app.reset_cli("New-Passw0rd")
+    assert exit.value.code == 0
+    assert app.unlock_vault_key("New-Passw0rd", config_path) == vault_key
+    assert read_vault(app, vault_key, db_path) == expected
+
+
+def test_reset_refuses_while_a_rotation_is_pending(app, vault_key, cli_vault, capsys):
+    config_path, _ = cli_vault
+    pending_path = config_path + app.PENDING_CONFIG_SUFFIX
+    app.write_vault_config(pending_path, MASTER_PASSWORD, app.Fernet.generate_key(), FAST_KDF)
+    with open(config_path, "rb") as f:
+        config = f.read()
+
+    with pytest.raises(SystemExit) as exit:
+        app.reset_cli("New-Passw0rd")
+    assert exit.value.code == 1
+    assert "--rotate-key" in capsys.readouterr().out
+    with open(config_path, "rb") as f:
+        assert f.read() == config
+    assert app.unlock_vault_key(MASTER_PASSWORD, config_path) == vault_key
@@ -0,0 +1,178 @@
+"""Behaviour tests for row sources and the virtualized password list"""
+import pytest
+
+from conftest import make_vault
+
+
+class FakeTree:
+    """Just enough of a ttk.Treeview for VirtualTreeview, without a display"""
+
+    def __init__(self):
+        self.items = []
+        self.values = {}
+        self.selected = ()
+        self.next_id = 0
+
+    def bind(self, *args, **kwargs):
+        pass
+
+    def get_children(self):
+        return tuple(self.items)
+
+    def insert(self, parent, index, values):
+        self.next_id += 1
+        item = f"I{self.next_id}"
+        self.items.append(item)
+        self.values[item] = values
+        return item
+
+    def item(self, item, values):
+        self.values[item] = values
+
+    def delete(self, *items):
+        for item in items:
+            self.items.remove(item)
+            del self.values[item]
+
+    def index(self, item):
+        return self.items.index(item)
+
+    def selection(self):
+        return self.selected
+
+    def selection_set(self, items):
+        self.selected = tuple(items) if isinstance(items, (tuple, list)) else (items,)
+
+    def focus(self, item):
+        pass
+
+    def shown(self):
+        """Entry ids of the rows on screen, top to bottom"""
+        return [self.values[item][0] for item in self.items]
+
+
+class FakeScrollbar:
+    def configure(self, **kwargs):
+        pass
+
+    def set(self, first, last):
+        self.position = (first, last)
+
+
+class Resize:
+    def __init__(self, height):
+        self.height = height
+
+
+@pytest.fixture
+def table(app, vault_key, tmp_path):
+    """A TableRowSource over a vault of 100 entries"""
+    db_path = str(tmp_path / "passwords.db")
+    make_vault(app, vault_key, db_path, 100)
+    conn = app.open_database(db_path)
+    yield app.TableRowSource(conn, app.VaultCipher(vault_key))
+    conn.close()
+
+
+def make_view(app, source, visible_rows=10):
+    app.load_tk()
+    tree = FakeTree()
+    view = app.VirtualTreeview(tree, FakeScrollbar(), row_height=20, heading_height=25)
+    view.on_resize(Resize(25 + 20 * visible_rows))
+    view.set_source(source)
+    return view, tree
+
+
+def test_table_pages_decrypt_rows_in_id_order(table):
+    assert table.count() == 100
+    page = table.fetch(40, 10)
+    assert [row[0] for row in page] == list(range(41, 51))
+    assert page[0][1:] == ("service40", "user40@example.com")
+
+    # Small scrolls reuse the rows already fetched; the result matches a fresh page
+    assert table.fetch(43, 10, (40, page)) == table.fetch(43, 10)
+    assert table.fetch(37, 10, (40, page)) == table.fetch(37, 10)
+    assert [row[0] for row in table.fetch(95, 10)] == list(range(96, 101))
+
+
+def test_list_source_keeps_only_matching_rows(app):
+    rows = [(1, "github", "a"), (2, "gitlab", "b"), (3, "bank", "c")]
+    source = app.ListRowSource(rows[:2], lambda row: row[1].startswith("git"))
+    assert source.add(rows[2]) is False and source.count() == 2
+    assert source.add((4, "gitea", "d")) is True
+    assert source.fetch(1, 2) == [(2, "gitlab", "b"), (4, "gitea", "d")]
+    assert source.replace((2, "bank", "b")) is False
+    assert source.remove(2) == 1 and source.position(4) == 1
+
+
+def test_view_renders_only_the_visible_window(app, table):
+    view, tree = make_view(app, table)
+    assert tree.shown() == list(range(1, 11))
+    assert view.scrollbar.position == (0.0, 0.1)
+
+    view.scroll_by(35)
+    assert tree.shown() == list(range(36, 46))
+    assert len(tree.items) == 10
+    view.on_scroll("moveto", "0.995")
+    assert tree.shown() == list(range(91, 101))
+    assert view.scrollbar.position == (0.9, 1.0)
+
+
+def test_selection_follows_the_entry_while_scrolling(app, table):
+    view, tree = make_view(app, table)
+    view.move_selection(1)
+    view.move_selection(12)
+    # The selection moved past the window, which scrolled to keep it in view
+    assert view.selected_id == 13 and tree.shown()[-1] == 13
+
+    view.scroll_by(20)
+    assert tree.selection() == ()
+    view.scroll_by(-20)
+    assert tree.values[tree.selection()[0]][0] == 13
+
+
+def delete_entry(table, view, entry_id):
+    """Delete an entry the way the GUI does: from the database, then from the view"""
+    table.conn.execute("DELETE FROM passwords WHERE id = ?", (entry_id,))
+    view.apply_delete(entry_id)
+
+
+def test_delete_pulls_in_the_next_row(app, table):
+    view, tree = make_view(app, table)
+    delete_entry(table, view, 5)
+    assert tree.shown() == [1, 2, 3, 4, 6, 7, 8, 9, 10, 11]
+    assert tree.shown() == [row[0] for row in table.fetch(0, 10)]
+
+
+def test_delete_at_the_end_slides_the_window_up(app, table):
+    view, tree = make_view(app, table)
+    view.scroll_to(90)
+    delete_entry(table, view, 95)
+    assert tree.shown() == [90, 91, 92, 93, 94, 96, 97, 98, 99, 100]
+    assert view.offset == 89
+
+
+def test_delete_above_the_window_keeps_the_same_rows_on_screen(app, table):
+    view, tree = make_view(app, table)
+    view.scroll_to(40)
+    delete_entry(table, view, 3)
+    assert tree.shown() == list(range(41, 51))
+    assert view.offset == 39
+    view.scroll_by(1)
+    assert tree.shown() == list(range(42, 52))
+
+
+def test_edits_update_one_row_or_leave_a_filtered_list(app):
+    source = app.ListRowSource([(i, f"git{i}", "a") for i in range(1, 6)], lambda row: row[1].startswith("git"))
+    view, tree = make_view(app, source)
+
+    view.apply_update((3, "git renamed", "b"))
+    assert tree.values[tree.items[2]] == (3, "git renamed", "b")
+    view.apply_update((2, "bank", "a"))
+    assert tree.shown() == [1, 3, 4, 5]
+
+    # New rows appear at the end only if they belong in the list
+    view.apply_insert((6, "gitea", "c"))
+    view.apply_insert((7, "shop", "c"))
+    assert tree.shown() == [1, 3, 4, 5, 6]
+    assert view.scrollbar.position == (0.0, 1.0)
@@ -0,0 +1,134 @@
+"""Behaviour tests for searching the vault in SQLite and the debounced search controller"""
+import sqlite3
+import time
+
+import pytest
+
+
+@pytest.fixture
+def search_vault(app, vault_key, tmp_path):
+    """A vault with a few named entries among many unrelated ones; returns its path"""
+    db_path = str(tmp_path / "passwords.db")
+    with app.VaultStore(vault_key, db_path) as store:
+        store.put_many([(f"service{i}", f"user{i}@example.com", "pw") for i in range(300)])
+        store.put_many([
+            ("GitLab", "ops@github.com", "a"),
+            ("GitHub", "dev@example.com", "b"),
+            ("GitHub Work", "work@example.com", "c"),
+        ])
+    return db_path
+
+
+def test_search_decrypts_only_candidate_rows(app, vault_key, search_vault, monkeypatch):
+    cipher = app.VaultCipher(vault_key)
+    decrypted = []
+    entry = cipher.entry
+    monkeypatch.setattr(cipher, "entry", lambda row: decrypted.append(row[0]) or entry(row))
+
+    conn = app.open_database(search_vault)
+    try:
+        index = app.SearchIndex(conn, cipher)
+        assert [service for _, service, _ in index.search("GIT work")] == ["GitHub Work"]
+        # The index narrowed the candidates before anything was decrypted
+        assert len(decrypted) == 1
+        assert index.search("nothing") == []
+        assert index.search("  ") is None
+    finally:
+        conn.close()
+
+
+def test_search_stops_once_cancelled(app, vault_key, search_vault):
+    conn = app.open_database(search_vault)
+    try:
+        index = app.SearchIndex(conn, app.VaultCipher(vault_key))
+        with pytest.raises(sqlite3.OperationalError):
+            index.search("service", lambda: True)
+        assert len(index.search("service", lambda: False)) == 300
+    finally:
+        conn.close()
+
+
+class FakeRoot:
+    """Just enough of a Tk root for SearchController: timers run when the test fires them"""
+
+    def __init__(self):
+        self.timers = {}
+        self.next_id = 0
+
+    def after(self, ms, callback):
+        self.next_id += 1
+        self.timers[self.next_id] = callback
+        return self.next_id
+
+    def after_cancel(self, timer):
+        self.timers.pop(timer, None)
+
+    def run(self):
+        """Fire timers, waiting for the worker, until nothing is scheduled"""
+        while self.timers:
+            timer = min(self.timers)
+            self.timers.pop(timer)()
+            if self.timers:
+                time.sleep(0.005)
+
+
+@pytest.fixture
+def controller(app, vault_key, search_vault):
+    """A SearchController whose results are appended to controller.shown and
+    whose requests to the worker are appended to controller.queried"""
+    shown = []
+    root = FakeRoot()
+    controller = app.SearchController(root, search_vault, app.VaultCipher(vault_key), shown.append)
+    controller.shown = shown
+    controller.queried = []
+    put = controller.requests.put
+    controller.requests.put = lambda request: (controller.queried.append(request and request[1]), put(request))
+    controller.search = lambda term: (controller.schedule(term), root.run())
+    yield controller
+    controller.close()
+
+
+def services(rows):
+    return [service for _, service, _ in rows]
+
+
+def test_only_the_last_of_quick_keystrokes_is_searched(controller):
+    for term in ("g", "gi", "git", "gith"):
+        controller.schedule(term)
+    controller.search("github")
+    assert [services(rows) for rows in controller.shown] == [["GitHub", "GitHub Work", "GitLab"]]
+    assert controller.queried == ["github"]
+
+
+def test_narrowed_results_are_ranked_like_a_fresh_search(app, controller, vault_key, search_vault):
+    controller.search("git")
+    assert services(controller.shown[-1]) == ["GitLab", "GitHub", "GitHub Work"]
+
+    # "gith" extends "git", so it is answered from the last results; GitLab now
+    # only matches through its email and drops behind the GitHub entries
+    controller.search("gith")
+    conn = app.open_database(search_vault)
+    try:
+        fresh = app.SearchIndex(conn, app.VaultCipher(vault_key)).search("gith")
+    finally:
+        conn.close()
+    assert controller.queried == ["git"]
+    assert controller.shown[-1] == fresh
+    assert services(fresh) == ["GitHub", "GitHub Work", "GitLab"]
+
+
+def test_repeated_terms_come_from_the_cache(controller):
+    controller.search("service1")
+    controller.search("GitHub")
+    controller.search("  SERVICE1 ")
+    assert controller.queried == ["service1", "GitHub"]
+    assert controller.shown[-1] == controller.shown[0]
+
+    # After the vault changes the term is looked up again
+    controller.invalidate()
+    controller.search("service1")
+    assert controller.queried == ["service1", "GitHub", "service1"]
+    assert controller.shown[-1] == controller.shown[0]
+
+    controller.search("")
+    assert controller.shown[-1] is None
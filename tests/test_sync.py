@@ -0,0 +1,104 @@
+"""Behaviour tests for syncing copies of a vault through their change logs"""
+import shutil
+
+import pytest
+
+from conftest import make_vault, read_vault
+
+
+def rotate(app, old_key, db_path):
+    """Re-encrypt a vault under a new key the way --rotate-key does; returns the new key"""
+    new_key = app.Fernet.generate_key()
+    conn = app.open_database(db_path)
+    try:
+        assert app.RekeyEngine(conn, old_key, new_key, workers=1).run() == []
+        app.RekeyEngine.clear_checkpoint(conn)
+    finally:
+        conn.close()
+    return new_key
+
+
+@pytest.mark.parametrize("direction", ["a_from_b", "b_from_a"])
+def test_diverged_copies_converge(app, vault_key, tmp_path, direction):
+    a_path = str(tmp_path / "a.db")
+    b_path = str(tmp_path / "b.db")
+    make_vault(app, vault_key, a_path, 20)
+    shutil.copy(a_path, b_path)
+
+    with app.VaultStore(vault_key, a_path) as store:
+        store.put_many([("service1", "user1@example.com", "changed in a"), ("only-a", "a@example.com", "pa")])
+        store.delete_many([store.lookup(term="service3")[0]])
+    with app.VaultStore(vault_key, b_path) as store:
+        store.put_many([("service2", "user2@example.com", "changed in b"), ("only-b", "b@example.com", "pb")])
+        store.delete_many([store.lookup(term="service5")[0]])
+
+    local, other = (a_path, b_path) if direction == "a_from_b" else (b_path, a_path)
+    with app.VaultStore(vault_key, local) as store:
+        stats = store.sync(other)
+    assert stats["received"] and stats["sent"]
+
+    merged = read_vault(app, vault_key, a_path)
+    assert merged == read_vault(app, vault_key, b_path)
+    passwords = {(service, email): password for service, email, password in merged}
+    assert passwords["service1", "user1@example.com"] == "changed in a"
+    assert passwords["service2", "user2@example.com"] == "changed in b"
+    assert passwords["only-a", "a@example.com"] == "pa"
+    assert passwords["only-b", "b@example.com"] == "pb"
+    assert ("service3", "user3@example.com") not in passwords
+    assert ("service5", "user5@example.com") not in passwords
+    assert len(merged) == 20
+
+    # Nothing left to exchange once both copies agree
+    with app.VaultStore(vault_key, other) as store:
+        assert store.sync(local) == {"received": 0, "sent": 0}
+
+
+def test_sync_rejects_copy_with_another_key(app, vault_key, tmp_path):
+    a_path = str(tmp_path / "a.db")
+    b_path = str(tmp_path / "b.db")
+    make_vault(app, vault_key, a_path, 5)
+    make_vault(app, app.Fernet.generate_key(), b_path, 5)
+    with app.VaultStore(vault_key, a_path) as store:
+        with pytest.raises(ValueError, match="different vault key.*key rotated"):
+            store.sync(b_path)
+
+
+@pytest.mark.parametrize("synced_before", [False, True])
+def test_sync_refuses_copies_from_before_a_rotation(app, vault_key, tmp_path, synced_before):
+    a_path = str(tmp_path / "a.db")
+    b_path = str(tmp_path / "b.db")
+    make_vault(app, vault_key, a_path, 10)
+    shutil.copy(a_path, b_path)
+    if synced_before:
+        with app.VaultStore(vault_key, a_path) as store:
+            store.sync(b_path)
+
+    # Only the rotated copy changes, so nothing needs to be received and its rows would go straight across
+    new_key = rotate(app, vault_key, a_path)
+    with app.VaultStore(new_key, a_path) as store:
+        store.put_many([("after rotation", "a@example.com", "pa")])
+    before = read_vault(app, vault_key, b_path)
+
+    # Neither side may take rows it cannot decrypt, whichever vault runs the sync
+    with app.VaultStore(new_key, a_path) as store:
+        with pytest.raises(ValueError, match="key rotated"):
+            store.sync(b_path)
+    with app.VaultStore(vault_key, b_path) as store:
+        with pytest.raises(ValueError, match="key rotated"):
+            store.sync(a_path)
+    assert read_vault(app, vault_key, b_path) == before
+    assert len(read_vault(app, new_key, a_path)) == 11
+
+
+def test_fresh_copy_after_rotation_syncs(app, vault_key, tmp_path):
+    a_path = str(tmp_path / "a.db")
+    b_path = str(tmp_path / "b.db")
+    make_vault(app, vault_key, a_path, 10)
+    new_key = rotate(app, vault_key, a_path)
+    shutil.copy(a_path, b_path)
+
+    with app.VaultStore(new_key, b_path) as store:
+        store.put_many([("new in b", "b@example.com", "pb")])
+    with app.VaultStore(new_key, a_path) as store:
+        assert store.sync(b_path) == {"received": 1, "sent": 0}
+    assert read_vault(app, new_key, a_path) == read_vault(app, new_key, b_path)
@@ -0,0 +1,51 @@
+"""Behaviour tests for upgrading vaults from older versions to the wrapped vault key"""
+import base64
+import os
+import sqlite3
+
+import pytest
+
+from conftest import MASTER_PASSWORD, read_vault
+
+
+def test_legacy_vault_upgrades_to_wrapped_key_and_records(app, tmp_path):
+    config_path = str(tmp_path / ".password_manager_config")
+    db_path = str(tmp_path / "passwords.db")
+
+    # Legacy layout: salt[16] + the password-derived key, entries as Fernet TEXT tokens
+    salt = os.urandom(16)
+    legacy_key = base64.urlsafe_b64encode(app.derive_key_bytes(MASTER_PASSWORD, salt, app.LEGACY_KDF_PARAMS))
+    with open(config_path, "wb") as f:
+        f.write(salt + legacy_key)
+    fernet = app.Fernet(legacy_key)
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE passwords (id INTEGER PRIMARY KEY, service_name TEXT NOT NULL, "
+                 "email TEXT NOT NULL, encrypted_password TEXT NOT NULL)")
+    conn.executemany("INSERT INTO passwords (service_name, email, encrypted_password) VALUES (?, ?, ?)",
+                     [(f"service{i}", f"user{i}@example.com", fernet.encrypt(f"password{i}".encode()).decode())
+                      for i in range(25)])
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(app.IncorrectPasswordError):
+        app.unlock_vault_key("wrong password", config_path)
+
+    key = app.unlock_vault_key(MASTER_PASSWORD, config_path)
+    assert key == legacy_key
+    config = app.load_config(config_path)
+    assert config["version"] == app.CONFIG_VERSION
+    assert "wrapped_key" in config
+    assert app.unlock_vault_key(MASTER_PASSWORD, config_path) == legacy_key
+
+    with app.VaultStore(key, db_path) as store:
+        assert store.upgrade_records() == []
+        assert store.upgrade_metadata() == []
+        assert not app.RecordMigration.needed(store.conn)
+        types = {row[0] for row in store.conn.execute("SELECT typeof(encrypted_password) FROM passwords")}
+        assert types == {"blob"}
+        plaintext = store.conn.execute("SELECT COUNT(*) FROM passwords WHERE service_name != ''").fetchone()[0]
+        assert plaintext == 0
+        assert store.search("service7")
+
+    assert read_vault(app, key, db_path) == sorted(
+        (f"service{i}", f"user{i}@example.com", f"password{i}") for i in range(25))